@@ -0,0 +1,181 @@
+"""
+API REST local do RecomendaIAgro.
+
+Carrega os dados uma única vez (utils/service.RecommendationService) e
+serve as consultas por cliente usadas pelo painel. Execução:
+
+    python api.py                      # 0.0.0.0:8000
+    uvicorn api:app --port 8000        # equivalente, com as opções do uvicorn
+
+O painel passa a consultar a API quando RECOMENDAIAGRO_API_URL está
+definida (ex.: http://localhost:8000), sem carregar os dados no processo
+do Streamlit.
+
+O servidor é assíncrono (ASGI/uvicorn); as rotas são funções comuns, que o
+FastAPI executa no pool de threads para não bloquear o loop com o pandas.
+Com RECOMENDAIAGRO_DEBUG=1, cada requisição é uma execução da
+instrumentação (utils/instrumentation): uma linha JSON com as etapas por
+requisição e os totais em /metrics.
+"""
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from utils import instrumentation
+from utils.service import MESES_PADRAO, RecommendationService
+from utils.similarity import VIZINHOS_PADRAO
+
+servico = None
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    global servico
+    servico = RecommendationService.load(compacto=os.environ.get('RECOMENDAIAGRO_COMPACTO') == '1')
+    servico.metrics_table()  # Aquece a tabela de métricas antes da primeira requisição
+    servico.start_watcher()  # Recarga de regras/recomendações em segundo plano
+    yield
+    servico.stop_watcher()
+
+
+app = FastAPI(title='RecomendaIAgro API', lifespan=ciclo_de_vida)
+
+
+@app.middleware('http')
+async def instrumentar(request, call_next):
+    # Uma execução da instrumentação por requisição (RECOMENDAIAGRO_DEBUG=1): as
+    # etapas medidas na thread da rota entram nela, e finish_run emite a linha JSON
+    instrumentation.start_run(f'{request.method} {request.url.path}')
+    try:
+        return await call_next(request)
+    finally:
+        instrumentation.finish_run()
+
+# =============================================================================
+# SERIALIZAÇÃO
+# =============================================================================
+
+def _registros(df):
+    """DataFrame -> lista de dicts JSON (NaN vira null, datas em ISO)."""
+    return json.loads(df.to_json(orient='records', date_format='iso', force_ascii=False))
+
+
+def _valor(valor):
+    """Escalares numpy/NaN -> tipos JSON."""
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    return valor
+
+
+def _cliente_ou_404(user_id):
+    cliente = servico.customer(user_id)
+    if cliente is None:
+        raise HTTPException(status_code=404, detail=f'Cliente não encontrado: {user_id}')
+    return cliente
+
+# =============================================================================
+# ROTAS
+# =============================================================================
+
+@app.get('/health')
+def health():
+    return {
+        'status': 'ok',
+        'clientes': len(servico.diretorio['ids']),
+        'particoes_historico': len(servico.store.particoes),
+        'poda_historico': servico.store.estatisticas,
+        'cache': servico.cache.stats(),
+        # Contadores e atraso máximo entre a gravação dos CSVs e as consultas ('atraso_maximo_s')
+        'recargas': servico.recargas,
+        # Só depois da primeira consulta de similares
+        'similaridade': servico.similaridade['estatisticas'] if servico.similaridade is not None else None,
+    }
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def prometheus():
+    # Totais da instrumentação (RECOMENDAIAGRO_DEBUG=1), formato texto do Prometheus
+    return instrumentation.prometheus_text()
+
+
+@app.get('/customers')
+def customers(busca: str = '', pagina: int = Query(0, ge=0), por_pagina: int = Query(50, ge=1, le=500)):
+    clientes, total = servico.search_customers(busca, pagina, por_pagina)
+    return {'total': total, 'pagina': pagina, 'clientes': clientes}
+
+
+@app.get('/customers/{user_id}')
+def customer(user_id: str):
+    return {chave: _valor(valor) for chave, valor in _cliente_ou_404(user_id).items()}
+
+
+@app.get('/customers/{user_id}/history')
+def history(user_id: str, meses: int = Query(MESES_PADRAO, ge=1)):
+    _cliente_ou_404(user_id)
+    return {'user_id': user_id, 'meses': meses, 'historico': _registros(servico.history(user_id, meses))}
+
+
+@app.get('/customers/{user_id}/recommendations')
+def recommendations(user_id: str, top_n: int = Query(3, ge=1, le=50)):
+    _cliente_ou_404(user_id)
+    return {'user_id': user_id, 'recomendacoes': _registros(servico.recommendations(user_id, top_n))}
+
+
+@app.get('/customers/{user_id}/metrics')
+def metrics(user_id: str):
+    _cliente_ou_404(user_id)
+    metricas, abc, evolucao = servico.metrics(user_id)
+    return {
+        'user_id': user_id,
+        'metrics': {chave: _valor(valor) for chave, valor in metricas.items()},
+        'abc': _registros(abc),
+        'evolucao': _registros(evolucao),
+    }
+
+
+@app.get('/customers/{user_id}/similar')
+def similar(user_id: str, k: int = Query(VIZINHOS_PADRAO, ge=1, le=200)):
+    _cliente_ou_404(user_id)
+    similares = servico.similar_customers(user_id, k)
+    if similares is None:
+        raise HTTPException(status_code=404, detail=f'Cliente sem dados de similaridade: {user_id}')
+    return {
+        'user_id': user_id,
+        'total': similares['total'],
+        'vizinhos': _registros(similares['vizinhos']),
+        'itens': _registros(similares['itens']),
+    }
+
+
+@app.get('/portfolio')
+def portfolio(cluster: Optional[List[str]] = Query(None), uf: Optional[List[str]] = Query(None),
+              regiao: Optional[List[str]] = Query(None), safra_principal: Optional[List[str]] = Query(None),
+              pagina: int = Query(0, ge=0), por_pagina: int = Query(50, ge=1, le=500)):
+    filtros = {'cluster': cluster, 'uf': uf, 'regiao': regiao, 'safra_principal': safra_principal}
+    carteira, total = servico.portfolio(filtros, pagina, por_pagina)
+    return {'total': total, 'pagina': pagina, 'carteira': _registros(carteira)}
+
+
+@app.get('/portfolio/filters')
+def portfolio_filters():
+    return servico.portfolio_filters()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.environ.get('RECOMENDAIAGRO_API_HOST', '0.0.0.0'),
+        port=int(os.environ.get('RECOMENDAIAGRO_API_PORT', '8000')),
+    )
@@ -1,4 +1,7 @@
-from utils import data_loader as dl
+from utils import api_client
+from utils import instrumentation
+from utils import service
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -86,83 +89,178 @@ st.markdown("""
 # FUNÇÕES AUXILIARES
 # =============================================================================
 
-@st.cache_data
-def load_data():
-    # Carregar dados reais
-    clientes, historico, recomendacoes, produtos, rules = dl.load_real_data()
-    
-    # Enriquecer dados de clientes
-    clientes = dl.enrich_customer_data(clientes)
-    
-    # Merge recomendações com produtos para ter descrição
-    recomendacoes = recomendacoes.merge(
-        produtos[['item_id', 'item_desc', 'item_class']], 
-        left_on='rec_id', 
-        right_on='item_id', 
-        how='left'
-    )
-    
-    return clientes, historico, recomendacoes, rules
-
-def calcular_abc(historico):
-    """Calcula curva ABC de categorias"""
-    abc = historico.groupby('categoria')['valor'].sum().sort_values(ascending=False)
-    abc_percent = (abc / abc.sum() * 100).cumsum()
-    
-    curva = []
-    for idx, val in enumerate(abc_percent):
-        if val <= 80:
-            curva.append('A')
-        elif val <= 95:
-            curva.append('B')
-        else:
-            curva.append('C')
-    
-    return pd.DataFrame({
-        'categoria': abc.index,
-        'valor': abc.values,
-        'curva': curva
-    })
+# Tempos por etapa/seção (RECOMENDAIAGRO_DEBUG=1 liga o painel de depuração)
+instrumentation.start_run()
+
+# Modo compacto (opt-in) para históricos grandes: RECOMENDAIAGRO_COMPACTO=1
+MODO_COMPACTO = os.environ.get('RECOMENDAIAGRO_COMPACTO') == '1'
+
+# Com RECOMENDAIAGRO_API_URL (ex.: http://localhost:8000) o painel consulta a
+# API REST (api.py) em vez de carregar os dados no processo do Streamlit
+API_URL = os.environ.get('RECOMENDAIAGRO_API_URL')
+
+@st.cache_resource
+def load_service(compacto=False, api_url=None):
+    # Uma única instância por processo, compartilhada entre as sessões
+    if api_url:
+        return api_client.RecommendationClient(api_url)
+    servico = service.RecommendationService.load(compacto=compacto)
+    # Recarrega regras/recomendações em segundo plano quando os CSVs mudam
+    servico.start_watcher()
+    return servico
+
+def memo_do_cliente(user_id):
+    # Estado do cliente atual na sessão. Trocar de cliente descarta os
+    # resultados e as seções abertas do anterior; recarregar os dados, só os
+    # resultados
+    versao = getattr(servico, 'versao', None)
+    memo = st.session_state.setdefault('memo_cliente', {'user_id': None, 'versao': None, 'valores': {},
+                                                        'abertas': set()})
+    if memo['user_id'] != user_id:
+        memo['user_id'] = user_id
+        memo['abertas'] = set()
+        memo['valores'] = {}
+    if memo['versao'] != versao:
+        memo['versao'] = versao
+        memo['valores'] = {}
+    return memo
+
+def dados_do_cliente(user_id, chave, calcular):
+    # Resultados do cliente atual guardados na sessão: cliques em botões (que
+    # refazem o script) não repetem as consultas
+    valores = memo_do_cliente(user_id)['valores']
+    if chave not in valores:
+        valores[chave] = calcular()
+    return valores[chave]
+
+def secao_aberta(user_id, chave, rotulo):
+    # Seção calculada só depois do clique em 'rotulo' (st.expander e st.tabs
+    # executam o conteúdo mesmo fechados); fica aberta até trocar de cliente
+    abertas = memo_do_cliente(user_id)['abertas']
+    if chave not in abertas and st.button(rotulo, key=f"abrir_{chave}"):
+        abertas.add(chave)
+    return chave in abertas
 
 # =============================================================================
 # CARREGAMENTO DOS DADOS
 # =============================================================================
 
-clientes_df, historico_df, recomendacoes_df, rules_df = load_data()
+instrumentation.section('Carregamento')
+servico = load_service(MODO_COMPACTO, API_URL)
+
+# =============================================================================
+# VISÃO DA CARTEIRA (PRÓXIMA MELHOR AÇÃO)
+# =============================================================================
+#
+# Todos os clientes ranqueados de uma vez (força da recomendação, recência e
+# valor), calculados em uma passada pelo serviço; a tela recebe só a página
+# visível da seleção filtrada.
+
+VISAO_CLIENTE = "👤 Cliente"
+VISAO_CARTEIRA = "📋 Carteira"
+CARTEIRA_POR_PAGINA = 50
+FILTROS_CARTEIRA = {
+    'cluster': "Classificação",
+    'uf': "UF",
+    'regiao': "Região",
+    'safra_principal': "Safra principal",
+}
+
+visao = st.sidebar.radio("Visão:", [VISAO_CLIENTE, VISAO_CARTEIRA], horizontal=True, key="visao")
+
+if visao == VISAO_CARTEIRA:
+    instrumentation.section('Carteira')
+    st.markdown('<div class="main-header">🌾 RecomendaIAgro</div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-title">📋 Carteira - Próxima Melhor Ação</div>', unsafe_allow_html=True)
+
+    opcoes_filtros = servico.portfolio_filters()
+    colunas_filtros = st.columns(len(FILTROS_CARTEIRA))
+    filtros = {}
+    for coluna_tela, (coluna, rotulo) in zip(colunas_filtros, FILTROS_CARTEIRA.items()):
+        with coluna_tela:
+            filtros[coluna] = st.multiselect(rotulo, opcoes_filtros.get(coluna, []), key=f"filtro_{coluna}")
+
+    carteira, total_carteira = servico.portfolio(filtros, por_pagina=CARTEIRA_POR_PAGINA)
+    total_paginas_carteira = max(1, -(-total_carteira // CARTEIRA_POR_PAGINA))
+    if total_paginas_carteira > 1:
+        pagina_carteira = st.number_input(
+            f"Página (de {total_paginas_carteira}):", min_value=1, max_value=total_paginas_carteira,
+            value=1, step=1, key="pagina_carteira"
+        )
+        if pagina_carteira > 1:
+            carteira, _ = servico.portfolio(filtros, pagina=pagina_carteira - 1, por_pagina=CARTEIRA_POR_PAGINA)
+
+    st.caption(f"{total_carteira} cliente(s), da ação mais promissora para a menos promissora")
+    st.dataframe(
+        carteira[['pontuacao', 'nome', 'cidade', 'uf', 'cluster', 'safra_principal', 'rec_desc', 'lift',
+                  'confianca', 'dias_sem_compra', 'valor_total', 'categoria_top']]
+        .rename(columns={
+            'pontuacao': 'Pontuação',
+            'nome': 'Cliente',
+            'cidade': 'Cidade',
+            'uf': 'UF',
+            'cluster': 'Classificação',
+            'safra_principal': 'Safra',
+            'rec_desc': 'Melhor Recomendação',
+            'lift': 'Lift',
+            'confianca': 'Confiança',
+            'dias_sem_compra': 'Dias sem Compra',
+            'valor_total': 'Valor 6 meses (R$)',
+            'categoria_top': 'Categoria Top'
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.stop()
 
 # =============================================================================
 # SIDEBAR - SELEÇÃO DE CLIENTE
 # =============================================================================
 
+instrumentation.section('Sidebar')
 st.sidebar.image("placeholder_RecomendaIAgro.jpg", use_column_width=True)
 
 st.sidebar.markdown("### 🎯 Selecione o Cliente")
+
+# Busca por nome, documento ou cidade, com as opções paginadas
+CLIENTES_POR_PAGINA = 50
+busca_cliente = st.sidebar.text_input("Buscar (nome, documento ou cidade):")
+opcoes_clientes, total_encontrados = servico.search_customers(busca_cliente, por_pagina=CLIENTES_POR_PAGINA)
+total_paginas = max(1, -(-total_encontrados // CLIENTES_POR_PAGINA))
+if total_paginas > 1:
+    pagina = st.sidebar.number_input(
+        f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas, value=1, step=1
+    )
+    if pagina > 1:
+        opcoes_clientes, _ = servico.search_customers(
+            busca_cliente, pagina=pagina - 1, por_pagina=CLIENTES_POR_PAGINA
+        )
+
+if not opcoes_clientes:
+    st.sidebar.warning("Nenhum cliente encontrado.")
+    st.stop()
+
+st.sidebar.caption(f"{total_encontrados} cliente(s) encontrado(s)")
+nomes_clientes = {opcao['user_id']: opcao['nome'] for opcao in opcoes_clientes}
 cliente_selecionado = st.sidebar.selectbox(
     "Cliente:",
-    clientes_df['user_id'].tolist(),
-    format_func=lambda x: clientes_df[clientes_df['user_id'] == x]['nome'].values[0]
+    list(nomes_clientes),
+    format_func=nomes_clientes.get
 )
 
-# Filtrar dados do cliente selecionado
-
-cliente = clientes_df[clientes_df['user_id'] == cliente_selecionado].iloc[0]
-historico_cliente = dl.prepare_historico(historico_df, cliente_selecionado, meses=6)
-recs_cliente = dl.prepare_recommendations(
-    recomendacoes_df, 
-    rules_df,
-    cliente_selecionado, 
-    top_n=3
+# Só o cadastro e as métricas (tabela pré-calculada) entram na primeira
+# pintura; histórico, recomendações e gráficos são consultados na seção aberta
+cliente = dados_do_cliente(cliente_selecionado, 'cliente', lambda: servico.customer(cliente_selecionado))
+metrics, abc_df, df_evolucao = dados_do_cliente(
+    cliente_selecionado, 'metricas', lambda: servico.metrics(cliente_selecionado)
 )
-metrics = dl.calculate_commercial_metrics(historico_cliente)
-recs_cliente.drop_duplicates(subset=['item_desc'], inplace=True)
-recs_cliente.sort_values(by='lift', ascending=False, inplace=True)
 
 # Métricas sidebar
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📊 Resumo Rápido")
 st.sidebar.metric("Ticket Médio", f"R$ {metrics['ticket_medio']:,.2f}")
-st.sidebar.metric("Compras (6 meses)", len(historico_cliente))
-st.sidebar.metric("Total Investido", f"R$ {historico_cliente['valor'].sum():,.2f}")
+st.sidebar.metric("Compras (6 meses)", metrics['frequencia'])
+st.sidebar.metric("Total Investido", f"R$ {metrics['valor_total']:,.2f}")
 
 # =============================================================================
 # HEADER PRINCIPAL
@@ -175,6 +273,7 @@ st.markdown('<div class="sub-header">IA que fortalece a comunicação humana no
 # SEÇÃO 1: INFORMAÇÕES DO CLIENTE
 # =============================================================================
 
+instrumentation.section('Informações')
 st.markdown('<div class="section-title">👤 Informações do Cliente</div>', unsafe_allow_html=True)
 
 col1, col2, col3 = st.columns([2, 2, 1])
@@ -220,13 +319,14 @@ with col3:
 # SEÇÃO 2: PERFIL COMERCIAL
 # =============================================================================
 
+instrumentation.section('Perfil Comercial')
 st.markdown('<div class="section-title">💼 Perfil Comercial</div>', unsafe_allow_html=True)
 
-# Calcular métricas
-ticket_medio = historico_cliente['valor'].mean()
-frequencia = len(historico_cliente)
-valor_total = historico_cliente['valor'].sum()
-categoria_top = historico_cliente.groupby('categoria')['valor'].sum().idxmax()
+# Métricas pré-calculadas (tabela de métricas do serviço)
+ticket_medio = metrics['ticket_medio']
+frequencia = metrics['frequencia']
+valor_total = metrics['valor_total']
+categoria_top = metrics['categoria_top']
 
 # Métricas em cards
 col1, col2, col3, col4 = st.columns(4)
@@ -245,43 +345,11 @@ with col3:
 with col4:
     st.metric("⭐ Categoria Top", categoria_top)
 
-# Gráficos
-col1, col2 = st.columns(2)
-
-with col1:
-    # Evolução de compras
-    df_evolucao = historico_cliente.groupby('data')['valor'].sum().reset_index()
-    
-    fig_evolucao = px.line(
-        df_evolucao,
-        x='data', 
-        y='valor',
-        title='📈 Evolução de Compras (6 meses)',
-        labels={'valor': 'Valor (R$)', 'data': 'Mês'}
-    )
-    fig_evolucao.update_traces(line_color='#2E7D32', line_width=3)
-    fig_evolucao.update_layout(height=300)
-    st.plotly_chart(fig_evolucao, use_container_width=True)
-
-with col2:
-    # Curva ABC
-    abc_df = calcular_abc(historico_cliente)
-    fig_abc = px.bar(
-        abc_df,
-        x='categoria',
-        y='valor',
-        color='curva',
-        title='📊 Curva ABC - Categorias',
-        labels={'valor': 'Valor (R$)', 'categoria': 'Categoria'},
-        color_discrete_map={'A': '#2E7D32', 'B': '#FFA726', 'C': '#EF5350'}
-    )
-    fig_abc.update_layout(height=300)
-    st.plotly_chart(fig_abc, use_container_width=True)
-
 # =============================================================================
 # SEÇÃO 3: COMPORTAMENTO AGRONÔMICO
 # =============================================================================
 
+instrumentation.section('Comportamento Agronômico')
 st.markdown('<div class="section-title">🌾 Comportamento Agronômico</div>', unsafe_allow_html=True)
 
 col1, col2, col3, col4 = st.columns(4)
@@ -319,10 +387,22 @@ with col4:
     </div>
     """, unsafe_allow_html=True)
 
+# =============================================================================
+# SEÇÕES SOB DEMANDA
+# =============================================================================
+#
+# Todas as seções ficam na página. As recomendações são calculadas direto
+# (vêm depois das métricas, que já foram desenhadas); gráficos e histórico só
+# consultam o serviço e montam figuras/tabelas depois do clique em "Mostrar"
+# (secao_aberta), e os resultados ficam na sessão (dados_do_cliente).
+
+HISTORICO_POR_PAGINA = 50
+
 # =============================================================================
 # SEÇÃO 4: RECOMENDAÇÕES DA IA ⭐
 # =============================================================================
 
+instrumentation.section('Recomendações')
 st.markdown('<div class="section-title">🤖 Recomendações da IA (Algoritmo Apriori)</div>', unsafe_allow_html=True)
 
 st.markdown("""
@@ -334,9 +414,24 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+recs_cliente = dados_do_cliente(
+    cliente_selecionado, 'recomendacoes', lambda: servico.recommendations(cliente_selecionado, top_n=3)
+)
+# Contagens reais do índice de vizinhos (utils/similarity)
+similares = dados_do_cliente(
+    cliente_selecionado, 'similares', lambda: servico.similar_customers(cliente_selecionado)
+)
+total_similares = similares['total'] if similares is not None else 0
+compraram = (dict(zip(similares['itens']['item_id'], similares['itens']['clientes']))
+             if similares is not None else {})
 for idx, rec in recs_cliente.iterrows():
+    if total_similares > 0:
+        texto_similares = (f"{compraram.get(rec['rec_id'], 0):,} de {total_similares:,} clientes similares "
+                           f"compraram este produto")
+    else:
+        texto_similares = "Nenhum cliente similar encontrado para este cliente"
     col1, col2 = st.columns([3, 1])
-    
+
     with col1:
         st.markdown(f"""
         <div class="recommendation-card">
@@ -354,22 +449,91 @@ for idx, rec in recs_cliente.iterrows():
                 </div>
             </div>
             <div style='margin-top: 1rem; padding-top: 1rem; border-top: 1px solid rgba(255,255,255,0.3);'>
-                <small> 🎲 Baseado em padrões de {int(rec['confianca']*1000)} clientes similares</small>
+                <small> 👥 {texto_similares}</small>
             </div>
         </div>
         """, unsafe_allow_html=True)
-    
+
     with col2:
         if st.button(f"📋 Ver Detalhes", key=f"btn_{idx}"):
             st.info(f"Abrindo ficha técnica de {rec['rec_desc']}...")
 
+if total_similares > 0:
+    # O que os similares compram e o cliente ainda não comprou
+    novos = similares['itens'][~similares['itens']['comprado'].astype(bool)].head(5)
+    if len(novos) > 0:
+        st.markdown(f"**👥 Mais comprados pelos {total_similares:,} clientes similares (ainda não comprados):**")
+        st.dataframe(
+            novos.assign(participacao=(novos['participacao'] * 100).round(1))
+            [['item_desc', 'clientes', 'participacao']]
+            .rename(columns={'item_desc': 'Produto', 'clientes': 'Clientes similares',
+                             'participacao': '% dos similares'}),
+            use_container_width=True,
+            hide_index=True
+        )
+
+# =============================================================================
+# SEÇÃO 4B: EVOLUÇÃO E CURVA ABC
+# =============================================================================
+
+st.markdown('<div class="section-title">📈 Evolução e Curva ABC</div>', unsafe_allow_html=True)
+if secao_aberta(cliente_selecionado, 'graficos', "📈 Mostrar evolução e curva ABC"):
+    instrumentation.section('Gráficos')
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Evolução de compras
+        fig_evolucao = px.line(
+            df_evolucao,
+            x='data', 
+            y='valor',
+            title='📈 Evolução de Compras (6 meses)',
+            labels={'valor': 'Valor (R$)', 'data': 'Mês'}
+        )
+        fig_evolucao.update_traces(line_color='#2E7D32', line_width=3)
+        fig_evolucao.update_layout(height=300)
+        st.plotly_chart(fig_evolucao, use_container_width=True)
+
+    with col2:
+        # Curva ABC
+        fig_abc = px.bar(
+            abc_df,
+            x='categoria',
+            y='valor',
+            color='curva',
+            title='📊 Curva ABC - Categorias',
+            labels={'valor': 'Valor (R$)', 'categoria': 'Categoria'},
+            color_discrete_map={'A': '#2E7D32', 'B': '#FFA726', 'C': '#EF5350'}
+        )
+        fig_abc.update_layout(height=300)
+        st.plotly_chart(fig_abc, use_container_width=True)
+
 # =============================================================================
 # SEÇÃO 5: HISTÓRICO DETALHADO
 # =============================================================================
 
-with st.expander("📜 Ver Histórico Completo de Compras", expanded=False):
+st.markdown('<div class="section-title">📜 Histórico de Compras</div>', unsafe_allow_html=True)
+if secao_aberta(cliente_selecionado, 'historico', "📜 Mostrar histórico de compras"):
+    instrumentation.section('Histórico')
+
+    historico_cliente = dados_do_cliente(
+        cliente_selecionado, 'historico', lambda: servico.history(cliente_selecionado, meses=6)
+    )
+    # Tabela paginada: só a página visível é enviada ao navegador
+    total_paginas_historico = max(1, -(-len(historico_cliente) // HISTORICO_POR_PAGINA))
+    pagina_historico = 1
+    if total_paginas_historico > 1:
+        pagina_historico = st.number_input(
+            f"Página (de {total_paginas_historico}):", min_value=1, max_value=total_paginas_historico,
+            value=1, step=1, key=f"pagina_historico_{cliente_selecionado}"
+        )
+    inicio_pagina = (pagina_historico - 1) * HISTORICO_POR_PAGINA
+    st.caption(f"{len(historico_cliente)} compra(s) nos últimos 6 meses")
     st.dataframe(
-        historico_cliente[['data', 'item_desc', 'categoria', 'valor']].rename(columns={
+        historico_cliente[['data', 'item_desc', 'categoria', 'valor']]
+        .iloc[inicio_pagina:inicio_pagina + HISTORICO_POR_PAGINA]
+        .rename(columns={
             'data': 'Data',
             'item_desc': 'Produto',
             'categoria': 'Categoria',
@@ -383,6 +547,7 @@ with st.expander("📜 Ver Histórico Completo de Compras", expanded=False):
 # SEÇÃO 6: PRÓXIMAS AÇÕES
 # =============================================================================
 
+instrumentation.section('Próximas Ações')
 st.markdown('<div class="section-title">🎯 Próximas Ações</div>', unsafe_allow_html=True)
 
 col1, col2, col3 = st.columns(3)
@@ -399,8 +564,11 @@ with col2:
 
 with col3:
     if st.button("📅 Agendar Visita", use_container_width=True):
+        st.session_state['agenda_aberta'] = cliente_selecionado
         st.success("📅 Abrindo agenda...")
-        
+
+    # O formulário continua aberto nas execuções seguintes (envio do formulário)
+    if st.session_state.get('agenda_aberta') == cliente_selecionado:
         # Mini formulário de agendamento
         with st.form("agendar_visita"):
             data_visita = st.date_input("Data da visita")
@@ -409,16 +577,52 @@ with col3:
             
             submitted = st.form_submit_button("✅ Confirmar Agendamento")
             if submitted:
+                st.session_state['agenda_aberta'] = None
                 st.success(f"✅ Visita agendada para {data_visita} às {hora_visita}!")
 
 # =============================================================================
 # FOOTER
 # =============================================================================
 
+instrumentation.section('Footer')
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #666; padding: 1rem;'>
     <p><strong>RecomendaIAgro</strong> - IA que fortalece a comunicação humana no agronegócio</p>
     <p style='font-size: 0.9rem;'>Powered by Machine Learning | Algoritmo Apriori | Versão 1.0</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# =============================================================================
+# DEPURAÇÃO (RECOMENDAIAGRO_DEBUG=1)
+# =============================================================================
+
+registros_execucao = instrumentation.finish_run()
+if instrumentation.ATIVO:
+    with st.sidebar.expander("🛠️ Depuração: tempos desta execução", expanded=False):
+        df_registros = pd.DataFrame(registros_execucao, columns=['tipo', 'etapa', 'ms', 'linhas', 'nivel'])
+        st.metric("Total da execução", f"{df_registros.loc[df_registros['tipo'] == 'secao', 'ms'].sum():,.1f} ms")
+        st.dataframe(
+            df_registros.assign(etapa=['  ' * n + e for n, e in zip(df_registros['nivel'], df_registros['etapa'])])
+            [['tipo', 'etapa', 'ms', 'linhas']].round({'ms': 2}),
+            use_container_width=True,
+            hide_index=True
+        )
+        if hasattr(servico, 'store'):
+            # Poda do histórico particionado (modo local; na API, em /health)
+            st.caption(f"Histórico: {len(servico.store.particoes)} partições mensais")
+            st.json(servico.store.estatisticas, expanded=False)
+            # Cache de resultados por cliente, compartilhado pelas sessões
+            st.caption("Cache por cliente")
+            st.json(servico.cache.stats(), expanded=False)
+            st.caption("Recarga a quente")
+            st.json(servico.recargas, expanded=False)
+            if servico.similaridade is not None:
+                st.caption("Índice de clientes similares")
+                st.json(servico.similaridade['estatisticas'], expanded=False)
+        st.download_button(
+            "⬇️ Totais (Prometheus)",
+            instrumentation.prometheus_text(),
+            file_name="recomendaiagro_metricas.prom",
+            mime="text/plain"
+        )
@@ -0,0 +1,59 @@
+"""
+Benchmark da pontuação em lote (utils/batch_scoring.score_users) com
+diferentes números de processos.
+
+As cestas reais são replicadas com novos user_id/basket_id (FATOR cópias)
+para simular uma base maior; as regras são mineradas uma vez sobre a base
+original. Confere também que a saída é a mesma para todos os números de
+processos.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_batch_scoring.py [FATOR]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import batch_scoring, rule_mining
+
+FATOR = 200
+PROCESSOS = [1, 2, 4, 8]
+
+
+def replicar(cestas, clientes, fator):
+    copias_cestas, copias_clientes = [], []
+    for i in range(fator):
+        copia = cestas.copy()
+        copia['user_id'] = copia['user_id'] + f'_r{i}'
+        copia['basket_id'] = copia['basket_id'].astype(str) + f'_r{i}'
+        copias_cestas.append(copia)
+        copias_clientes.append(clientes['user_id'] + f'_r{i}')
+    return pd.concat(copias_cestas, ignore_index=True), pd.concat(copias_clientes, ignore_index=True)
+
+
+def main():
+    fator = int(sys.argv[1]) if len(sys.argv) > 1 else FATOR
+    cestas, clientes, _ = batch_scoring.load_sources()
+    rules = rule_mining.compute_association_rules(cestas, min_support=0.01, top=30, caminho_saida=None)
+    fallback = batch_scoring.top_revenue_products(cestas)
+
+    base, user_ids = replicar(cestas, clientes, fator)
+    print(f"{len(base):,} linhas, {len(user_ids):,} clientes, {os.cpu_count()} núcleos")
+    print(f"{'processos':>10} {'segundos':>10}")
+
+    referencia = None
+    for workers in PROCESSOS:
+        inicio = time.perf_counter()
+        saida = batch_scoring.score_users(base, rules, user_ids, fallback, workers=workers)
+        print(f"{workers:>10} {time.perf_counter() - inicio:>10.3f}")
+        if referencia is None:
+            referencia = saida
+        else:
+            pd.testing.assert_frame_equal(saida, referencia)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Mineração incremental x remineração completa.
+
+Conta o histórico até o penúltimo mês (replicado FATOR vezes, para simular
+anos de cestas) como carga inicial e aplica o último mês em lotes diários.
+Confere se as regras derivadas das contagens somadas são idênticas às de
+compute_association_rules (mesmo max_len) sobre as mesmas cestas e compara
+o tempo de cada atualização diária com o de uma remineração. A equivalência
+também é coberta por tests/test_rule_mining.py.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_incremental_mining.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import rule_mining
+
+MIN_SUPPORT = 0.005
+TOP = 500
+FATOR = 20
+MAX_LEN = rule_mining.MAX_LEN_CONTAGENS
+
+
+def comparar(incremental, completo):
+    chave = ['antecedents', 'consequents']
+    a = incremental.sort_values(chave, key=lambda s: s.map(sorted).map(tuple)).reset_index(drop=True)
+    b = completo.sort_values(chave, key=lambda s: s.map(sorted).map(tuple)).reset_index(drop=True)
+    pd.testing.assert_frame_equal(a, b, check_exact=False, rtol=1e-12)
+
+
+def main():
+    cestas = pd.read_csv('bases/cestas.csv')
+    datas = pd.to_datetime(cestas['timestamp'])
+    ultimo_mes = datas.dt.to_period('M') == datas.max().to_period('M')
+    historico, novas = cestas[~ultimo_mes], cestas[ultimo_mes]
+    historico = pd.concat(
+        [historico.assign(basket_id=historico['basket_id'] + f'_r{i}') for i in range(FATOR)],
+        ignore_index=True
+    )
+
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        rule_mining.update_itemset_counts(historico, pasta, MAX_LEN)
+        print(f"Carga inicial: {historico['basket_id'].nunique():,} cestas em {time.perf_counter() - inicio:.2f} s")
+
+        vistas = historico
+        dias = pd.to_datetime(novas['timestamp']).dt.date
+        for dia in sorted(dias.unique()):
+            lote = novas[dias == dia]
+            vistas = pd.concat([vistas, lote], ignore_index=True)
+
+            inicio = time.perf_counter()
+            incremental = rule_mining.compute_association_rules_incremental(
+                lote, MIN_SUPPORT, TOP, max_len=MAX_LEN, pasta=pasta, caminho_saida=None)
+            t_incremental = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            completo = rule_mining.compute_association_rules(vistas, MIN_SUPPORT, TOP, max_len=MAX_LEN,
+                                                            caminho_saida=None)
+            t_completo = time.perf_counter() - inicio
+
+            comparar(incremental, completo)
+            print(f"{dia}: {lote['basket_id'].nunique():>4} cestas novas, {len(incremental)} regras idênticas | "
+                  f"incremental {t_incremental * 1000:.0f} ms x completo {t_completo * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
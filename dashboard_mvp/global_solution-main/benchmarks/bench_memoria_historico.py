@@ -0,0 +1,35 @@
+"""
+Relatório de memória do histórico: modo padrão x modo compacto.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_memoria_historico.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import data_loader as dl
+
+
+def imprimir(titulo, relatorio):
+    print(f"\n{titulo}: {relatorio['linhas']:,} linhas, "
+          f"{relatorio['bytes_total'] / 1e6:.2f} MB, "
+          f"{relatorio['bytes_por_linha']:.1f} bytes/linha")
+    for coluna, total in relatorio['bytes_por_coluna'].items():
+        print(f"  {coluna:<12} {total / relatorio['linhas']:>8.1f} bytes/linha")
+
+
+def main():
+    _, historico, _, _, _, _ = dl.load_real_data()
+    _, compacto, _, _, _, _ = dl.load_real_data(compacto=True)
+
+    # Referência: histórico com strings em object, como antes da tipagem
+    original = historico.astype({'user_id': object, 'item_id': object, 'categoria': object, 'valor': 'float64'})
+
+    imprimir('Original (object)', dl.memory_report(original))
+    imprimir('Padrão (tipado)', dl.memory_report(historico))
+    imprimir('Compacto', dl.memory_report(compacto))
+
+
+if __name__ == '__main__':
+    main()
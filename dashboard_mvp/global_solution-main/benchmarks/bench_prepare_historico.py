@@ -0,0 +1,61 @@
+"""
+Benchmark do prepare_historico: varredura booleana x índice por cliente.
+
+O histórico real é replicado com novos user_id para simular bases maiores
+(mesmo volume por cliente, mais clientes). Com o índice, a latência por
+clique deve ficar estável enquanto a varredura cresce com a tabela.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_prepare_historico.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import data_loader as dl
+
+ESCALAS = [1, 10, 50, 200]
+CLIQUES = 200
+
+
+def replicar_historico(historico, fator):
+    """Replica o histórico 'fator' vezes, renomeando os clientes de cada cópia."""
+    copias = []
+    for i in range(fator):
+        copia = historico.copy()
+        copia['user_id'] = copia['user_id'].astype(str) + f'_r{i}'
+        copias.append(copia)
+    return pd.concat(copias, ignore_index=True)
+
+
+def medir(funcao, usuarios):
+    inicio = time.perf_counter()
+    for user_id in usuarios:
+        funcao(user_id)
+    return (time.perf_counter() - inicio) / len(usuarios) * 1000
+
+
+def main():
+    _, historico, _, _, _, _ = dl.load_real_data()
+    # Janela longa para que os clientes tenham linhas no período
+    meses = 12 * 5
+    rng = np.random.default_rng(42)
+
+    print(f"{'linhas':>12} {'varredura (ms)':>16} {'índice (ms)':>14}")
+    for fator in ESCALAS:
+        base = replicar_historico(historico, fator)
+        base = base.sort_values(['user_id', 'timestamp'], kind='mergesort').reset_index(drop=True)
+        indice = dl.build_user_index(base)
+        usuarios = rng.choice(list(indice.keys()), size=CLIQUES)
+
+        t_varredura = medir(lambda u: dl.prepare_historico(base, u, meses=meses), usuarios)
+        t_indice = medir(lambda u: dl.prepare_historico(base, u, meses=meses, indice=indice), usuarios)
+        print(f"{len(base):>12,} {t_varredura:>16.3f} {t_indice:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark do recommend_for_users: implementação do notebook (iterrows por
+usuário) x utils/recommender.
+
+Os clientes reais são replicados com novos user_id para simular carteiras
+maiores. A equivalência entre as duas versões (mesmas linhas e mesma ordem
+de métricas por usuário; a ordem entre empates exatos no notebook depende
+da iteração de set) é verificada em tests/test_recommender.py, que usa a
+referência e a normalização deste arquivo.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_recommender.py
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import recommender, rule_mining
+
+ESCALAS = [1, 10, 50]
+
+
+def recommend_for_users_notebook(df_baskets, rules):
+    """Cópia da implementação original do sistema_rec.ipynb (referência)."""
+    df_baskets = df_baskets.copy()
+    df_baskets["timestamp"] = pd.to_datetime(df_baskets["timestamp"], errors="coerce")
+    df_mes = df_baskets[
+        (df_baskets["timestamp"].dt.year == 2025) &
+        (df_baskets["timestamp"].dt.month == 12)
+    ].copy()
+
+    recomendacoes = []
+    for user_id, group in df_mes.groupby("user_id"):
+        itens_user = set(group["item_id"].unique())
+        melhores_por_consequente = {}
+        for _, rule in rules.iterrows():
+            antecedent = set(rule["antecedents"])
+            consequent = set(rule["consequents"])
+            if not antecedent.issubset(itens_user):
+                continue
+            novos_itens = list(consequent - itens_user)
+            if len(novos_itens) == 0:
+                continue
+            for item_rec in novos_itens:
+                if item_rec not in melhores_por_consequente or rule["lift"] > melhores_por_consequente[item_rec]["lift"]:
+                    melhores_por_consequente[item_rec] = {
+                        "user_id": user_id,
+                        "antecedent": tuple(antecedent),
+                        "consequent": item_rec,
+                        "support": rule["support"],
+                        "confidence": rule["confidence"],
+                        "lift": rule["lift"]
+                    }
+        recomendacoes.extend(melhores_por_consequente.values())
+
+    df_rec = pd.DataFrame(recomendacoes)
+    if len(df_rec) > 0:
+        df_rec = df_rec.sort_values(
+            by=["user_id", "lift", "confidence", "support"],
+            ascending=[True, False, False, False]
+        )
+    return df_rec
+
+
+def normalizar(df_rec):
+    """Linhas comparáveis: antecedente como conjunto, empates ordenados pelo item."""
+    df = df_rec.assign(antecedent=df_rec['antecedent'].map(lambda a: tuple(sorted(a))))
+    df = df.sort_values(
+        by=['user_id', 'lift', 'confidence', 'support', 'consequent'],
+        ascending=[True, False, False, False, True], kind='mergesort'
+    )
+    return df[recommender.COLUNAS_RECOMENDACOES].reset_index(drop=True)
+
+
+def replicar(cestas, fator):
+    copias = []
+    for i in range(fator):
+        copia = cestas.copy()
+        copia['user_id'] = copia['user_id'] + f'_r{i}'
+        copia['basket_id'] = copia['basket_id'] + f'_r{i}'
+        copias.append(copia)
+    return pd.concat(copias, ignore_index=True)
+
+
+def main():
+    cestas = pd.read_csv('bases/cestas.csv')
+    rules = rule_mining.compute_association_rules(cestas, min_support=0.01, top=30, caminho_saida=None)
+
+    print(f"{'linhas':>10} {'notebook (s)':>13} {'vetorizado (s)':>15}")
+    for fator in ESCALAS:
+        base = replicar(cestas, fator)
+        inicio = time.perf_counter()
+        recommend_for_users_notebook(base, rules)
+        t_notebook = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        recommender.recommend_for_users(base, rules)
+        t_vetorizado = time.perf_counter() - inicio
+        print(f"{len(base):>10,} {t_notebook:>13.3f} {t_vetorizado:>15.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark da mineração de regras: caminho do notebook (TransactionEncoder
+denso + mlxtend.apriori) x utils/rule_mining (Eclat com bitsets).
+
+As cestas reais são replicadas com novos basket_id para simular bases
+maiores. Cada execução roda em um subprocesso separado, para que o pico de
+memória (ru_maxrss) de um caminho não contamine o outro.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_rule_mining.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+ESCALAS = [1, 10, 50]
+MIN_SUPPORT = 0.01
+TOP = 30
+
+
+def carregar_cestas(fator):
+    cestas = pd.read_csv(os.path.join(RAIZ, 'bases/cestas.csv'))
+    copias = []
+    for i in range(fator):
+        copia = cestas.copy()
+        copia['basket_id'] = copia['basket_id'] + f'_r{i}'
+        copias.append(copia)
+    return pd.concat(copias, ignore_index=True)
+
+
+def caminho_notebook(cestas):
+    from mlxtend.frequent_patterns import apriori, association_rules
+    from mlxtend.preprocessing import TransactionEncoder
+
+    transactions = cestas.groupby('basket_id')['item_id'].apply(list).tolist()
+    encoder = TransactionEncoder()
+    encoded_df = pd.DataFrame(encoder.fit(transactions).transform(transactions), columns=encoder.columns_)
+    itemsets = apriori(encoded_df, min_support=MIN_SUPPORT, use_colnames=True)
+    rules = association_rules(itemsets, metric='lift', min_threshold=1)
+    rules = rules.drop_duplicates(subset=['antecedents', 'consequents'])
+    return rules.sort_values(by=['lift', 'confidence', 'support'], ascending=False).head(TOP)
+
+
+def caminho_rule_mining(cestas):
+    from utils import rule_mining
+    return rule_mining.compute_association_rules(cestas, MIN_SUPPORT, TOP, caminho_saida=None)
+
+
+def executar(modo, fator):
+    """Roda um caminho no processo atual e imprime o resultado em JSON."""
+    cestas = carregar_cestas(fator)
+    if modo == 'notebook':
+        import mlxtend.frequent_patterns  # noqa: F401 (importação fora do tempo medido)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    rules = caminho_notebook(cestas) if modo == 'notebook' else caminho_rule_mining(cestas)
+    tempo = time.perf_counter() - inicio
+    pico_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'cestas': int(cestas['basket_id'].nunique()),
+        'regras': len(rules),
+        'tempo_s': tempo,
+        # ru_maxrss em KB no Linux; acréscimo sobre o pico após carregar as cestas
+        'pico_mb': (pico_rss - base_rss) / 1024,
+    }))
+
+
+def main():
+    print(f"{'cestas':>10} {'caminho':>12} {'tempo (s)':>10} {'pico RSS (MB)':>14} {'regras':>7}")
+    for fator in ESCALAS:
+        for modo in ('notebook', 'rule_mining'):
+            saida = subprocess.run(
+                [sys.executable, __file__, modo, str(fator)],
+                capture_output=True, text=True, check=True, cwd=RAIZ
+            ).stdout.strip().splitlines()[-1]
+            r = json.loads(saida)
+            print(f"{r['cestas']:>10,} {modo:>12} {r['tempo_s']:>10.2f} {r['pico_mb']:>14.1f} {r['regras']:>7}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        executar(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,99 @@
+"""
+Benchmark do índice de clientes similares (utils/similarity).
+
+Gera (ou reaproveita) uma base sintética com N clientes (10 cestas por
+cliente, utils/synthetic_data), monta o índice e reporta o tempo de
+montagem, a memória do índice e o pico alocado (tracemalloc, em uma
+segunda montagem), a latência das consultas (mediana e p95) e quantos
+similares cada cliente tem. Em uma amostra, confere a busca contra a
+similaridade calculada por força bruta.
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_similaridade.py [clientes]   # padrão: 100.000
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import similarity, synthetic_data
+
+PASTA_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.dados')
+CONSULTAS = 200
+CONFERIDOS = 20
+
+
+def carregar(n_clientes):
+    """Histórico (como o do painel: categoria e valor) e clientes_df da base sintética."""
+    pasta = os.path.join(PASTA_DADOS, f'similaridade_{n_clientes}')
+    if not os.path.exists(os.path.join(pasta, 'clientes_df.csv')):
+        print(f'Gerando base sintética com {n_clientes:,} clientes em {pasta}...')
+        synthetic_data.generate_dataset(pasta, n_cestas=n_clientes * 10, n_clientes=n_clientes)
+
+    produtos = pd.read_csv(os.path.join(pasta, 'bases', 'produtos.csv'))
+    historico = pd.read_csv(os.path.join(pasta, 'bases', 'cestas.csv'), usecols=['user_id', 'item_id', 'price'],
+                            dtype={'user_id': 'category', 'item_id': 'category', 'price': 'float32'})
+    historico = historico.rename(columns={'price': 'valor'})
+    historico['categoria'] = historico['item_id'].map(produtos.set_index('item_id')['item_class']).astype('category')
+    return historico, pd.read_csv(os.path.join(pasta, 'clientes_df.csv'))
+
+
+def conferir(indice, usuarios):
+    """Mesmos k vizinhos e total da força bruta (matriz densa só das linhas consultadas)."""
+    n_itens = len(indice['itens'])
+    linhas = np.zeros((len(indice['ids']), n_itens), dtype=np.float32)
+    usuario = np.repeat(np.arange(len(indice['ids'])), np.diff(indice['indptr']))
+    linhas[usuario, indice['indices']] = indice['dados']
+    for user_id in usuarios:
+        pos = indice['posicao'][user_id]
+        esperado = linhas @ linhas[pos] + indice['densa'] @ indice['densa'][pos]
+        esperado[pos] = -np.inf
+        obtido = similarity.similar_customers(indice, user_id, k=10)
+        assert obtido['total'] == int((esperado >= similarity.LIMIAR_SIMILARES).sum())
+        assert np.allclose(np.sort(esperado)[::-1][:10], obtido['vizinhos']['similaridade'], atol=1e-5)
+    print(f"Conferência com a força bruta ({len(usuarios)} clientes): OK")
+
+
+def main():
+    n_clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    historico, clientes = carregar(n_clientes)
+    print(f"{len(clientes):,} clientes, {len(historico):,} linhas de histórico")
+
+    inicio = time.perf_counter()
+    indice = similarity.build_similarity_index(historico, clientes)
+    segundos = time.perf_counter() - inicio
+
+    # Pico em uma segunda montagem: o tracemalloc deixa a montagem bem mais lenta
+    tracemalloc.start()
+    similarity.build_similarity_index(historico, clientes)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    estatisticas = indice['estatisticas']
+    print(f"Montagem: {segundos:.2f} s | índice: {estatisticas['mb']:.1f} MB "
+          f"({estatisticas['pares_cliente_item']:,} pares cliente x item, {estatisticas['colunas_densas']} colunas densas)"
+          f" | pico alocado: {pico / 1024 ** 2:.1f} MB")
+
+    rng = np.random.default_rng(0)
+    usuarios = rng.choice(indice['ids'].to_numpy(), size=min(CONSULTAS, len(indice['ids'])), replace=False)
+    tempos, totais = [], []
+    for user_id in usuarios:
+        inicio = time.perf_counter()
+        resultado = similarity.similar_customers(indice, user_id)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        totais.append(resultado['total'])
+
+    print(f"Consulta: mediana {np.median(tempos):.2f} ms | p95 {np.percentile(tempos, 95):.2f} ms "
+          f"({len(usuarios)} clientes)")
+    print(f"Similares por cliente (limiar {similarity.LIMIAR_SIMILARES}): mediana {np.median(totais):,.0f} | "
+          f"p10 {np.percentile(totais, 10):,.0f} | p90 {np.percentile(totais, 90):,.0f}")
+
+    conferir(indice, usuarios[:CONFERIDOS])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark da ingestão em blocos (utils/streaming) com memória limitada.
+
+Gera um CSV de cestas com N linhas replicando bases/cestas.csv (novos
+basket_id/user_id a cada cópia, gravado também em blocos), roda o pipeline
+com os três consumidores e reporta linhas/s e o pico de memória (RSS).
+Na escala 1x, confere o resultado contra o processamento em memória,
+inclusive o histórico do painel lido das partições em Parquet
+(data_loader.load_real_data com pasta_historico).
+
+Uso (a partir da pasta do app):
+    python benchmarks/bench_streaming.py [linhas]   # padrão: 5.000.000
+    python benchmarks/bench_streaming.py 50000000
+"""
+import os
+import resource
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import data_loader as dl
+from utils import rule_mining, streaming
+
+
+def gerar_csv(destino, linhas):
+    base = pd.read_csv('bases/cestas.csv')
+    escritas = 0
+    copia = 0
+    with open(destino, 'w', encoding='utf-8', newline='') as f:
+        while escritas < linhas:
+            parte = base.head(linhas - escritas).assign(
+                basket_id=base['basket_id'] + f'_r{copia}',
+                user_id=base['user_id'] + f'_r{copia % 20}',
+            )
+            parte.to_csv(f, index=False, header=(copia == 0))
+            escritas += len(parte)
+            copia += 1
+
+
+def tamanho_pasta(pasta):
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(pasta) for nome in nomes)
+
+
+def conferir(pasta):
+    """Na escala 1x, o streaming deve produzir o mesmo que o caminho em memória."""
+    contador = streaming.ItemsetCounter()
+    agregador = streaming.CustomerAggregator()
+    gravador = streaming.ParquetHistoryWriter(os.path.join(pasta, 'historico_1x'), pd.read_csv('bases/produtos.csv'))
+    streaming.stream_baskets('bases/cestas.csv', [contador, agregador, gravador], chunksize=1000)
+
+    cestas = pd.read_csv('bases/cestas.csv')
+    esperado = rule_mining.compute_association_rules(cestas, 0.005, 500, max_len=contador.max_len, caminho_saida=None)
+    obtido = contador.rules(0.005, 500, caminho_saida=None)
+    assert set(zip(esperado['antecedents'], esperado['consequents'])) == set(zip(obtido['antecedents'], obtido['consequents']))
+
+    linhas = cestas.groupby('user_id').size()
+    assert (agregador.agregados['linhas'].sort_index() == linhas.sort_index()).all()
+    assert (agregador.agregados['cestas'].sort_index() == cestas.groupby('user_id')['basket_id'].nunique().sort_index()).all()
+
+    _, historico, *_ = dl.load_real_data(usar_cache=False)
+    _, historico_parquet, *_ = dl.load_real_data(pasta_historico=os.path.join(pasta, 'historico_1x'))
+    pd.testing.assert_frame_equal(historico, historico_parquet)
+    print("Conferência com o processamento em memória: OK")
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+
+    produtos = pd.read_csv('bases/produtos.csv')
+    with tempfile.TemporaryDirectory() as pasta:
+        conferir(pasta)
+        arquivo = os.path.join(pasta, 'cestas.csv')
+        gerar_csv(arquivo, linhas)
+        print(f"Arquivo gerado: {linhas:,} linhas, {os.path.getsize(arquivo) / 1e6:,.0f} MB")
+
+        rss_antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        contador = streaming.ItemsetCounter(max_len=3)
+        agregador = streaming.CustomerAggregator()
+        gravador = streaming.ParquetHistoryWriter(os.path.join(pasta, 'historico'), produtos)
+        stats = streaming.stream_baskets(arquivo, [contador, agregador, gravador])
+        rss_depois = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        regras = contador.rules(0.01, 30, caminho_saida=None)
+        print(f"{stats['linhas']:,} linhas / {stats['cestas']:,} cestas em {stats['segundos']:.1f} s "
+              f"-> {stats['linhas_por_segundo']:,.0f} linhas/s")
+        print(f"Clientes agregados: {len(agregador.agregados):,} | regras: {len(regras)} | "
+              f"Parquet: {tamanho_pasta(os.path.join(pasta, 'historico')) / 1e6:,.0f} MB "
+              f"({len(os.listdir(os.path.join(pasta, 'historico')))} partições mensais)")
+        print(f"Pico de RSS: {rss_depois / 1024:,.0f} MB (acréscimo durante o streaming: "
+              f"{(rss_depois - rss_antes) / 1024:,.0f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Suíte de benchmarks sobre dados sintéticos (utils/synthetic_data), com
+comparação contra uma baseline gravada.
+
+Gera (ou reaproveita) uma base com N cestas, executa cada caso e reporta o
+tempo (mediana das repetições) e o pico de memória alocada (tracemalloc).
+Sai com código 1 se algum caso ficar acima da baseline da mesma escala além
+das tolerâncias.
+
+Tempos absolutos dependem da máquina, então a comparação de tempo não usa
+os segundos da baseline: cada caso é dividido pelo caso 'referencia' (uma
+carga fixa de numpy/pandas, sem código do app) medido na mesma execução, e
+é essa razão que se compara com a da baseline. O pico de memória é
+comparado em MB. Uma baseline sem 'referencia' (formato antigo) só é
+usada para memória.
+
+Casos:
+    referencia              carga fixa de numpy/pandas (escala dos tempos, ver acima)
+    mineracao               rule_mining.compute_association_rules
+    mineracao_top_pares     rule_mining.compute_top_rules (max_len=2, top-k por lift)
+    regras_por_safra        rule_mining.compute_season_rules (safra/entressafra das SAFRAS)
+    pontuacao_lote          batch_scoring.run_pipeline (1 processo)
+    load_real_data_csv      data_loader.load_real_data sem cache
+    load_real_data_cache    data_loader.load_real_data com o cache Feather
+    prepare_historico       CLIENTES chamadas (janela com todo o histórico, índice de build_user_index)
+    customer_history        CLIENTES chamadas de HistoryStore.customer_history (consulta do painel)
+    prepare_recommendations CLIENTES chamadas (com índice de regras)
+    calculate_commercial_metrics  CLIENTES chamadas
+    carteira                data_loader.build_portfolio (todos os clientes, uma passada)
+    similaridade            similarity.build_similarity_index + CLIENTES consultas de similares
+
+Uso (a partir da pasta do app):
+    python benchmarks/suite.py --cestas 100000
+    python benchmarks/suite.py --cestas 100000 --gravar-baseline
+    python benchmarks/suite.py --cestas 10000000 --sem-baseline
+
+A baseline (benchmarks/baseline.json) foi gravada em uma máquina só: as
+razões reduzem, mas não eliminam, a diferença entre ambientes (CPU, cache,
+versões de numpy/pandas). Ao trocar de ambiente, regrave-a com
+--gravar-baseline antes de usá-la como critério, ou rode com --sem-baseline.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+from utils import batch_scoring, recommender, rule_mining, similarity, synthetic_data
+from utils import data_loader as dl
+from utils.history_store import HistoryStore
+
+ARQUIVO_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+PASTA_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.dados')
+CLIENTES = 200
+MESES_TUDO = 12 * 100
+# Folgas absolutas, para que casos muito rápidos/pequenos não oscilem
+FOLGA_SEGUNDOS = 0.005
+FOLGA_MB = 1.0
+REFERENCIA = 'referencia'
+N_REFERENCIA = 2_000_000
+
+
+def preparar_dados(n_cestas, seed):
+    """Gera a base sintética (uma vez por escala/semente) e o recomendacoes.csv."""
+    pasta = os.path.join(PASTA_DADOS, f'cestas_{n_cestas}_seed_{seed}')
+    if not os.path.exists(os.path.join(pasta, 'recomendacoes.csv')):
+        print(f'Gerando base sintética com {n_cestas:,} cestas em {pasta}...')
+        synthetic_data.generate_dataset(pasta, n_cestas=n_cestas, seed=seed)
+        anterior = os.getcwd()
+        os.chdir(pasta)
+        try:
+            batch_scoring.run_pipeline()
+        finally:
+            os.chdir(anterior)
+    return pasta
+
+
+def medir(funcao, repeticoes):
+    """(mediana dos segundos, pico de memória em MB) de 'funcao'."""
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos), pico / 1024 ** 2
+
+
+def referencia():
+    """Carga fixa (ordenação, agrupamento e merge) que serve de escala para os tempos."""
+    rng = np.random.default_rng(0)
+    valores = rng.random(N_REFERENCIA)
+    chaves = rng.integers(0, 1000, N_REFERENCIA)
+    np.sort(valores)
+    tabela = pd.DataFrame({'chave': chaves, 'valor': valores})
+    soma = tabela.groupby('chave')['valor'].sum()
+    tabela.merge(soma.rename('soma').reset_index(), on='chave')
+
+
+def casos(pasta):
+    """Lista (nome, função) dos casos, com as entradas já preparadas."""
+    cestas = pd.read_csv(os.path.join(pasta, 'bases', 'cestas.csv'))
+    shutil.rmtree(dl.PASTA_CACHE, ignore_errors=True)
+
+    clientes, historico, recomendacoes, produtos, rules, rule_items = dl.load_real_data()
+    indice = dl.build_user_index(historico)
+    store = HistoryStore.from_frame(historico)
+    indice_regras = recommender.build_rule_index(rules, produtos)
+    recomendacoes = recomendacoes.merge(produtos[['item_id', 'item_desc', 'item_class']],
+                                        left_on='rec_id', right_on='item_id', how='left')
+    rng = np.random.default_rng(0)
+    usuarios = rng.choice(np.asarray(list(indice), dtype=object), size=min(CLIENTES, len(indice)), replace=False)
+    historicos = {u: dl.prepare_historico(historico, u, meses=MESES_TUDO, indice=indice) for u in usuarios}
+
+    def historico_por_cliente():
+        for u in usuarios:
+            dl.prepare_historico(historico, u, meses=MESES_TUDO, indice=indice)
+
+    def historico_no_store():
+        for u in usuarios:
+            store.customer_history(u, meses=MESES_TUDO)
+
+    def recomendacoes_por_cliente():
+        for u in usuarios:
+            dl.prepare_recommendations(recomendacoes, rules, u, top_n=3, indice_regras=indice_regras,
+                                       historico_cliente=historicos[u], rule_items=rule_items)
+
+    def metricas_por_cliente():
+        for u in usuarios:
+            dl.calculate_commercial_metrics(historicos[u])
+
+    def carteira():
+        tabela = dl.build_metrics_table(historico, meses=MESES_TUDO)
+        forca = dl.best_recommendation_per_customer(historico, recomendacoes, rules, rule_items)
+        dl.build_portfolio(clientes, tabela['resumo'], forca, dl.last_purchase(historico), produtos=produtos)
+
+    def similares():
+        indice_similares = similarity.build_similarity_index(historico, clientes)
+        for u in usuarios:
+            similarity.similar_customers(indice_similares, u)
+
+    return [
+        (REFERENCIA, referencia),
+        ('mineracao', lambda: rule_mining.compute_association_rules(cestas, 0.01, 30, caminho_saida=None)),
+        ('mineracao_top_pares', lambda: rule_mining.compute_top_rules(cestas, 0.01, 30, max_len=2,
+                                                                      caminho_saida=None)),
+        ('regras_por_safra', lambda: rule_mining.compute_season_rules(cestas, synthetic_data.SAFRAS, 0.01, 30,
+                                                                      caminho_saida=None)),
+        ('pontuacao_lote', lambda: batch_scoring.run_pipeline(caminho_saida=os.devnull, caminho_regras=None)),
+        ('load_real_data_csv', lambda: dl.load_real_data(usar_cache=False)),
+        ('load_real_data_cache', dl.load_real_data),
+        ('prepare_historico', historico_por_cliente),
+        ('customer_history', historico_no_store),
+        ('prepare_recommendations', recomendacoes_por_cliente),
+        ('calculate_commercial_metrics', metricas_por_cliente),
+        ('carteira', carteira),
+        ('similaridade', similares),
+    ]
+
+
+def comparar(resultados, baseline, tol_tempo, tol_memoria):
+    """
+    Imprime a tabela e devolve os casos que regrediram. O tempo é comparado
+    em múltiplos da 'referencia' de cada execução (colunas 'x ref').
+    """
+    ref_atual = resultados[REFERENCIA]['segundos']
+    ref_base = baseline.get(REFERENCIA, {}).get('segundos')
+    if baseline and ref_base is None:
+        print(f"Baseline sem o caso '{REFERENCIA}': tempos não comparados (regrave com --gravar-baseline)")
+
+    regressoes = []
+    print(f"{'caso':<30} {'segundos':>10} {'x ref':>10} {'base':>10} {'pico MB':>10} {'base':>10}")
+    for nome, atual in resultados.items():
+        base = baseline.get(nome, {})
+        relativo = atual['segundos'] / ref_atual
+        relativo_base = base['segundos'] / ref_base if base and ref_base else float('nan')
+        marca = ''
+        if base and nome != REFERENCIA:
+            # Folga absoluta convertida para a escala da referência atual
+            if ref_base and relativo > relativo_base * (1 + tol_tempo) + FOLGA_SEGUNDOS / ref_atual:
+                marca += ' tempo'
+            if atual['pico_mb'] > base['pico_mb'] * (1 + tol_memoria) + FOLGA_MB:
+                marca += ' memória'
+        if marca:
+            regressoes.append(nome)
+        print(f"{nome:<30} {atual['segundos']:>10.4f} {relativo:>10.2f} {relativo_base:>10.2f} "
+              f"{atual['pico_mb']:>10.1f} {base.get('pico_mb', float('nan')):>10.1f}"
+              f"{'  <- REGRESSÃO:' + marca if marca else ''}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suíte de benchmarks com base sintética.')
+    parser.add_argument('--cestas', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--tolerancia-tempo', type=float, default=0.5,
+                        help='fração acima da baseline, em múltiplos da referência (0.5 = +50%%)')
+    parser.add_argument('--tolerancia-memoria', type=float, default=0.2)
+    parser.add_argument('--gravar-baseline', action='store_true', help='grava os resultados como nova baseline')
+    parser.add_argument('--sem-baseline', action='store_true', help='apenas mede, sem comparar')
+    args = parser.parse_args()
+
+    pasta = preparar_dados(args.cestas, args.seed)
+    os.chdir(pasta)  # data_loader e batch_scoring usam caminhos relativos
+
+    resultados = {}
+    for nome, funcao in casos(pasta):
+        segundos, pico_mb = medir(funcao, args.repeticoes)
+        resultados[nome] = {'segundos': segundos, 'pico_mb': pico_mb}
+
+    baselines = {}
+    if os.path.exists(ARQUIVO_BASELINE):
+        with open(ARQUIVO_BASELINE) as f:
+            baselines = json.load(f)
+    chave = f'cestas_{args.cestas}_seed_{args.seed}'
+
+    if args.gravar_baseline:
+        baselines[chave] = resultados
+        with open(ARQUIVO_BASELINE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline gravada em {ARQUIVO_BASELINE} ({chave})')
+
+    baseline = {} if args.sem_baseline else baselines.get(chave, {})
+    regressoes = comparar(resultados, baseline, args.tolerancia_tempo, args.tolerancia_memoria)
+
+    if regressoes:
+        print(f"\n{len(regressoes)} caso(s) acima da baseline: {', '.join(regressoes)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Gera o recomendacoes.csv (e o regras_apriori.csv) sem o notebook.
+
+Executa o pipeline de utils/batch_scoring: carrega as bases, minera as
+regras, pontua os usuários em paralelo, completa com os produtos de maior
+faturamento, junta clientes/produtos e grava a saída. Ao final imprime o
+tempo de cada etapa.
+
+Uso (a partir da pasta do app):
+    python score.py                       # 1 processo por núcleo
+    python score.py --workers 4 --saida recomendacoes.csv
+    python score.py --top-k --max-len 2 --cota Fungicida=10 --cota Herbicida=10 --cota Inseticida=10
+    python score.py --sazonal              # regras por safra da safra_principal de cada cliente
+"""
+import argparse
+import os
+
+from utils import batch_scoring
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera recomendações em lote (Apriori + top faturamento).')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processos para a pontuação (padrão: nº de núcleos)')
+    parser.add_argument('--saida', default='recomendacoes.csv', help='CSV de recomendações')
+    parser.add_argument('--regras', default='regras_apriori.csv', help='CSV de regras mineradas')
+    parser.add_argument('--min-support', type=float, default=0.01)
+    parser.add_argument('--top-regras', type=int, default=30)
+    parser.add_argument('--top-k', action='store_true',
+                        help='minera só as regras do top (rule_mining.compute_top_rules), com poda')
+    parser.add_argument('--max-len', type=int, default=None, help='máximo de itens por itemset')
+    parser.add_argument('--ordem-regras', choices=['lift', 'confidence'], default='lift',
+                        help='critério do top-k (com --top-k)')
+    parser.add_argument('--cota', action='append', default=[], metavar='CATEGORIA=N',
+                        help='máximo de regras por item_class do consequente (com --top-k; repetível)')
+    parser.add_argument('--max-extensoes', type=int, default=None,
+                        help='busca em feixe: extensões por itemset (com --top-k; aproximado)')
+    parser.add_argument('--sazonal', action='store_true',
+                        help='minera regras por safra/entressafra e pontua cada cliente com as da sua safra')
+    parser.add_argument('--regras-sazonais', default='regras_sazonais.csv', help='CSV de regras por safra')
+    parser.add_argument('--safras', default='clientes_df.csv',
+                        help='CSV com user_id e safra_principal (com --sazonal)')
+    parser.add_argument('--ano', type=int, default=2025, help='ano das cestas usadas na pontuação')
+    parser.add_argument('--mes', type=int, default=12, help='mês das cestas usadas na pontuação')
+    parser.add_argument('--cestas', default='bases/cestas.csv')
+    parser.add_argument('--clientes', default='bases/clientes.csv')
+    parser.add_argument('--produtos', default='bases/produtos.csv')
+    args = parser.parse_args()
+
+    cotas = {}
+    for cota in args.cota:
+        categoria, _, limite = cota.rpartition('=')
+        if not categoria or not limite.isdigit():
+            parser.error(f'--cota deve ser CATEGORIA=N: {cota}')
+        cotas[categoria] = int(limite)
+
+    saida, tempos = batch_scoring.run_pipeline(
+        caminho_saida=args.saida,
+        caminho_regras=args.regras,
+        min_support=args.min_support,
+        top_regras=args.top_regras,
+        workers=args.workers,
+        ano=args.ano,
+        mes=args.mes,
+        caminho_cestas=args.cestas,
+        caminho_clientes=args.clientes,
+        caminho_produtos=args.produtos,
+        top_k=args.top_k,
+        max_len=args.max_len,
+        cotas=cotas or None,
+        ordem_regras=args.ordem_regras,
+        max_extensoes=args.max_extensoes,
+        sazonal=args.sazonal,
+        caminho_regras_sazonais=args.regras_sazonais,
+        caminho_safras=args.safras,
+    )
+
+    print(f"{len(saida):,} recomendações para {saida['user_id'].nunique():,} clientes "
+          f"gravadas em {args.saida} ({args.workers} processo(s))")
+    print(f"{'etapa':<10} {'segundos':>10}")
+    for etapa, segundos in tempos.items():
+        print(f"{etapa:<10} {segundos:>10.3f}")
+    print(f"{'total':<10} {sum(tempos.values()):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
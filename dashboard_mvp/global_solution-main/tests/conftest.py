@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture(scope='session')
+def cestas():
+    """bases/cestas.csv do repositório."""
+    return pd.read_csv(os.path.join(RAIZ, 'bases', 'cestas.csv'))
+
+
+@pytest.fixture(scope='session')
+def produtos():
+    return pd.read_csv(os.path.join(RAIZ, 'bases', 'produtos.csv'))
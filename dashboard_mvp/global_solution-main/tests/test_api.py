@@ -0,0 +1,52 @@
+import asyncio
+import json
+import logging
+
+import httpx
+import pytest
+
+import api
+from conftest import RAIZ
+from utils import instrumentation
+from utils.service import RecommendationService
+
+
+class _Linhas(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.linhas = []
+
+    def emit(self, registro):
+        self.linhas.append(json.loads(registro.getMessage()))
+
+
+@pytest.fixture(scope='module')
+def servico():
+    with pytest.MonkeyPatch.context() as m:
+        m.chdir(RAIZ)
+        return RecommendationService.load()
+
+
+def test_cada_requisicao_e_uma_execucao_da_instrumentacao(servico, monkeypatch):
+    monkeypatch.setattr(api, 'servico', servico)
+    monkeypatch.setattr(instrumentation, 'ATIVO', True)
+    saida = _Linhas()
+    instrumentation.logger.addHandler(saida)
+    user_id = servico.diretorio['ids'][0]
+
+    async def consultar():
+        # Sem o lifespan: o serviço já carregado entra direto no módulo
+        transporte = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transporte, base_url='http://api') as cliente:
+            for rota in (f'/customers/{user_id}/history?meses=1200', '/customers'):
+                assert (await cliente.get(rota)).status_code == 200
+
+    try:
+        asyncio.run(consultar())
+    finally:
+        instrumentation.logger.removeHandler(saida)
+
+    assert [linha['execucao'] for linha in saida.linhas] == \
+        [f'GET /customers/{user_id}/history', 'GET /customers']
+    # Etapas medidas na thread da rota entram na execução aberta pelo middleware
+    assert 'HistoryStore.window' in {etapa['etapa'] for etapa in saida.linhas[0]['etapas']}
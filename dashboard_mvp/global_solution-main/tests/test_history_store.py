@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from conftest import RAIZ
+from utils import data_loader as dl
+from utils.history_store import SEM_DATA, HistoryStore, month_key
+
+
+@pytest.fixture(scope='module')
+def historico():
+    with pytest.MonkeyPatch.context() as m:
+        m.chdir(RAIZ)
+        _, historico, *_ = dl.load_real_data(usar_cache=False)
+    return historico
+
+
+@pytest.mark.parametrize('meses', [12, 18, 1200])
+def test_customer_history_igual_a_prepare_historico(historico, meses):
+    indice = dl.build_user_index(historico)
+    store = HistoryStore.from_frame(historico)
+    usuarios = list(historico['user_id'].unique()) + ['cliente_inexistente']
+
+    for u in usuarios:
+        esperado = dl.prepare_historico(historico, u, meses=meses, indice=indice)
+        obtido = store.customer_history(u, meses=meses)
+        pd.testing.assert_frame_equal(esperado.reset_index(drop=True), obtido.reset_index(drop=True))
+        assert store.ultima_consulta['linhas_lidas'] == len(obtido)
+
+
+def test_estatisticas_da_consulta_por_cliente_e_por_janela(historico):
+    store = HistoryStore.from_frame(historico)
+    user_id = historico['user_id'].iloc[0]
+    inicio = historico['timestamp'].max() - timedelta(days=90)
+
+    # Por cliente: índice (cliente, timestamp), nenhuma partição lida nem pulada
+    linhas = store.window(inicio=inicio, user_id=user_id)
+    assert store.ultima_consulta == {'tipo': 'indice', 'particoes_lidas': 0, 'particoes_puladas': 0,
+                                     'linhas_lidas': len(linhas)}
+
+    # Por janela: só os meses que intersectam a janela
+    janela = store.window(inicio=inicio)
+    meses = [mes for mes in store.particoes if mes != SEM_DATA]
+    lidas = sum(mes >= month_key([inicio])[0] for mes in meses)
+    assert store.ultima_consulta == {'tipo': 'particoes', 'particoes_lidas': lidas,
+                                     'particoes_puladas': len(meses) - lidas,
+                                     'linhas_lidas': sum(fim - ini for mes, (ini, fim) in store.particoes.items()
+                                                         if mes != SEM_DATA and mes >= month_key([inicio])[0])}
+    assert len(janela) == (historico['timestamp'] >= inicio).sum()
+
+    assert store.estatisticas == {
+        'consultas': 2, 'consultas_indice': 1, 'particoes_lidas': lidas, 'particoes_puladas': len(meses) - lidas,
+        'linhas_lidas': len(linhas) + store.ultima_consulta['linhas_lidas'],
+    }
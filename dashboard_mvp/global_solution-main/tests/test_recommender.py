@@ -0,0 +1,48 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from benchmarks.bench_recommender import normalizar, recommend_for_users_notebook, replicar
+from utils import recommender, rule_mining
+
+
+@pytest.fixture(scope='module')
+def regras(cestas):
+    return rule_mining.compute_association_rules(cestas, min_support=0.01, top=30, caminho_saida=None)
+
+
+def _comparar(cestas, regras):
+    esperado = recommend_for_users_notebook(cestas, regras)
+    obtido = recommender.recommend_for_users(cestas, regras)
+    assert len(obtido) > 0
+    pd.testing.assert_frame_equal(normalizar(esperado), normalizar(obtido))
+
+
+def test_vetorizado_igual_ao_notebook(cestas, regras):
+    _comparar(cestas, regras)
+
+
+def test_vetorizado_igual_ao_notebook_com_clientes_replicados(cestas, regras):
+    _comparar(replicar(cestas, 3), regras)
+
+
+def test_antecedente_vazio_casa_com_todos(cestas, regras):
+    # Como set().issubset no notebook: a regra vale para todo usuário do mês
+    vazia = regras.head(1).assign(antecedents=[frozenset()], consequents=[frozenset({'item_150'})], lift=50.0)
+    _comparar(cestas, pd.concat([regras, vazia], ignore_index=True))
+
+
+def test_safra_sem_regras_proprias_usa_a_entressafra(regras):
+    # Só a entressafra de 'Set-Fev' ('Mar-Ago') gerou regras
+    sazonais = regras.head(5).assign(janela='Mar-Ago')
+    for safras in (None, ['Set-Fev', 'Abr-Ago']):
+        indice = recommender.build_season_index(sazonais, safras=safras)
+        assert recommender.season_rule_window(indice, 'Set-Fev', date(2025, 4, 1)) == 'Mar-Ago'
+        assert recommender.season_rule_index(indice, 'Set-Fev', date(2025, 4, 1)) is indice['indices']['Mar-Ago']
+        # Na própria safra não há conjunto: regras globais
+        assert recommender.season_rule_window(indice, 'Set-Fev', date(2025, 10, 1)) is None
+
+    # Safras do cadastro que não são janela nem entressafra de uma janela com regras
+    indice = recommender.build_season_index(sazonais, safras=['Set-Fev', 'Abr-Ago'])
+    assert recommender.season_rule_window(indice, 'Abr-Ago', date(2025, 5, 1)) is None
@@ -0,0 +1,168 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from utils import rule_mining, synthetic_data
+from utils.history_store import safra_months
+
+MIN_SUPPORT = 0.005
+TOP = 500
+MAX_LEN = rule_mining.MAX_LEN_CONTAGENS
+
+
+def _ordenadas(regras):
+    chave = ['antecedents', 'consequents']
+    return regras.sort_values(chave, key=lambda s: s.map(sorted).map(tuple)).reset_index(drop=True)
+
+
+def _dividir_ultimo_mes(cestas):
+    datas = pd.to_datetime(cestas['timestamp'])
+    ultimo_mes = datas.dt.to_period('M') == datas.max().to_period('M')
+    return cestas[~ultimo_mes], cestas[ultimo_mes], datas[ultimo_mes].dt.date
+
+
+def _pasta_completa(cestas, pasta):
+    """Contagens de todas as cestas em um único lote."""
+    rule_mining.update_itemset_counts(cestas, pasta, MAX_LEN)
+    return pasta
+
+
+def test_incremental_igual_a_remineracao_completa(cestas, tmp_path):
+    historico, novas, dias = _dividir_ultimo_mes(cestas)
+    rule_mining.update_itemset_counts(historico, tmp_path, MAX_LEN)
+
+    vistas = historico
+    for dia in sorted(dias.unique()):
+        lote = novas[dias == dia]
+        vistas = pd.concat([vistas, lote], ignore_index=True)
+
+        incremental = rule_mining.compute_association_rules_incremental(
+            lote, MIN_SUPPORT, TOP, max_len=MAX_LEN, pasta=tmp_path, caminho_saida=None)
+        completo = rule_mining.compute_association_rules(vistas, MIN_SUPPORT, TOP, max_len=MAX_LEN,
+                                                         caminho_saida=None)
+        assert len(incremental) > 0
+        pd.testing.assert_frame_equal(_ordenadas(incremental), _ordenadas(completo), check_exact=False, rtol=1e-12)
+
+
+def test_lote_reaplicado_nao_soma_de_novo(cestas, tmp_path):
+    pasta = tmp_path / 'contagens'
+    historico, novas, _ = _dividir_ultimo_mes(cestas)
+    rule_mining.update_itemset_counts(historico, pasta, MAX_LEN)
+    assert rule_mining.update_itemset_counts(novas, pasta, MAX_LEN)
+    antes = rule_mining.load_itemset_counts(pasta)
+
+    # Mesmo lote com as linhas em outra ordem: mesmo batch_id
+    assert rule_mining.update_itemset_counts(novas.iloc[::-1], pasta, MAX_LEN) == []
+    assert rule_mining.load_itemset_counts(pasta) == antes
+    assert antes == rule_mining.load_itemset_counts(_pasta_completa(cestas, tmp_path / 'completa'))
+
+
+def test_atualizacao_interrompida_mantem_versao_publicada(cestas, tmp_path, monkeypatch):
+    pasta = tmp_path / 'contagens'
+    historico, novas, _ = _dividir_ultimo_mes(cestas)
+    rule_mining.update_itemset_counts(historico, pasta, MAX_LEN)
+    antes = rule_mining.load_itemset_counts(pasta)
+
+    def falhar(*args, **kwargs):
+        raise OSError('falha simulada antes da troca do manifesto')
+
+    with monkeypatch.context() as m:
+        m.setattr(rule_mining.json, 'dump', falhar)
+        with pytest.raises(OSError):
+            rule_mining.update_itemset_counts(novas, pasta, MAX_LEN)
+
+    # Nada publicado: mesmas contagens, lote não registrado
+    assert rule_mining.load_itemset_counts(pasta) == antes
+    with open(os.path.join(pasta, 'manifesto.json'), encoding='utf-8') as f:
+        assert rule_mining.batch_id(novas) not in json.load(f)['lotes']
+
+    # A nova tentativa aplica o lote uma vez só
+    rule_mining.update_itemset_counts(novas, pasta, MAX_LEN)
+    assert rule_mining.load_itemset_counts(pasta) == \
+        rule_mining.load_itemset_counts(_pasta_completa(cestas, tmp_path / 'completa'))
+
+
+def test_contagens_exigem_max_len(cestas, tmp_path):
+    with pytest.raises(ValueError):
+        rule_mining.count_itemsets(cestas, max_len=None)
+    with pytest.raises(ValueError):
+        rule_mining.update_itemset_counts(cestas, tmp_path, max_len=None)
+
+
+@pytest.mark.parametrize('max_len, max_extensoes, chave', [(2, None, 'pares_podados'), (3, None, 'itemsets_podados'),
+                                                         (3, 5, 'itemsets_podados')])
+def test_top_rules_reporta_a_poda_de_cada_caminho(cestas, max_len, max_extensoes, chave):
+    regras, estatisticas = rule_mining.compute_top_rules(cestas, MIN_SUPPORT, 30, max_len=max_len,
+                                                         max_extensoes=max_extensoes, caminho_saida=None)
+    assert len(regras) > 0
+    assert estatisticas[chave] > 0
+
+
+def _cestas_empatadas():
+    """Grupos de itens com as mesmas contagens: todas as regras empatam em lift, confiança e suporte."""
+    linhas = []
+    for grupo in range(6):
+        itens = [f'item_{grupo * 3 + k:02d}' for k in range(3)]
+        for n in range(10):
+            linhas += [(f'g{grupo}_{n}', item) for item in itens]
+        for k, item in enumerate(itens):
+            for n in range(4):
+                linhas.append((f'g{grupo}_{k}_{n}', item))
+    # A ordem das linhas não deve importar
+    return pd.DataFrame(linhas[::-1], columns=['basket_id', 'item_id'])
+
+
+@pytest.mark.parametrize('max_len, ordem', [(2, 'lift'), (2, 'confidence'), (3, 'lift'), (3, 'confidence')])
+@pytest.mark.parametrize('top', [1, 5, 7, 100])
+def test_top_rules_desempata_como_a_mineracao_completa(max_len, ordem, top):
+    cestas = _cestas_empatadas()
+    obtidas, _ = rule_mining.compute_top_rules(cestas, 0.01, top, max_len=max_len, ordem=ordem, caminho_saida=None)
+
+    itens, bitsets, n_cestas = rule_mining.prepare_transactions(cestas)
+    frequentes = rule_mining.mine_frequent_itemsets(itens, bitsets, n_cestas, 0.01, max_len)
+    esperadas = rule_mining._finalizar_regras(rule_mining.generate_rules(frequentes, n_cestas), top, None, ordem)
+    assert esperadas['lift'].nunique() < len(esperadas) or top == 1
+    pd.testing.assert_frame_equal(obtidas.reset_index(drop=True), esperadas.reset_index(drop=True))
+
+
+@pytest.fixture(scope='module')
+def cestas_sinteticas(tmp_path_factory):
+    """100k cestas sintéticas, com março quase vazio (5 cestas por ano)."""
+    pasta = tmp_path_factory.mktemp('sinteticas')
+    synthetic_data.generate_dataset(str(pasta), n_cestas=100_000)
+    cestas = pd.read_csv(pasta / 'bases' / 'cestas.csv')
+    datas = pd.to_datetime(cestas['timestamp'])
+    marco = cestas.loc[datas.dt.month == 3, 'basket_id'].drop_duplicates()
+    manter = marco.groupby(datas[marco.index].dt.year.to_numpy()).head(5)
+    return cestas[(datas.dt.month != 3).to_numpy() | cestas['basket_id'].isin(manter).to_numpy()]
+
+
+def test_regras_por_safra_com_mes_esparso(cestas_sinteticas, monkeypatch):
+    meses_minerados = []
+    por_mes = rule_mining._candidatos_por_mes
+
+    def registrar(itens, bitsets, faixas, meses, *args):
+        meses_minerados.extend(meses)
+        return por_mes(itens, bitsets, faixas, meses, *args)
+
+    monkeypatch.setattr(rule_mining, '_candidatos_por_mes', registrar)
+    sazonais = rule_mining.compute_season_rules(cestas_sinteticas, synthetic_data.SAFRAS, 0.01, 30,
+                                                caminho_saida=None)
+    # Março (15 cestas, contagem mínima 1) não gera candidatos próprios
+    assert meses_minerados and 3 not in meses_minerados
+    meses = pd.to_datetime(cestas_sinteticas['timestamp']).dt.month
+
+    # Mesmo resultado de minerar só as cestas de cada janela, inclusive as que têm março
+    assert any(3 in safra_months(janela) for janela in sazonais['janela'].unique())
+    for janela, obtidas in sazonais.groupby('janela'):
+        da_janela = cestas_sinteticas[meses.isin(safra_months(janela)).to_numpy()]
+        esperadas = rule_mining.compute_association_rules(da_janela, 0.01, 30, max_len=MAX_LEN, caminho_saida=None)
+        pd.testing.assert_frame_equal(_ordenadas(obtidas.drop(columns='janela')), _ordenadas(esperadas),
+                                      check_exact=False, rtol=1e-12)
+
+
+def test_regras_por_safra_exigem_max_len(cestas):
+    with pytest.raises(ValueError):
+        rule_mining.compute_season_rules(cestas, ['Set-Fev'], max_len=None, caminho_saida=None)
@@ -0,0 +1,101 @@
+import os
+import shutil
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from conftest import RAIZ
+from utils import data_loader as dl
+from utils import recommender
+from utils.rule_mining import write_csv_atomic
+from utils.service import RecommendationService
+
+
+@pytest.fixture(scope='module')
+def servico():
+    with pytest.MonkeyPatch.context() as m:
+        m.chdir(RAIZ)
+        return RecommendationService.load()
+
+
+@pytest.mark.parametrize('mes', [3, 10])
+def test_carteira_usa_as_regras_da_safra_do_cliente(servico, mes):
+    modelo = servico.modelo
+    data = date(2025, mes, 15)
+    janelas = servico._janelas_dos_clientes(modelo, data)
+    assert any(janela is not None for janela in janelas.values())
+
+    historico = servico.historico
+    sem_lote = modelo['recomendacoes'].iloc[:0]
+    forca = dl.best_recommendation_per_customer(
+        historico, sem_lote, modelo['rules'], modelo['rule_items'],
+        regras_sazonais=modelo['regras_sazonais'], janela_cliente=janelas)
+    so_globais = dl.best_recommendation_per_customer(historico, sem_lote, modelo['rules'], modelo['rule_items'])
+
+    # Mesmo índice das recomendações do cliente (RecommendationService._indice_do_cliente)
+    itens = historico.groupby('user_id', observed=True)['item_id'].unique()
+    safras = servico.clientes.drop_duplicates('user_id').set_index('user_id')['safra_principal']
+    for user_id, comprados in itens.items():
+        indice = recommender.season_rule_index(modelo['indice_sazonal'], safras.get(user_id), data)
+        recs = recommender.recommend_from_index(modelo['indice_regras'] if indice is None else indice, comprados, 1)
+        if recs:
+            assert forca.loc[user_id, 'lift'] == pytest.approx(recs[0]['lift'])
+        else:
+            assert user_id not in forca.index
+
+    assert not forca['lift'].equals(so_globais['lift'].reindex(forca.index))
+
+
+@pytest.fixture
+def pasta_fontes(tmp_path, monkeypatch):
+    """Cópia das fontes em uma pasta temporária, para regravar os CSVs."""
+    for caminho in dl.FONTES.values():
+        destino = tmp_path / caminho
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(os.path.join(RAIZ, caminho), destino)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_consulta_seguinte_a_gravacao_usa_as_regras_novas(pasta_fontes):
+    servico = RecommendationService.load(recarga_na_consulta=True)
+    assert servico.recargas['atraso_maximo_s'] == 0
+    user_id = servico.modelo['recomendacoes']['user_id'].iloc[0]
+    antes = servico.recommendations(user_id)
+    regras = servico.modelo['rules']
+    assert len(regras) > 1
+
+    # Sem observador e sem esperar duas verificações: a próxima consulta já relê
+    write_csv_atomic(pd.read_csv(dl.FONTES['rules']).iloc[:0], dl.FONTES['rules'])
+    write_csv_atomic(dl.load_recommendations().iloc[:0], dl.FONTES['recomendacoes'])
+    depois = servico.recommendations(user_id)
+    assert servico.recargas['recargas'] == 1
+    assert servico.modelo['rules'].empty
+    assert not antes.empty and depois.empty
+
+    # Sem nova gravação, a consulta não relê nada
+    servico.recommendations(user_id)
+    assert servico.recargas['recargas'] == 1
+
+
+def test_sem_conferencia_na_consulta_o_atraso_e_do_observador(pasta_fontes):
+    servico = RecommendationService.load(recarga_na_consulta=False)
+    assert servico.recargas['atraso_maximo_s'] is None
+    user_id = servico.modelo['recomendacoes']['user_id'].iloc[0]
+
+    write_csv_atomic(pd.read_csv(dl.FONTES['rules']).iloc[:1], dl.FONTES['rules'])
+    servico.recommendations(user_id)
+    assert servico.recargas['recargas'] == 0
+
+    # Duas verificações seguidas com a mesma assinatura
+    assert servico.reload_changed() == []
+    assert servico.reload_changed() == ['rules']
+    assert len(servico.modelo['rules']) == 1
+
+    servico.start_watcher(intervalo=30)
+    try:
+        assert servico.recargas['atraso_maximo_s'] == 60
+    finally:
+        servico.stop_watcher()
+    assert servico.recargas['atraso_maximo_s'] is None
@@ -0,0 +1,61 @@
+import json
+import os
+
+import pandas as pd
+
+from conftest import RAIZ
+from utils import data_loader as dl
+from utils import rule_mining, streaming
+from utils.service import RecommendationService
+
+CESTAS = os.path.join(RAIZ, 'bases', 'cestas.csv')
+
+
+def test_contador_conta_cada_bloco_uma_vez(cestas, tmp_path, monkeypatch):
+    chamadas = []
+    contar = rule_mining.count_itemsets
+
+    def contar_registrando(bloco, *args):
+        chamadas.append(len(bloco))
+        return contar(bloco, *args)
+
+    monkeypatch.setattr(rule_mining, 'count_itemsets', contar_registrando)
+
+    contador = streaming.ItemsetCounter(pasta=tmp_path / 'contagens')
+    streaming.stream_baskets(CESTAS, [contador], chunksize=1000)
+
+    assert sum(chamadas) == len(cestas)
+    persistidas, n_cestas = rule_mining.load_itemset_counts(tmp_path / 'contagens')
+    assert n_cestas == contador.n_cestas == cestas['basket_id'].nunique()
+    assert persistidas == contador.contagens
+
+    # Uma única versão publicada, com um lote para o arquivo inteiro
+    pasta = tmp_path / 'contagens'
+    with open(pasta / 'manifesto.json', encoding='utf-8') as f:
+        manifesto = json.load(f)
+    assert manifesto['versao'] == 1 and len(manifesto['lotes']) == 1
+    assert sorted(os.listdir(pasta)) == ['manifesto.json', 'v1']
+    completa = tmp_path / 'completa'
+    rule_mining.update_itemset_counts(cestas, completa, contador.max_len)
+    for particao in manifesto['particoes']:
+        assert rule_mining.load_itemset_counts(pasta, [particao]) == \
+            rule_mining.load_itemset_counts(completa, [particao])
+
+    # O mesmo arquivo com outro tamanho de bloco é o mesmo lote: nada muda
+    streaming.stream_baskets(CESTAS, [streaming.ItemsetCounter(pasta=pasta)], chunksize=777)
+    with open(pasta / 'manifesto.json', encoding='utf-8') as f:
+        assert json.load(f) == manifesto
+
+
+def test_historico_do_painel_lido_das_particoes_parquet(produtos, tmp_path, monkeypatch):
+    pasta = str(tmp_path / 'historico')
+    streaming.stream_baskets(CESTAS, [streaming.ParquetHistoryWriter(pasta, produtos)], chunksize=1000)
+    assert not os.path.exists(pasta + '.tmp')
+
+    monkeypatch.chdir(RAIZ)
+    _, esperado, *_ = dl.load_real_data(usar_cache=False)
+    _, obtido, *_ = dl.load_real_data(pasta_historico=pasta)
+    pd.testing.assert_frame_equal(esperado, obtido)
+
+    servico = RecommendationService.load(pasta_historico=pasta)
+    assert sorted(servico.store.particoes) == sorted(nome.split('=', 1)[1] for nome in os.listdir(pasta))
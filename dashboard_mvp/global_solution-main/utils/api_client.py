@@ -0,0 +1,96 @@
+import json
+from urllib.error import HTTPError
+from urllib.parse import quote, urlencode
+from urllib.request import urlopen
+
+import pandas as pd
+
+from utils.service import MESES_PADRAO
+from utils.similarity import VIZINHOS_PADRAO
+
+# =============================================================================
+# CLIENTE DA API REST (api.py)
+# =============================================================================
+#
+# Mesmos métodos de utils/service.RecommendationService, respondidos pela
+# API. Usado pelo app.py quando RECOMENDAIAGRO_API_URL está definida.
+
+COLUNAS_HISTORICO = ['basket_id', 'user_id', 'timestamp', 'item_id', 'valor', 'categoria', 'data', 'item_desc']
+COLUNAS_CARTEIRA = [
+    'user_id', 'nome', 'cidade', 'uf', 'regiao', 'cluster', 'safra_principal', 'rec_id', 'lift', 'confianca',
+    'source_rec', 'rec_desc', 'ultima_compra', 'dias_sem_compra', 'ticket_medio', 'frequencia', 'valor_total',
+    'ultimo_mes', 'categoria_top', 'pontuacao',
+]
+COLUNAS_SIMILARES = {
+    'vizinhos': ['user_id', 'similaridade'],
+    'itens': ['item_id', 'clientes', 'participacao', 'comprado', 'item_desc'],
+}
+
+
+class RecommendationClient:
+    """Consultas do painel via HTTP (apenas biblioteca padrão)."""
+
+    def __init__(self, url_base, timeout=10):
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+
+    def _get(self, caminho, **parametros):
+        url = self.url_base + caminho
+        if parametros:
+            url += '?' + urlencode(parametros, doseq=True)  # Listas viram parâmetros repetidos
+        with urlopen(url, timeout=self.timeout) as resposta:
+            return json.loads(resposta.read().decode('utf-8'))
+
+    @staticmethod
+    def _caminho_cliente(user_id, recurso=''):
+        return f"/customers/{quote(str(user_id), safe='')}{recurso}"
+
+    def search_customers(self, busca='', pagina=0, por_pagina=50):
+        resposta = self._get('/customers', busca=busca, pagina=pagina, por_pagina=por_pagina)
+        return resposta['clientes'], resposta['total']
+
+    def customer(self, user_id):
+        try:
+            return self._get(self._caminho_cliente(user_id))
+        except HTTPError as erro:
+            if erro.code == 404:
+                return None
+            raise
+
+    def history(self, user_id, meses=MESES_PADRAO):
+        registros = self._get(self._caminho_cliente(user_id, '/history'), meses=meses)['historico']
+        historico = pd.DataFrame(registros) if registros else pd.DataFrame(columns=COLUNAS_HISTORICO)
+        historico['timestamp'] = pd.to_datetime(historico['timestamp'])
+        return historico
+
+    def recommendations(self, user_id, top_n=3):
+        registros = self._get(self._caminho_cliente(user_id, '/recommendations'), top_n=top_n)['recomendacoes']
+        return pd.DataFrame(registros)
+
+    def metrics(self, user_id):
+        resposta = self._get(self._caminho_cliente(user_id, '/metrics'))
+        abc = pd.DataFrame(resposta['abc'], columns=['categoria', 'valor', 'curva'])
+        evolucao = pd.DataFrame(resposta['evolucao'], columns=['data', 'valor'])
+        return resposta['metrics'], abc, evolucao
+
+    def similar_customers(self, user_id, k=VIZINHOS_PADRAO):
+        try:
+            resposta = self._get(self._caminho_cliente(user_id, '/similar'), k=k)
+        except HTTPError as erro:
+            if erro.code == 404:
+                return None
+            raise
+        return {
+            'total': resposta['total'],
+            **{chave: pd.DataFrame(resposta[chave], columns=colunas) for chave, colunas in COLUNAS_SIMILARES.items()},
+        }
+
+    def portfolio(self, filtros=None, pagina=0, por_pagina=50):
+        parametros = {coluna: valores for coluna, valores in (filtros or {}).items() if valores}
+        resposta = self._get('/portfolio', pagina=pagina, por_pagina=por_pagina, **parametros)
+        carteira = pd.DataFrame(resposta['carteira'], columns=COLUNAS_CARTEIRA)
+        carteira['ultima_compra'] = pd.to_datetime(carteira['ultima_compra'])
+        return carteira, resposta['total']
+
+    def portfolio_filters(self):
+        return self._get('/portfolio/filters')
@@ -0,0 +1,223 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import recommender
+from utils import rule_mining
+from utils.history_store import HistoryStore
+
+# =============================================================================
+# GERAÇÃO DO RECOMENDACOES.CSV EM LOTE
+# =============================================================================
+#
+# Mesmo pipeline do sistema_rec.ipynb (carregar, minerar, pontuar, completar
+# com os produtos de maior faturamento, juntar clientes/produtos e gravar),
+# sem precisar executar o notebook célula a célula. A pontuação é feita por
+# fatias de usuários em um pool de processos: cada fatia é um intervalo
+# contíguo de user_id ordenados, então concatenar as fatias na ordem já dá a
+# saída final, idêntica para qualquer número de processos.
+#
+# Com sazonal=True, cada cliente é pontuado com as regras da janela da sua
+# safra_principal no mês pontuado (rule_mining.compute_season_rules e
+# recommender.season_window); sem conjunto para a safra, valem as globais.
+
+COLUNAS_SAIDA = ['user_id', 'nome', 'documento', 'telefone', 'uf', 'cluster', 'rec_id', 'rec_desc', 'source_rec']
+N_RECOMENDACOES = 3
+
+
+def load_sources(caminho_cestas='bases/cestas.csv', caminho_clientes='bases/clientes.csv',
+                 caminho_produtos='bases/produtos.csv'):
+    """Lê cestas, clientes e produtos como na célula 'Coleta de dados' do notebook."""
+    return pd.read_csv(caminho_cestas), pd.read_csv(caminho_clientes), pd.read_csv(caminho_produtos)
+
+
+def top_revenue_products(cestas, n=N_RECOMENDACOES):
+    """item_id dos 'n' produtos de maior faturamento (top3_faturamento do notebook)."""
+    faturamento = cestas.groupby('item_id')['price'].sum()
+    return faturamento.sort_values(ascending=False, kind='mergesort').head(n).index.tolist()
+
+
+def fill_recommendations(recs, user_ids, fallback, n=N_RECOMENDACOES):
+    """
+    Versão vetorizada do completar_recomendacoes do notebook: mantém até 'n'
+    recomendações do Apriori por usuário (na ordem de 'recs') e completa as
+    vagas com os primeiros itens de 'fallback' (source_rec 'top products').
+    Usuários de 'user_ids' sem nenhuma recomendação recebem só o fallback.
+
+    Retorna user_id, rec e source_rec, ordenados por user_id.
+    """
+    apriori = pd.DataFrame({
+        'user_id': recs['user_id'].to_numpy(dtype=object),
+        'rec': recs['consequent'].to_numpy(dtype=object),
+        'source_rec': 'apriori',
+    })
+    apriori = apriori.groupby('user_id', sort=False).head(n)
+    apriori['ordem'] = apriori.groupby('user_id', sort=False).cumcount()
+
+    usuarios = pd.Index(pd.unique(np.concatenate([np.asarray(user_ids, dtype=object),
+                                                  apriori['user_id'].to_numpy()])))
+    usuarios = usuarios[usuarios.notna()]
+    faltam = n - apriori.groupby('user_id').size().reindex(usuarios, fill_value=0).to_numpy()
+
+    # Vaga k (k = 0..len(fallback)-1) preenchida para quem ainda precisa de mais de k itens
+    completar = []
+    for k, item in enumerate(fallback[:n]):
+        precisa = usuarios[faltam > k]
+        completar.append(pd.DataFrame({
+            'user_id': precisa.to_numpy(dtype=object),
+            'rec': item,
+            'source_rec': 'top products',
+            'ordem': n + k,
+        }))
+
+    preenchido = pd.concat([apriori, *completar], ignore_index=True)
+    preenchido = preenchido.sort_values(['user_id', 'ordem'], kind='mergesort')
+    return preenchido.drop(columns=['ordem']).reset_index(drop=True)
+
+
+def _pontuar_fatia(argumentos):
+    """Pontua e completa uma fatia de usuários (executada nos processos do pool)."""
+    cestas_fatia, regras, janelas, user_ids, fallback, ano, mes = argumentos
+    if janelas is None:
+        recs = recommender.recommend_for_users(cestas_fatia, regras[None], ano=ano, mes=mes)
+    else:
+        # Um conjunto de regras por janela; cada usuário está em uma só parte
+        janela_linha = cestas_fatia['user_id'].astype(object).map(janelas)
+        partes = []
+        for janela, regras_janela in regras.items():
+            selecionadas = janela_linha.isna() if janela is None else janela_linha == janela
+            parte = recommender.recommend_for_users(cestas_fatia[selecionadas.to_numpy()], regras_janela,
+                                                    ano=ano, mes=mes)
+            if len(parte) > 0:
+                partes.append(parte)
+        recs = (pd.concat(partes, ignore_index=True).sort_values('user_id', kind='mergesort') if partes
+                else pd.DataFrame(columns=recommender.COLUNAS_RECOMENDACOES))
+    return fill_recommendations(recs, user_ids, fallback)
+
+
+def score_users(cestas, rules, user_ids, fallback, workers=1, ano=2025, mes=12, regras_sazonais=None,
+                safras=None):
+    """
+    recommend_for_users + fill_recommendations para todos os usuários,
+    dividindo-os em 'workers' fatias contíguas (user_id ordenados).
+    A saída não depende do número de processos. 'cestas' pode ser um
+    HistoryStore (utils/history_store, timestamp já em datetime), que lê só a
+    partição do mês.
+
+    Com 'regras_sazonais' (compute_season_rules) e 'safras' (user_id ->
+    safra_principal), cada usuário usa o conjunto da sua janela no mês.
+    """
+    if isinstance(cestas, HistoryStore):
+        # Só a partição do mês é lida
+        cestas_mes = cestas.month(ano, mes)
+    else:
+        timestamps = pd.to_datetime(cestas['timestamp'], errors='coerce')
+        cestas_mes = cestas[(timestamps.dt.year == ano) & (timestamps.dt.month == mes)]
+
+    usuarios = pd.Index(pd.unique(np.concatenate([np.asarray(user_ids, dtype=object),
+                                                  cestas_mes['user_id'].to_numpy(dtype=object)])))
+    usuarios = np.sort(usuarios[usuarios.notna()].to_numpy())
+
+    regras, janelas = {None: rules}, None
+    if regras_sazonais is not None and len(regras_sazonais) > 0:
+        for janela, regras_janela in regras_sazonais.groupby('janela', sort=False):
+            regras[janela] = regras_janela.drop(columns=['janela']).reset_index(drop=True)
+        janelas = {
+            user_id: recommender.season_window(safra, mes, regras)
+            for user_id, safra in pd.Series(safras, dtype=object).items()
+        }
+
+    fatias = [f for f in np.array_split(usuarios, max(1, min(workers, len(usuarios)))) if len(f) > 0]
+    tarefas = [
+        (cestas_mes[cestas_mes['user_id'].isin(fatia)], regras,
+         None if janelas is None else {u: janelas.get(u) for u in fatia}, fatia, fallback, ano, mes)
+        for fatia in fatias
+    ]
+
+    if workers <= 1 or len(tarefas) <= 1:
+        resultados = [_pontuar_fatia(tarefa) for tarefa in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_pontuar_fatia, tarefas))
+
+    if not resultados:
+        return pd.DataFrame(columns=['user_id', 'rec', 'source_rec'])
+    return pd.concat(resultados, ignore_index=True)
+
+
+def build_output(preenchido, clientes, produtos):
+    """Junta clientes e produtos e seleciona as colunas do recomendacoes.csv."""
+    completo = preenchido.merge(clientes, on='user_id', how='left')
+    completo = completo.merge(produtos, left_on='rec', right_on='item_id', how='left')
+    return completo[['user_id', 'nome', 'documento', 'telefone', 'uf', 'cluster', 'item_id', 'item_desc',
+                     'source_rec']].rename(columns={'item_desc': 'rec_desc', 'item_id': 'rec_id'})
+
+
+def run_pipeline(caminho_saida='recomendacoes.csv', caminho_regras='regras_apriori.csv', min_support=0.01,
+                 top_regras=30, workers=1, ano=2025, mes=12, caminho_cestas='bases/cestas.csv',
+                 caminho_clientes='bases/clientes.csv', caminho_produtos='bases/produtos.csv',
+                 top_k=False, max_len=None, cotas=None, ordem_regras='lift', max_extensoes=None,
+                 sazonal=False, caminho_regras_sazonais='regras_sazonais.csv', caminho_safras='clientes_df.csv'):
+    """
+    Executa o pipeline completo e grava 'caminho_saida'. Retorna
+    (saída, tempos), com os segundos gastos em cada etapa.
+
+    Com top_k=True, as regras vêm de rule_mining.compute_top_rules (cotas
+    por item_class do consequente, max_len, ordem_regras, max_extensoes) e
+    as contagens de poda são impressas.
+
+    Com sazonal=True, também minera as regras por safra/entressafra das
+    safras dos clientes ('safra_principal' de 'caminho_safras' quando o
+    arquivo de clientes não a tem), grava 'caminho_regras_sazonais' e
+    pontua cada cliente com o conjunto da sua janela.
+    """
+    tempos = {}
+
+    inicio = time.perf_counter()
+    cestas, clientes, produtos = load_sources(caminho_cestas, caminho_clientes, caminho_produtos)
+    tempos['carregar'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    if top_k:
+        categorias = dict(zip(produtos['item_id'], produtos['item_class']))
+        rules, poda = rule_mining.compute_top_rules(cestas, min_support=min_support, top=top_regras, max_len=max_len,
+                                                    ordem=ordem_regras, cotas=cotas, categorias=categorias,
+                                                    max_extensoes=max_extensoes, caminho_saida=caminho_regras)
+        print('Poda das regras: ' + ', '.join(f'{chave}={valor:,}' for chave, valor in poda.items()))
+    else:
+        rules = rule_mining.compute_association_rules(cestas, min_support=min_support, top=top_regras,
+                                                      max_len=max_len, caminho_saida=caminho_regras)
+    regras_sazonais, safras = None, None
+    if sazonal:
+        if 'safra_principal' not in clientes.columns:
+            clientes_safra = pd.read_csv(caminho_safras, usecols=['user_id', 'safra_principal'])
+        else:
+            clientes_safra = clientes[['user_id', 'safra_principal']]
+        safras = clientes_safra.drop_duplicates('user_id').set_index('user_id')['safra_principal']
+        # Regras por safra sempre com max_len limitado (rule_mining.compute_season_rules)
+        regras_sazonais = rule_mining.compute_season_rules(
+            cestas, sorted(safras.dropna().unique()), min_support=min_support, top=top_regras,
+            max_len=max_len if max_len is not None else rule_mining.MAX_LEN_CONTAGENS,
+            caminho_saida=caminho_regras_sazonais
+        )
+        print(f"Regras por safra: {regras_sazonais['janela'].nunique()} janela(s), {len(regras_sazonais):,} regra(s)")
+    tempos['minerar'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    fallback = top_revenue_products(cestas)
+    preenchido = score_users(cestas, rules, clientes['user_id'], fallback, workers=workers, ano=ano, mes=mes,
+                             regras_sazonais=regras_sazonais, safras=safras)
+    tempos['pontuar'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    saida = build_output(preenchido, clientes, produtos)
+    tempos['juntar'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    # Troca atômica: o painel em execução recarrega o arquivo completo (service.reload_changed)
+    rule_mining.write_csv_atomic(saida, caminho_saida)
+    tempos['gravar'] = time.perf_counter() - inicio
+
+    return saida, tempos
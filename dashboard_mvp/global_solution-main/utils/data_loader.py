@@ -1,38 +1,143 @@
+import bisect
+import json
+import os
+import unicodedata
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import re # Necessário para a limpeza de strings no Apriori
+import re # Necessário para ler os frozensets das regras do Apriori
+from utils import recommender
+from utils import instrumentation
+from utils.history_store import read_parquet_months
 
 # =============================================================================
 # CARREGAMENTO DE DADOS
 # =============================================================================
 
-def load_real_data():
+# Fontes do painel (caminhos relativos à pasta do app)
+FONTES = {
+    'clientes': 'clientes_df.csv',
+    'historico': 'bases/cestas.csv',
+    'recomendacoes': 'recomendacoes.csv',
+    'produtos': 'bases/produtos.csv',
+    'rules': 'regras_apriori.csv',
+    'regras_sazonais': 'regras_sazonais.csv',
+}
+
+# Cache colunar (Feather) dos DataFrames já tipados e unidos
+PASTA_CACHE = '.cache_dados'
+VERSAO_CACHE = 2  # Incrementar sempre que o formato dos DataFrames mudar
+TABELAS_CACHE = ['clientes', 'historico', 'recomendacoes', 'produtos', 'rules', 'rule_items']
+
+# Lado do item na regra (coluna 'lado' de rule_items)
+LADO_ANTECEDENTE = 0
+LADO_CONSEQUENTE = 1
+
+
+@instrumentation.timed()
+def load_real_data(usar_cache=True, compacto=False, pasta_historico=None):
     """
     Carrega os dados dos CSVs e faz a união essencial (merge) para
     garantir que o histórico de compras tenha a coluna 'categoria'.
+    
+    Com usar_cache=True, os DataFrames prontos são lidos do cache colunar
+    em PASTA_CACHE, que só é refeito quando algum CSV de FONTES muda.
+    Sem pyarrow instalado, cai direto na leitura dos CSVs.
+    
+    Com pasta_historico, o histórico vem das partições mensais em Parquet
+    gravadas pela ingestão em blocos (streaming.ParquetHistoryWriter), sem
+    ler o cestas.csv; as demais fontes continuam vindo dos CSVs.
+    
+    Com compacto=True, o histórico é reduzido por compact_historico
+    (sem 'item_desc'; usar attach_item_desc apenas na exibição).
+    """
+    
+    if pasta_historico is not None:
+        clientes, recomendacoes, produtos, rules, rule_items = _ler_fontes()
+        historico = load_history_parquet(pasta_historico)
+    else:
+        dados = _ler_cache() if usar_cache else None
+        if dados is None:
+            dados = _ler_csvs()
+            if usar_cache:
+                _gravar_cache(dados)
+        clientes, historico, recomendacoes, produtos, rules, rule_items = dados
+    
+    if compacto:
+        historico = compact_historico(historico, clientes, produtos)
+    
+    # O índice por cliente fica a cargo de quem consulta (HistoryStore no
+    # painel; build_user_index para prepare_historico)
+    return clientes, historico, recomendacoes, produtos, rules, rule_items
+
+
+def _ler_csvs():
+    """
+    Lê e tipa os CSVs de FONTES e devolve os 6 DataFrames prontos
+    (clientes, historico, recomendacoes, produtos, rules, rule_items).
     """
     
-    # 1. Carregar clientes
-    clientes = pd.read_csv('clientes_df.csv')
+    clientes, recomendacoes, produtos, rules, rule_items = _ler_fontes()
     
-    # 2. Carregar histórico de compras
-    historico = pd.read_csv('bases/cestas.csv')
+    # Histórico de compras
+    historico = pd.read_csv(
+        FONTES['historico'],
+        dtype={'user_id': 'category', 'item_id': 'category', 'price': 'float32'}
+    )
     historico['timestamp'] = pd.to_datetime(historico['timestamp'], errors='coerce')
     
-    # 3. Carregar recomendações
-    recomendacoes = pd.read_csv('recomendacoes.csv')
+    # UNIÃO ESSENCIAL: Juntar histórico com produtos para trazer a 'item_class'
+    historico = historico.rename(columns={'price': 'valor'})
     
-    # 4. Carregar produtos
-    produtos = pd.read_csv('bases/produtos.csv') 
+    historico = historico.merge(
+        produtos[['item_id', 'item_class', 'item_desc']], 
+        on='item_id', 
+        how='left'
+    )
+    # Renomear para 'categoria' para que as outras funções do app.py funcionem
+    historico = historico.rename(columns={'item_class': 'categoria'}) 
     
-    # 5. Carregar Regras do Apriori
+    return clientes, _tipar_historico(historico), recomendacoes, produtos, rules, rule_items
+
+
+def _ler_fontes():
+    """Fontes além do histórico: (clientes, recomendacoes, produtos, rules, rule_items)."""
+    clientes = pd.read_csv(FONTES['clientes'])
+    recomendacoes = load_recommendations()
+    produtos = pd.read_csv(FONTES['produtos']) 
+    rules, rule_items = load_rules(produtos)
+    return clientes, recomendacoes, produtos, rules, rule_items
+
+
+def _tipar_historico(historico):
+    """IDs e categoria como categóricos, ordenado por cliente/data."""
+    historico[['user_id', 'item_id', 'categoria']] = historico[['user_id', 'item_id', 'categoria']].astype('category')
+    return historico.sort_values(['user_id', 'timestamp'], kind='mergesort').reset_index(drop=True)
+
+
+@instrumentation.timed()
+def load_history_parquet(pasta):
+    """
+    Histórico do painel a partir das partições mensais em Parquet de 'pasta'
+    (streaming.ParquetHistoryWriter), já com 'valor', 'categoria' e
+    'item_desc'; mesmos tipos e ordem do histórico lido do cestas.csv.
+    """
+    historico, _, _ = read_parquet_months(pasta)
+    return _tipar_historico(historico)
+
+
+def load_recommendations():
+    """Lê o recomendacoes.csv (recomendações em lote)."""
+    return pd.read_csv(FONTES['recomendacoes'])
+
+
+def load_rules(produtos):
+    """
+    Lê o regras_apriori.csv e devolve (rules, rule_items) de parse_rules.
+    Sem o arquivo, continua com uma tabela de regras vazia.
+    """
     try:
-        rules = pd.read_csv('regras_apriori.csv')
-        
-        # *** CORREÇÃO E LIMPEZA: Extrair o ID simples do item do frozenset string ***
-        # Usa regex para extrair 'item_X' de strings como "frozenset({'item_X'})"
-        rules['consequents'] = rules['consequents'].str.extract(r"'(item_\d+)'")
+        rules = pd.read_csv(FONTES['rules'])
         
         # Garantir que são numéricos
         rules['lift'] = pd.to_numeric(rules['lift'], errors='coerce')
@@ -40,21 +145,331 @@ def load_real_data():
         
     except FileNotFoundError:
         print("Aviso: regras_apriori.csv não encontrado. Continuando sem regras.")
-        rules = pd.DataFrame(columns=['consequents', 'lift', 'confidence', 'antecedents'])
+        rules = pd.DataFrame(columns=['antecedents', 'consequents', 'support', 'confidence', 'lift'])
     
-    # 6. UNIÃO ESSENCIAL: Juntar histórico com produtos para trazer a 'item_class'
-    historico = historico.rename(columns={'price': 'valor'})
+    # *** Normaliza os frozensets em texto ("frozenset({'item_1', 'item_2'})")
+    # uma única vez: tuplas de itens + tabela explodida com códigos inteiros ***
+    return parse_rules(rules, produtos)
+
+
+def load_season_rules():
+    """
+    Lê o regras_sazonais.csv (rule_mining.compute_season_rules), com a
+    coluna 'janela'. Sem o arquivo, só as regras globais são usadas.
+    """
+    try:
+        regras = pd.read_csv(FONTES['regras_sazonais'])
+    except FileNotFoundError:
+        return pd.DataFrame(columns=['janela', 'antecedents', 'consequents', 'support', 'confidence', 'lift'])
     
-    historico = historico.merge(
-        produtos[['item_id', 'item_class', 'item_desc']], 
-        on='item_id', 
-        how='left'
-    )
-    # Renomear para 'categoria' para que as outras funções do app.py funcionem
-    historico = historico.rename(columns={'item_class': 'categoria'}) 
+    for coluna in ('support', 'confidence', 'lift'):
+        regras[coluna] = pd.to_numeric(regras[coluna], errors='coerce')
+    return regras
+
+
+def parse_rules(rules, produtos=None):
+    """
+    Normaliza as regras do regras_apriori.csv: cada regra ganha um 'rule_id'
+    e 'antecedents'/'consequents' viram tuplas ordenadas de itens (todos os
+    itens, não só o primeiro). Retorna (rules, rule_items), sendo rule_items
+    a tabela explodida de explode_rule_items.
+    """
+    rules = rules.reset_index(drop=True)
+    rules = rules.drop(columns=['rule_id'], errors='ignore')
+    rules.insert(0, 'rule_id', np.arange(len(rules), dtype=np.int32))
     
-    # 7. Retorna todos os DataFrames (agora com 5 DFs)
-    return clientes, historico, recomendacoes, produtos, rules
+    for coluna in ('antecedents', 'consequents'):
+        rules[coluna] = [_parse_itemset(valor) for valor in rules[coluna]]
+    
+    return rules, explode_rule_items(rules, produtos)
+
+
+def _parse_itemset(valor):
+    """Tupla ordenada de itens a partir de frozenset, lista ou texto do CSV."""
+    if isinstance(valor, str):
+        itens = re.findall(r"'([^']*)'", valor)
+        if not itens and valor.strip() and not valor.startswith('frozenset'):
+            itens = [valor.strip()]
+        return tuple(sorted(itens))
+    if isinstance(valor, float) and np.isnan(valor):
+        return ()
+    return tuple(sorted(valor))
+
+
+def explode_rule_items(rules, produtos=None):
+    """
+    Tabela explodida regra x item: (rule_id, lado, item_id, item_code), com
+    lado = LADO_ANTECEDENTE/LADO_CONSEQUENTE e item_code = posição do item
+    em 'produtos' (a mesma tabela de lookup do modo compacto).
+    """
+    linhas = [
+        (rule_id, lado, item)
+        for rule_id, antecedente, consequente in zip(rules['rule_id'], rules['antecedents'], rules['consequents'])
+        for lado, itens in ((LADO_ANTECEDENTE, antecedente), (LADO_CONSEQUENTE, consequente))
+        for item in itens
+    ]
+    rule_items = pd.DataFrame(linhas, columns=['rule_id', 'lado', 'item_id'])
+    rule_items = rule_items.astype({'rule_id': np.int32, 'lado': np.int8, 'item_id': object})
+    
+    ids_lookup = produtos['item_id'] if produtos is not None else pd.Series(sorted(set(rule_items['item_id'])), dtype=object)
+    rule_items['item_id'] = _recodificar(rule_items['item_id'], ids_lookup)
+    rule_items['item_code'] = rule_items['item_id'].cat.codes.astype(np.int32)
+    
+    return rule_items
+
+
+def _itemsets_from_items(rules, rule_items):
+    """Reconstrói as tuplas 'antecedents'/'consequents' de rules a partir de rule_items."""
+    rules = rules.copy()
+    for posicao, (lado, coluna) in enumerate(((LADO_ANTECEDENTE, 'antecedents'), (LADO_CONSEQUENTE, 'consequents'))):
+        itens = {}
+        selecao = rule_items[rule_items['lado'] == lado]
+        for rule_id, item in zip(selecao['rule_id'], selecao['item_id'].astype(object)):
+            itens.setdefault(rule_id, []).append(item)
+        rules.insert(posicao + 1, coluna, [tuple(sorted(itens.get(r, ()))) for r in rules['rule_id']])
+    return rules
+
+
+def source_signature(nomes=None):
+    """
+    Tamanho e mtime de cada CSV de FONTES, ou só dos 'nomes' (None se o
+    arquivo não existir).
+    """
+    assinatura = {}
+    for nome in FONTES if nomes is None else nomes:
+        try:
+            info = os.stat(FONTES[nome])
+            assinatura[nome] = [info.st_size, info.st_mtime_ns]
+        except FileNotFoundError:
+            assinatura[nome] = None
+    return assinatura
+
+
+def _assinatura_fontes():
+    """Assinatura do cache colunar: versão do formato + source_signature."""
+    return {'versao': VERSAO_CACHE, **source_signature()}
+
+
+def _ler_cache():
+    """
+    Lê os DataFrames do cache colunar se ele existir e corresponder aos CSVs
+    atuais. Retorna None quando o cache precisa ser (re)construído.
+    """
+    try:
+        with open(os.path.join(PASTA_CACHE, 'manifesto.json'), encoding='utf-8') as f:
+            manifesto = json.load(f)
+        if manifesto != _assinatura_fontes():
+            return None
+        dados = {
+            nome: pd.read_feather(os.path.join(PASTA_CACHE, f'{nome}.feather'))
+            for nome in TABELAS_CACHE
+        }
+        # Tuplas não vão para o Feather: são refeitas a partir de rule_items
+        dados['rules'] = _itemsets_from_items(dados['rules'], dados['rule_items'])
+        return tuple(dados[nome] for nome in TABELAS_CACHE)
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def _gravar_cache(dados):
+    """
+    Grava os DataFrames em Feather. O manifesto é escrito por último, para
+    que uma gravação interrompida nunca seja lida como cache válido.
+    """
+    try:
+        os.makedirs(PASTA_CACHE, exist_ok=True)
+        manifesto = os.path.join(PASTA_CACHE, 'manifesto.json')
+        if os.path.exists(manifesto):
+            os.remove(manifesto)
+        
+        for nome, df in zip(TABELAS_CACHE, dados):
+            if nome == 'rules':
+                df = df.drop(columns=['antecedents', 'consequents'])
+            destino = os.path.join(PASTA_CACHE, f'{nome}.feather')
+            df.to_feather(destino + '.tmp')
+            os.replace(destino + '.tmp', destino)
+        
+        with open(manifesto + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(_assinatura_fontes(), f)
+        os.replace(manifesto + '.tmp', manifesto)
+    except (ImportError, OSError) as e:
+        print(f"Aviso: cache colunar não gravado ({e}). Continuando com os CSVs.")
+
+
+@instrumentation.timed()
+def build_user_index(historico_df):
+    """
+    Monta o índice {user_id: (inicio, fim)} com as posições de cada cliente
+    no histórico. Espera o DataFrame ordenado por ['user_id', 'timestamp'];
+    o 'fim' exclui as linhas sem data (NaT), que ficam no final de cada faixa.
+    """
+    if len(historico_df) == 0:
+        return {}
+    
+    user_ids = historico_df['user_id']
+    # Comparar códigos inteiros quando a coluna é categórica
+    user_ids = user_ids.cat.codes.to_numpy() if user_ids.dtype == 'category' else user_ids.to_numpy()
+    com_data = historico_df['timestamp'].notna().to_numpy()
+    
+    # Início de cada bloco de cliente = posição onde o user_id muda
+    inicios = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    validos = np.add.reduceat(com_data.astype(np.int64), inicios)
+    fins = inicios + validos
+    
+    chaves = historico_df['user_id'].to_numpy()[inicios].tolist()
+    return dict(zip(chaves, zip(inicios.tolist(), fins.tolist())))
+
+def compact_historico(historico, clientes, produtos):
+    """
+    Versão enxuta do histórico para bases grandes: IDs viram códigos
+    inteiros cujas tabelas de lookup seguem a ordem de 'clientes' e
+    'produtos', e a descrição do item (repetida em toda linha) é removida.
+    """
+    compacto = historico.drop(columns=['item_desc'], errors='ignore')
+    compacto['basket_id'] = compacto['basket_id'].astype('category')
+    compacto['user_id'] = _recodificar(compacto['user_id'], clientes['user_id'])
+    compacto['item_id'] = _recodificar(compacto['item_id'], produtos['item_id'])
+    compacto['categoria'] = compacto['categoria'].astype('category')
+    return compacto
+
+
+def _recodificar(coluna, ids_lookup):
+    """Categórica cujo código é a posição do ID em ids_lookup (extras no final)."""
+    coluna = coluna.astype('category')
+    categorias = pd.Index(ids_lookup.drop_duplicates())
+    extras = coluna.cat.categories.difference(categorias)
+    # set_categories (e não astype) para forçar a ordem: astype ignora a ordem
+    # das categorias quando o conjunto é o mesmo
+    return coluna.cat.set_categories(categorias.append(extras))
+
+
+@instrumentation.timed()
+def attach_item_desc(historico_cliente, produtos):
+    """
+    Junta 'item_desc' às linhas do histórico só na hora de exibir
+    (no modo compacto a coluna não fica guardada no histórico completo).
+    """
+    if 'item_desc' in historico_cliente.columns:
+        return historico_cliente
+    
+    descricoes = produtos.drop_duplicates('item_id').set_index('item_id')['item_desc']
+    historico_cliente = historico_cliente.copy()
+    historico_cliente['item_desc'] = historico_cliente['item_id'].astype(object).map(descricoes)
+    return historico_cliente
+
+
+def memory_report(historico_df):
+    """
+    Relatório de memória do histórico: total, bytes por linha de cesta
+    e bytes por coluna (memória profunda, incluindo strings e categorias).
+    """
+    por_coluna = historico_df.memory_usage(deep=True, index=False)
+    total = int(por_coluna.sum())
+    linhas = len(historico_df)
+    
+    return {
+        'linhas': linhas,
+        'bytes_total': total,
+        'bytes_por_linha': total / linhas if linhas > 0 else 0.0,
+        'bytes_por_coluna': {col: int(b) for col, b in por_coluna.items()},
+    }
+
+# =============================================================================
+# DIRETÓRIO DE CLIENTES
+# =============================================================================
+
+# Campos indexados para a busca do seletor de clientes
+CAMPOS_BUSCA = ['nome', 'documento', 'cidade']
+
+
+def _normalizar_termo(texto):
+    """Minúsculas, sem acentos e só com letras/dígitos ('154.171' -> '154171')."""
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in texto if c.isalnum() and not unicodedata.combining(c))
+
+
+@instrumentation.timed()
+def build_customer_directory(clientes_df):
+    """
+    Monta, uma única vez, o diretório de clientes do seletor:
+    
+    - 'ids': user_id na ordem de clientes_df;
+    - 'posicao': user_id -> posição (consulta O(1));
+    - 'registros': um dict por cliente (mesmas chaves das colunas);
+    - 'nomes': user_id -> nome, para o format_func do selectbox;
+    - 'termos'/'posicoes_termo': índice de prefixos ordenado, com as
+      palavras de nome e cidade e o documento só com dígitos.
+    """
+    ids = clientes_df['user_id'].tolist()
+    registros = clientes_df.to_dict('records')
+    
+    pares = set()
+    for pos, registro in enumerate(registros):
+        for campo in CAMPOS_BUSCA:
+            valor = registro.get(campo)
+            if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+                continue
+            for palavra in str(valor).split():
+                termo = _normalizar_termo(palavra)
+                if termo:
+                    pares.add((termo, pos))
+            # Documento/nome também inteiros, para buscas com espaços ou pontuação
+            termo = _normalizar_termo(valor)
+            if termo:
+                pares.add((termo, pos))
+    pares = sorted(pares)
+    
+    return {
+        'ids': ids,
+        'posicao': {user_id: pos for pos, user_id in enumerate(ids)},
+        'registros': registros,
+        'nomes': {registro['user_id']: registro.get('nome', registro['user_id']) for registro in registros},
+        'termos': [termo for termo, _ in pares],
+        'posicoes_termo': [pos for _, pos in pares],
+    }
+
+
+def get_customer(diretorio, user_id):
+    """Registro (dict) do cliente, sem varrer clientes_df. None se não existir."""
+    pos = diretorio['posicao'].get(user_id)
+    return None if pos is None else diretorio['registros'][pos]
+
+
+def _posicoes_prefixo(diretorio, prefixo):
+    """Posições dos clientes com algum termo começando por 'prefixo' (busca binária)."""
+    termos = diretorio['termos']
+    inicio = bisect.bisect_left(termos, prefixo)
+    fim = bisect.bisect_left(termos, prefixo + '\U0010ffff', inicio)
+    return set(diretorio['posicoes_termo'][inicio:fim])
+
+
+@instrumentation.timed()
+def search_customers(diretorio, busca='', pagina=0, por_pagina=50):
+    """
+    Busca por prefixo em nome, documento e cidade. Com várias palavras, o
+    cliente precisa casar com todas. Retorna (user_ids da página, total de
+    clientes encontrados), na ordem de clientes_df.
+    
+    Cada palavra custa uma busca binária no índice mais o tamanho do
+    resultado; a tabela de clientes nunca é percorrida.
+    """
+    palavras = [t for t in (_normalizar_termo(p) for p in str(busca).split()) if t]
+    
+    if not palavras:
+        total = len(diretorio['ids'])
+        inicio = pagina * por_pagina
+        return diretorio['ids'][inicio:inicio + por_pagina], total
+    
+    encontrados = None
+    for palavra in palavras:
+        posicoes = _posicoes_prefixo(diretorio, palavra)
+        encontrados = posicoes if encontrados is None else encontrados & posicoes
+        if not encontrados:
+            return [], 0
+    
+    encontrados = sorted(encontrados)
+    inicio = pagina * por_pagina
+    return [diretorio['ids'][pos] for pos in encontrados[inicio:inicio + por_pagina]], len(encontrados)
 
 # =============================================================================
 # PREPARAÇÃO DE DADOS
@@ -72,16 +487,26 @@ def enrich_customer_data(clientes_df):
     return clientes_df
 
 
-def prepare_historico(historico_df, user_id, meses=6):
+@instrumentation.timed()
+def prepare_historico(historico_df, user_id, meses=6, indice=None):
     """
     Filtra e prepara histórico de compras dos últimos N meses,
     mantendo as colunas originais para cálculo de métricas.
-    """
     
-    hist_cliente = historico_df[historico_df['user_id'] == user_id].copy()
+    Com o 'indice' de build_user_index, a janela do cliente é obtida por
+    fatiamento + busca binária na data, sem varrer o histórico inteiro.
+    """
     
     data_limite = datetime.now() - timedelta(days=meses*30)
-    hist_cliente = hist_cliente[hist_cliente['timestamp'] >= data_limite]
+    
+    if indice is not None:
+        inicio, fim = indice.get(user_id, (0, 0))
+        datas = historico_df['timestamp'].to_numpy()[inicio:fim]
+        corte = inicio + np.searchsorted(datas, pd.Timestamp(data_limite).to_datetime64(), side='left')
+        hist_cliente = historico_df.iloc[corte:fim].copy()
+    else:
+        hist_cliente = historico_df[historico_df['user_id'] == user_id].copy()
+        hist_cliente = hist_cliente[hist_cliente['timestamp'] >= data_limite]
     
     # Adicionar a coluna 'data' (Mês/Ano) para uso nos gráficos
     hist_cliente['data'] = hist_cliente['timestamp'].dt.to_period('M').astype(str)
@@ -90,11 +515,71 @@ def prepare_historico(historico_df, user_id, meses=6):
     return hist_cliente
 
 
-def prepare_recommendations(recs_df, rules_df, user_id, top_n=3):
+@instrumentation.timed()
+def prepare_recommendations(recs_df, rules_df, user_id, top_n=3, indice_regras=None, historico_cliente=None,
+                            rule_items=None):
     """
     Prepara recomendações e funde dados reais de Lift e Confidence.
+    
+    rule_items (de load_real_data) evita explodir as regras a cada chamada.
+    Com indice_regras (recommender.build_rule_index) e o historico_cliente
+    de prepare_historico, as recomendações são calculadas na hora a partir
+    das compras do cliente; o CSV em lote só completa as vagas restantes.
+    """
+    if indice_regras is None or historico_cliente is None:
+        return _prepare_batch_recommendations(recs_df, rules_df, user_id, top_n, rule_items=rule_items)
+    
+    ao_vivo = prepare_live_recommendations(indice_regras, historico_cliente, top_n)
+    if len(ao_vivo) >= top_n:
+        return ao_vivo
+    
+    lote = _prepare_batch_recommendations(recs_df, rules_df, user_id, top_n - len(ao_vivo),
+                                          excluir=ao_vivo['rec_id'], rule_items=rule_items)
+    if len(ao_vivo) == 0:
+        return lote
+    if len(lote) == 0:
+        return ao_vivo
+    return pd.concat([ao_vivo, lote], ignore_index=True)
+
+
+@instrumentation.timed()
+def prepare_live_recommendations(indice_regras, historico_cliente, top_n=3):
+    """
+    Recomendações calculadas na hora a partir dos itens comprados na janela
+    do cliente, consultando o índice de regras por antecedente.
+    """
+    recs = recommender.recommend_from_index(indice_regras, historico_cliente['item_id'].unique(), top_n)
+    produtos = indice_regras['produtos']
+    
+    linhas = []
+    for rec in recs:
+        desc, classe = produtos.get(rec['rec_id'], (rec['rec_id'], "Categoria Não Classificada"))
+        base = ', '.join(produtos.get(item, (item,))[0] for item in rec['antecedent'])
+        linhas.append({
+            'rec_id': rec['rec_id'],
+            'rec_desc': desc,
+            'item_desc': desc,
+            'item_class': classe,
+            'categoria': classe,
+            'lift': rec['lift'],
+            'confianca': rec['confidence'],
+            'razao': f"Correlação Apriori real ({rec['lift']:.1f}x) com base em {base}",
+            'source_rec': 'apriori',
+        })
+    
+    return pd.DataFrame(linhas, columns=[
+        'rec_id', 'rec_desc', 'item_desc', 'item_class', 'categoria',
+        'lift', 'confianca', 'razao', 'source_rec'
+    ])
+
+
+def _prepare_batch_recommendations(recs_df, rules_df, user_id, top_n=3, excluir=(), rule_items=None):
+    """
+    Recomendações do CSV em lote (recomendacoes.csv), com Lift e Confidence
+    reais das regras quando o item recomendado é consequente de alguma.
     """
-    recs_cliente = recs_df[recs_df['user_id'] == user_id].head(top_n).copy()
+    recs_cliente = recs_df[recs_df['user_id'] == user_id]
+    recs_cliente = recs_cliente[~recs_cliente['rec_id'].isin(excluir)].head(top_n).copy()
     
     # 1. GARANTE A EXISTÊNCIA DAS COLUNAS TEMPORÁRIAS (Fallback com valores randômicos)
     if len(recs_cliente) > 0:
@@ -110,18 +595,26 @@ def prepare_recommendations(recs_df, rules_df, user_id, top_n=3):
     # 2. Tentar fazer o MERGE com as regras reais (RULES)
     if rules_df is not None and len(rules_df) > 0 and 'lift' in rules_df.columns:
         
-        # 2.1. Preparar a tabela de regras (rules_df) com sufixos explícitos
-        rules_renomeado = rules_df[['consequents', 'lift', 'confidence', 'antecedents']].rename(
-            columns={'lift': 'lift_real', 'confidence': 'confidence_real'}, errors='ignore'
+        if rule_items is None:
+            rule_items = explode_rule_items(rules_df)
+        
+        # 2.1. Regras em que o item recomendado está no consequente (inclusive
+        # consequentes com vários itens), ficando com a de maior lift por item
+        consequentes = rule_items[
+            (rule_items['lado'] == LADO_CONSEQUENTE) & rule_items['item_id'].isin(recs_cliente['rec_id'])
+        ]
+        candidatas = consequentes[['rule_id']].assign(rec_id=consequentes['item_id'].astype(object)).join(
+            rules_df.set_index('rule_id')[['lift', 'confidence', 'antecedents']], on='rule_id'
+        )
+        rules_renomeado = (
+            candidatas.sort_values('lift', ascending=False, kind='mergesort')
+            .drop_duplicates('rec_id')
+            .drop(columns=['rule_id'])
+            .rename(columns={'lift': 'lift_real', 'confidence': 'confidence_real'})
         )
         
         # 2.2. Merge
-        recs_cliente = recs_cliente.merge(
-            rules_renomeado,
-            left_on='rec_id',
-            right_on='consequents',
-            how='left'
-        )
+        recs_cliente = recs_cliente.merge(rules_renomeado, on='rec_id', how='left')
         
         # 3. ATUALIZAR as colunas FINAIS ('lift' e 'confianca') - CORREÇÃO DE TYPO APLICADA
         
@@ -132,11 +625,13 @@ def prepare_recommendations(recs_df, rules_df, user_id, top_n=3):
         recs_cliente['confianca'] = recs_cliente['confidence_real'].combine_first(recs_cliente['confianca_simulado'])
 
         # 4. Atualiza a razão onde o Lift real foi usado
-        recs_cliente['razao'] = recs_cliente.apply(
-            lambda row: f"Correlação Apriori real ({row['lift']:.1f}x) com base em {row['antecedents']}"
-            if pd.notna(row['lift_real'])
-            else row['razao']
-            , axis=1)
+        recs_cliente['razao'] = [
+            f"Correlação Apriori real ({lift:.1f}x) com base em {', '.join(antecedentes)}"
+            if pd.notna(lift_real)
+            else razao
+            for lift, lift_real, antecedentes, razao in zip(
+                recs_cliente['lift'], recs_cliente['lift_real'], recs_cliente['antecedents'], recs_cliente['razao'])
+        ]
 
         # 5. Limpar colunas temporárias
         recs_cliente = recs_cliente.drop(columns=[col for col in recs_cliente.columns if col.endswith(('_simulado', '_real', 'consequents', 'antecedents'))], errors='ignore')
@@ -147,6 +642,7 @@ def prepare_recommendations(recs_df, rules_df, user_id, top_n=3):
 # CÁLCULO DE MÉTRICAS
 # =============================================================================
 
+@instrumentation.timed()
 def calculate_commercial_metrics(historico_cliente):
     """
     Calcula métricas de perfil comercial
@@ -156,8 +652,298 @@ def calculate_commercial_metrics(historico_cliente):
         'ticket_medio': historico_cliente['valor'].mean() if len(historico_cliente) > 0 else 0,
         'frequencia': len(historico_cliente),
         'valor_total': historico_cliente['valor'].sum(),
-        'categoria_top': historico_cliente.groupby('categoria')['valor'].sum().idxmax() if 'categoria' in historico_cliente.columns and len(historico_cliente) > 0 else 'N/A',
+        'categoria_top': historico_cliente.groupby('categoria', observed=True)['valor'].sum().idxmax() if 'categoria' in historico_cliente.columns and len(historico_cliente) > 0 else 'N/A',
         'ultimo_mes': historico_cliente[historico_cliente['timestamp'] >= datetime.now() - timedelta(days=30)]['valor'].sum()
     }
     
-    return metrics
\ No newline at end of file
+    return metrics
+
+@instrumentation.timed()
+def build_metrics_table(historico_df, meses=6, agora=None):
+    """
+    Pré-calcula, para todos os clientes de uma vez, as métricas do painel
+    sobre a mesma janela de prepare_historico (últimos 'meses'):
+    
+    - 'resumo': ticket_medio, frequencia, valor_total, categoria_top e
+      ultimo_mes, indexado por user_id (mesmo conteúdo de
+      calculate_commercial_metrics);
+    - 'abc': curva ABC de categorias (mesmo conteúdo de calcular_abc);
+    - 'evolucao': valor por mês ('data' = 'AAAA-MM').
+    
+    'abc' e 'evolucao' ficam ordenadas por cliente, com as faixas de cada
+    um em 'indice_abc'/'indice_evolucao' (como em build_user_index). Com
+    isso, a renderização de uma página vira só uma consulta (lookup_metrics).
+    """
+    agora = datetime.now() if agora is None else agora
+    data_limite = agora - timedelta(days=meses*30)
+    
+    janela = historico_df.loc[
+        historico_df['timestamp'] >= data_limite, ['user_id', 'timestamp', 'categoria', 'valor']
+    ]
+    janela = janela.assign(
+        user_id=janela['user_id'].astype(object),
+        categoria=janela['categoria'].astype(object),
+        valor=janela['valor'].astype('float64'),
+    )
+    
+    # 1. Resumo por cliente (uma passada agrupada)
+    resumo = janela.groupby('user_id').agg(
+        ticket_medio=('valor', 'mean'),
+        frequencia=('valor', 'size'),
+        valor_total=('valor', 'sum'),
+    )
+    recentes = janela[janela['timestamp'] >= agora - timedelta(days=30)]
+    resumo['ultimo_mes'] = recentes.groupby('user_id')['valor'].sum().reindex(resumo.index, fill_value=0.0)
+    
+    # 2. Valor por cliente x categoria: categoria top e curva ABC
+    por_categoria = janela.groupby(['user_id', 'categoria'])['valor'].sum().reset_index()
+    por_categoria = por_categoria.sort_values(['user_id', 'valor'], ascending=[True, False], kind='mergesort')
+    resumo['categoria_top'] = por_categoria.drop_duplicates('user_id').set_index('user_id')['categoria']
+    
+    total_cliente = por_categoria.groupby('user_id')['valor'].transform('sum')
+    percentual = (por_categoria['valor'] / total_cliente * 100).groupby(por_categoria['user_id']).cumsum()
+    abc = por_categoria.assign(curva=np.select([percentual <= 80, percentual <= 95], ['A', 'B'], 'C'))
+    abc = abc.reset_index(drop=True)
+    
+    # 3. Evolução mensal
+    evolucao = janela.assign(data=janela['timestamp'].dt.to_period('M').astype(str))
+    evolucao = evolucao.groupby(['user_id', 'data'])['valor'].sum().reset_index()
+    
+    return {
+        'meses': meses,
+        'agora': agora,
+        'resumo': resumo,
+        'abc': abc,
+        'indice_abc': _faixas_por_cliente(abc['user_id']),
+        'evolucao': evolucao,
+        'indice_evolucao': _faixas_por_cliente(evolucao['user_id']),
+    }
+
+
+def _faixas_por_cliente(user_ids):
+    """{user_id: (inicio, fim)} de uma coluna já ordenada por cliente."""
+    if len(user_ids) == 0:
+        return {}
+    valores = user_ids.to_numpy()
+    inicios = np.flatnonzero(np.r_[True, valores[1:] != valores[:-1]])
+    fins = np.r_[inicios[1:], len(valores)]
+    return dict(zip(valores[inicios].tolist(), zip(inicios.tolist(), fins.tolist())))
+
+
+@instrumentation.timed()
+def lookup_metrics(tabela, user_id):
+    """
+    Consulta a tabela de build_metrics_table. Retorna (metrics, abc,
+    evolucao): o dict de calculate_commercial_metrics e os DataFrames da
+    curva ABC (categoria, valor, curva) e da evolução mensal (data, valor).
+    """
+    if user_id in tabela['resumo'].index:
+        linha = tabela['resumo'].loc[user_id]
+        metrics = {
+            'ticket_medio': linha['ticket_medio'],
+            'frequencia': int(linha['frequencia']),
+            'valor_total': linha['valor_total'],
+            'categoria_top': linha['categoria_top'],
+            'ultimo_mes': linha['ultimo_mes'],
+        }
+    else:
+        metrics = {'ticket_medio': 0, 'frequencia': 0, 'valor_total': 0.0, 'categoria_top': 'N/A', 'ultimo_mes': 0.0}
+    
+    inicio, fim = tabela['indice_abc'].get(user_id, (0, 0))
+    abc = tabela['abc'].iloc[inicio:fim][['categoria', 'valor', 'curva']].reset_index(drop=True)
+    
+    inicio, fim = tabela['indice_evolucao'].get(user_id, (0, 0))
+    evolucao = tabela['evolucao'].iloc[inicio:fim][['data', 'valor']].reset_index(drop=True)
+    
+    return metrics, abc, evolucao
+
+
+# =============================================================================
+# CARTEIRA (PRÓXIMA MELHOR AÇÃO)
+# =============================================================================
+#
+# Ranking de todos os clientes de uma vez, para o vendedor decidir a quem
+# ligar primeiro: força da melhor recomendação (lift/confiança das regras),
+# recência da última compra e valor na janela das métricas. Tudo é calculado
+# em uma passada vetorizada; filtros e páginas são só seleções da tabela.
+
+FILTROS_CARTEIRA = ['cluster', 'uf', 'regiao', 'safra_principal']
+COLUNAS_CARTEIRA = ['user_id', 'nome', 'cidade', 'uf', 'regiao', 'cluster', 'safra_principal']
+
+# Pesos dos percentis que compõem a pontuação (0 a 100)
+PESOS_CARTEIRA = {'forca': 0.5, 'recencia': 0.25, 'valor': 0.25}
+
+
+@instrumentation.timed()
+def best_recommendation_per_customer(janela, recs_df, rules_df, rule_items, regras_sazonais=None,
+                                     janela_cliente=None):
+    """
+    Recomendação mais forte de cada cliente (maior lift, depois confiança),
+    com as mesmas fontes de prepare_recommendations:
+    
+    - na hora: regras cujo antecedente está todo nas compras da 'janela',
+      sem itens que o cliente já comprou;
+    - em lote: itens do recomendacoes.csv que são consequente de alguma
+      regra (os sem regra não têm lift real e ficam de fora).
+    
+    Com 'regras_sazonais' ({janela: (rules, rule_items)} de parse_rules) e
+    'janela_cliente' (dict user_id -> janela, de recommender.season_rule_window),
+    a parte na hora de cada cliente usa o conjunto da sua janela, como as
+    recomendações por cliente; sem janela, valem as regras globais.
+    
+    Retorna rec_id, lift, confianca e source_rec indexados por user_id.
+    """
+    colunas = ['rec_id', 'lift', 'confianca', 'source_rec']
+    regras_sazonais = regras_sazonais or {}
+    if (rules_df is None or len(rules_df) == 0) and not regras_sazonais:
+        return pd.DataFrame(columns=colunas, index=pd.Index([], name='user_id'))
+    
+    # 1. Na hora, com o conjunto de regras da janela de cada cliente
+    compras = pd.DataFrame({
+        'user_id': janela['user_id'].astype(object).to_numpy(),
+        'item_id': janela['item_id'].astype(object).to_numpy(),
+    }).drop_duplicates()
+    if janela_cliente is None or not regras_sazonais:
+        grupos = [(None, compras)]
+    else:
+        rotulo = compras['user_id'].map(janela_cliente).where(lambda j: j.isin(list(regras_sazonais)))
+        grupos = [(None, compras[rotulo.isna().to_numpy()])]
+        grupos += [(nome, grupo) for nome, grupo in compras.groupby(rotulo, sort=False)]
+    
+    ao_vivo = []
+    for nome, grupo in grupos:
+        regras_grupo, itens_grupo = (rules_df, rule_items) if nome is None else regras_sazonais[nome]
+        if regras_grupo is not None and len(regras_grupo) > 0 and len(grupo) > 0:
+            ao_vivo.append(_melhores_na_hora(grupo, regras_grupo, itens_grupo))
+    
+    # 2. Lote: melhor regra (globais) com o item recomendado no consequente
+    lote = None
+    if rules_df is not None and len(rules_df) > 0:
+        regras = rules_df.set_index('rule_id')[['lift', 'confidence']]
+        consequentes = _lados_regra(rule_items)[1]
+        melhor_por_item = (
+            consequentes.join(regras, on='rule_id')
+            .sort_values(['lift', 'confidence'], ascending=False, kind='mergesort')
+            .drop_duplicates('item_id')
+            .set_index('item_id')
+        )
+        lote = recs_df[['user_id', 'rec_id', 'source_rec']].join(
+            melhor_por_item[['lift', 'confidence']], on='rec_id', how='inner'
+        ).rename(columns={'confidence': 'confianca'})[['user_id', 'rec_id', 'lift', 'confianca', 'source_rec']]
+    
+    # 3. A mais forte por cliente (empate: a da hora vem antes)
+    candidatas = [parte for parte in ao_vivo + [lote] if parte is not None]
+    if not candidatas:
+        return pd.DataFrame(columns=colunas, index=pd.Index([], name='user_id'))
+    candidatas = pd.concat(candidatas, ignore_index=True)
+    candidatas = candidatas.sort_values(['lift', 'confianca'], ascending=False, kind='mergesort')
+    return candidatas.drop_duplicates('user_id').set_index('user_id')[colunas]
+
+
+def _lados_regra(rule_items):
+    """(antecedentes, consequentes) de rule_items, com rule_id e item_id (object)."""
+    itens = rule_items.assign(item_id=rule_items['item_id'].astype(object))
+    return (itens.loc[itens['lado'] == LADO_ANTECEDENTE, ['rule_id', 'item_id']],
+            itens.loc[itens['lado'] == LADO_CONSEQUENTE, ['rule_id', 'item_id']])
+
+
+def _melhores_na_hora(compras, rules_df, rule_items):
+    """Candidatas na hora (user_id, rec_id, lift, confianca, source_rec) das 'compras' com 'rules_df'."""
+    regras = rules_df.set_index('rule_id')[['lift', 'confidence']]
+    antecedentes, consequentes = _lados_regra(rule_items)
+    
+    # Quantos itens do antecedente cada cliente comprou, por regra
+    casadas = compras.merge(antecedentes, on='item_id').groupby(['user_id', 'rule_id']).size().reset_index(name='n')
+    tamanho = antecedentes.groupby('rule_id').size()
+    casadas = casadas[casadas['n'].to_numpy() == tamanho.reindex(casadas['rule_id']).to_numpy()]
+    
+    ao_vivo = casadas[['user_id', 'rule_id']].merge(consequentes, on='rule_id')
+    ao_vivo = ao_vivo.merge(compras.assign(comprado=True), on=['user_id', 'item_id'], how='left')
+    ao_vivo = ao_vivo[ao_vivo['comprado'].isna()].join(regras, on='rule_id')
+    return pd.DataFrame({
+        'user_id': ao_vivo['user_id'].to_numpy(),
+        'rec_id': ao_vivo['item_id'].to_numpy(),
+        'lift': ao_vivo['lift'].to_numpy(),
+        'confianca': ao_vivo['confidence'].to_numpy(),
+        'source_rec': 'apriori',
+    })
+
+
+def last_purchase(historico_df):
+    """Data da última compra de cada cliente (todo o histórico), indexada por user_id."""
+    ultima = historico_df.groupby('user_id', observed=True)['timestamp'].max()
+    ultima.index = ultima.index.astype(object)
+    return ultima
+
+
+@instrumentation.timed()
+def build_portfolio(clientes_df, resumo, forca, ultima_compra, agora=None, produtos=None):
+    """
+    Tabela da carteira, uma linha por cliente, da ação mais promissora para
+    a menos promissora:
+    
+    - cadastro (COLUNAS_CARTEIRA);
+    - melhor recomendação (best_recommendation_per_customer) e 'rec_desc';
+    - ultima_compra e dias_sem_compra;
+    - métricas do 'resumo' de build_metrics_table;
+    - pontuacao: média ponderada (PESOS_CARTEIRA) dos percentis de lift,
+      recência e valor_total, de 0 a 100.
+    """
+    agora = datetime.now() if agora is None else agora
+    
+    carteira = clientes_df[COLUNAS_CARTEIRA].drop_duplicates('user_id')
+    carteira = carteira.assign(user_id=carteira['user_id'].astype(object)).set_index('user_id')
+    carteira = carteira.join(forca[['rec_id', 'lift', 'confianca', 'source_rec']])
+    carteira = carteira.astype({'lift': float, 'confianca': float})
+    if produtos is not None:
+        descricoes = produtos.drop_duplicates('item_id').set_index('item_id')['item_desc']
+        carteira['rec_desc'] = carteira['rec_id'].map(descricoes)
+    else:
+        carteira['rec_desc'] = carteira['rec_id']
+    
+    carteira['ultima_compra'] = ultima_compra.reindex(carteira.index)
+    carteira['dias_sem_compra'] = (pd.Timestamp(agora) - carteira['ultima_compra']).dt.days
+    
+    metricas = resumo.reindex(carteira.index)
+    for coluna in ['ticket_medio', 'frequencia', 'valor_total', 'ultimo_mes']:
+        carteira[coluna] = metricas[coluna].fillna(0)
+    carteira['frequencia'] = carteira['frequencia'].astype(int)
+    carteira['categoria_top'] = metricas['categoria_top'].fillna('N/A')
+    
+    # Percentis (sem recomendação/compra = 0): maior lift, compra mais
+    # recente e maior valor na janela sobem na lista
+    percentis = {
+        'forca': carteira['lift'].rank(pct=True),
+        'recencia': (-carteira['dias_sem_compra']).rank(pct=True),
+        'valor': carteira['valor_total'].rank(pct=True),
+    }
+    pontuacao = sum(peso * percentis[nome].fillna(0) for nome, peso in PESOS_CARTEIRA.items())
+    carteira['pontuacao'] = (pontuacao * 100).round(1)
+    
+    carteira = carteira.rename_axis('user_id').reset_index()
+    return carteira.sort_values(['pontuacao', 'user_id'], ascending=[False, True], kind='mergesort').reset_index(drop=True)
+
+
+def filter_portfolio(carteira, filtros=None, pagina=0, por_pagina=50):
+    """
+    Página da carteira com os filtros {coluna: valor ou lista de valores}
+    (colunas de FILTROS_CARTEIRA; vazio = sem filtro). Retorna (página, total).
+    """
+    mascara = np.ones(len(carteira), dtype=bool)
+    for coluna, valores in (filtros or {}).items():
+        if coluna not in FILTROS_CARTEIRA:
+            raise ValueError(f"Filtro inválido: {coluna} (use {', '.join(FILTROS_CARTEIRA)})")
+        if valores is None or len(valores) == 0:
+            continue
+        if isinstance(valores, str):
+            valores = [valores]
+        mascara &= carteira[coluna].isin(valores).to_numpy()
+    
+    selecionados = np.flatnonzero(mascara)
+    inicio = pagina * por_pagina
+    return carteira.iloc[selecionados[inicio:inicio + por_pagina]].reset_index(drop=True), len(selecionados)
+
+
+def portfolio_filter_options(carteira):
+    """Valores disponíveis de cada filtro da carteira ({coluna: [valores]})."""
+    return {coluna: sorted(carteira[coluna].dropna().astype(str).unique()) for coluna in FILTROS_CARTEIRA}
@@ -0,0 +1,272 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils import instrumentation
+
+# =============================================================================
+# HISTÓRICO PARTICIONADO POR MÊS
+# =============================================================================
+#
+# O histórico fica em uma tabela ordenada por (mês, user_id, timestamp), e
+# cada mês ('AAAA-MM') é uma fatia contígua dela. Uma consulta por janela de
+# datas só toca os meses que a intersectam; apenas os meses das bordas
+# precisam de filtro de linha. Para consultas de um cliente há ainda a ordem
+# (cliente, timestamp) das linhas com data: a janela do cliente é uma busca
+# binária nessa fatia, sem percorrer os meses. No disco, cada mês é um
+# arquivo Parquet em pasta/mes=AAAA-MM/, e a leitura também pode se
+# restringir a uma janela.
+#
+# As estatísticas de poda (partições lidas/puladas, linhas lidas) ficam em
+# 'estatisticas' (acumuladas) e 'ultima_consulta'. Consultas de um cliente
+# vão pelo índice (cliente, timestamp) e não leem partição nenhuma: contam
+# em 'consultas_indice', com partições lidas e puladas iguais a zero.
+
+SEM_DATA = 'sem_data'
+MESES_SAFRA = {
+    'Jan': 1, 'Fev': 2, 'Mar': 3, 'Abr': 4, 'Mai': 5, 'Jun': 6,
+    'Jul': 7, 'Ago': 8, 'Set': 9, 'Out': 10, 'Nov': 11, 'Dez': 12,
+}
+
+
+def month_key(timestamps):
+    """Chave 'AAAA-MM' de cada data ('sem_data' para NaT)."""
+    periodos = pd.Series(pd.to_datetime(timestamps)).dt.to_period('M')
+    return periodos.astype(str).where(periodos.notna(), SEM_DATA).to_numpy(dtype=object)
+
+
+def _limites_mes(chave):
+    """(início, fim) do mês 'AAAA-MM', fim exclusivo."""
+    inicio = pd.Timestamp(chave + '-01')
+    return inicio, inicio + pd.offsets.MonthBegin(1)
+
+
+def safra_window(safra, ano):
+    """
+    Janela [início, fim) de uma safra no formato de 'safra_principal'
+    ('Set-Fev', 'Abr-Ago', ...) iniciada em 'ano'. Safras que viram o ano
+    terminam em ano + 1.
+    """
+    mes_inicio, mes_fim = (MESES_SAFRA[m.strip()] for m in safra.split('-'))
+    ano_fim = ano + 1 if mes_fim < mes_inicio else ano
+    inicio = pd.Timestamp(year=ano, month=mes_inicio, day=1)
+    return inicio, pd.Timestamp(year=ano_fim, month=mes_fim, day=1) + pd.offsets.MonthBegin(1)
+
+
+def safra_months(safra):
+    """Meses (1-12) de uma safra 'Set-Fev', em ordem a partir do início."""
+    mes_inicio, mes_fim = (MESES_SAFRA[m.strip()] for m in safra.split('-'))
+    return tuple((mes_inicio - 1 + k) % 12 + 1 for k in range((mes_fim - mes_inicio) % 12 + 1))
+
+
+def off_season(safra):
+    """Entressafra de 'safra', no mesmo formato ('Set-Fev' -> 'Mar-Ago'); None se a safra ocupa o ano todo."""
+    meses = safra_months(safra)
+    if len(meses) == 12:
+        return None
+    nomes = {numero: nome for nome, numero in MESES_SAFRA.items()}
+    return f'{nomes[meses[-1] % 12 + 1]}-{nomes[(meses[0] - 2) % 12 + 1]}'
+
+
+class HistoryStore:
+    """
+    Histórico particionado por mês, em memória. Funciona com qualquer tabela
+    com 'user_id' e 'timestamp' (histórico do painel ou cestas.csv).
+    """
+
+    def __init__(self, dados, particoes):
+        self.dados = dados
+        self.particoes = particoes  # mês -> (inicio, fim), em ordem de mês
+        # Limites [início, fim) de cada mês, para podar as partições sem laço em Python
+        self._meses = [mes for mes in particoes if mes != SEM_DATA]
+        limites = [_limites_mes(mes) for mes in self._meses]
+        self._inicio_mes = np.array([a.to_datetime64() for a, _ in limites], dtype='datetime64[ns]')
+        self._fim_mes = np.array([b.to_datetime64() for _, b in limites], dtype='datetime64[ns]')
+        # Posições das linhas com data em ordem (cliente, timestamp) e a faixa de cada cliente nelas
+        self._ordem_cliente, self._clientes = _indice_por_cliente(dados)
+        self.estatisticas = {'consultas': 0, 'consultas_indice': 0, 'particoes_lidas': 0, 'particoes_puladas': 0,
+                             'linhas_lidas': 0}
+        self.ultima_consulta = {}
+        self._trava = threading.Lock()  # Consultas concorrentes (API) somam nas mesmas estatísticas
+
+    @classmethod
+    def from_frame(cls, historico):
+        """Particiona um DataFrame (uma ordenação; as partições são fatias dele)."""
+        chaves = month_key(historico['timestamp'])
+        ordem = np.lexsort((
+            historico['timestamp'].to_numpy(),
+            _codigos(historico['user_id']),
+            chaves,
+        ))
+        dados = historico.iloc[ordem].reset_index(drop=True)
+        chaves = chaves[ordem]
+
+        particoes = {}
+        if len(dados) > 0:
+            inicios = np.flatnonzero(np.r_[True, chaves[1:] != chaves[:-1]])
+            fins = np.r_[inicios[1:], len(dados)]
+            for inicio, fim in zip(inicios.tolist(), fins.tolist()):
+                particoes[chaves[inicio]] = (inicio, fim)
+        return cls(dados, particoes)
+
+    @classmethod
+    def from_parquet(cls, pasta, inicio=None, fim=None):
+        """
+        Lê as partições de 'pasta' (write_parquet), só as dos meses que
+        intersectam [inicio, fim) quando informados. As partições puladas
+        ficam em ultima_consulta.
+        """
+        dados, lidas, puladas = read_parquet_months(pasta, inicio, fim)
+        loja = cls.from_frame(dados)
+        loja.ultima_consulta = {'tipo': 'particoes', 'particoes_lidas': lidas, 'particoes_puladas': puladas,
+                                'linhas_lidas': len(dados)}
+        return loja
+
+    def write_parquet(self, pasta):
+        """Grava um Parquet por mês em pasta/mes=AAAA-MM/parte.parquet."""
+        for mes, (inicio, fim) in self.particoes.items():
+            destino = os.path.join(pasta, f'mes={mes}')
+            os.makedirs(destino, exist_ok=True)
+            self.dados.iloc[inicio:fim].to_parquet(os.path.join(destino, 'parte.parquet'), index=False)
+
+    # -------------------------------------------------------------------------
+    # Consultas
+    # -------------------------------------------------------------------------
+
+    @instrumentation.timed('HistoryStore.window')
+    def window(self, inicio=None, fim=None, user_id=None):
+        """
+        Linhas com inicio <= timestamp < fim (None = sem limite), de todos
+        os clientes (em ordem de mês) ou só de 'user_id' (em ordem de data).
+        """
+        inicio = None if inicio is None else pd.Timestamp(inicio).to_datetime64()
+        fim = None if fim is None else pd.Timestamp(fim).to_datetime64()
+        timestamps = self.dados['timestamp'].to_numpy()
+
+        if user_id is not None:
+            # Um cliente: busca binária na sua fatia da ordem (cliente, timestamp), sem partições
+            c_inicio, c_fim = self._clientes.get(user_id, (0, 0))
+            do_cliente = self._ordem_cliente[c_inicio:c_fim]
+            datas = timestamps[do_cliente]
+            a = np.searchsorted(datas, inicio, 'left') if inicio is not None else 0
+            b = np.searchsorted(datas, fim, 'left') if fim is not None else len(datas)
+            self._registrar(0, b - a, indice=True)
+            return self.dados.take(do_cliente[a:b])
+
+        selecionadas = np.ones(len(self._meses), dtype=bool)
+        if inicio is not None:
+            selecionadas &= self._fim_mes > inicio
+        if fim is not None:
+            selecionadas &= self._inicio_mes < fim
+        lidas = int(selecionadas.sum())
+
+        posicoes, linhas = [], 0
+        for k in np.flatnonzero(selecionadas):
+            p_inicio, p_fim = self.particoes[self._meses[k]]
+            linhas += p_fim - p_inicio
+
+            # Borda da janela: corta por data
+            corta_inicio = inicio is not None and inicio > self._inicio_mes[k]
+            corta_fim = fim is not None and fim < self._fim_mes[k]
+            datas = timestamps[p_inicio:p_fim]
+            if corta_inicio or corta_fim:
+                mascara = np.ones(len(datas), dtype=bool)
+                if corta_inicio:
+                    mascara &= datas >= inicio
+                if corta_fim:
+                    mascara &= datas < fim
+                posicoes.append(p_inicio + np.flatnonzero(mascara))
+            else:
+                posicoes.append(np.arange(p_inicio, p_fim))
+
+        self._registrar(lidas, linhas)
+        # Uma única cópia das linhas selecionadas (take: cópia própria, sem SettingWithCopyWarning)
+        return self.dados.take(np.concatenate(posicoes) if posicoes else [])
+
+    def customer_history(self, user_id, meses=6, agora=None):
+        """Mesmo resultado de data_loader.prepare_historico (janela de 'meses' * 30 dias)."""
+        agora = datetime.now() if agora is None else agora
+        # window já devolve uma cópia: não copiar de novo
+        hist_cliente = self.window(inicio=agora - timedelta(days=meses*30), user_id=user_id)
+        hist_cliente['data'] = hist_cliente['timestamp'].dt.to_period('M').astype(str)
+        return hist_cliente
+
+    def month(self, ano, mes, user_id=None):
+        """Linhas de um mês (ex.: o mês pontuado pelo batch scoring)."""
+        inicio = pd.Timestamp(year=ano, month=mes, day=1)
+        return self.window(inicio, inicio + pd.offsets.MonthBegin(1), user_id)
+
+    def safra(self, safra, ano, user_id=None):
+        """Linhas de uma safra ('Set-Fev', ...) iniciada em 'ano'."""
+        return self.window(*safra_window(safra, ano), user_id=user_id)
+
+    def _registrar(self, lidas, linhas, indice=False):
+        """Estatísticas de uma consulta; indice=True: pelo índice por cliente, sem partições."""
+        consulta = {
+            'tipo': 'indice' if indice else 'particoes',
+            'particoes_lidas': lidas,
+            'particoes_puladas': 0 if indice else len(self._meses) - lidas,
+            'linhas_lidas': linhas,
+        }
+        with self._trava:
+            self.ultima_consulta = consulta
+            self.estatisticas['consultas'] += 1
+            self.estatisticas['consultas_indice'] += indice
+            for chave in ('particoes_lidas', 'particoes_puladas', 'linhas_lidas'):
+                self.estatisticas[chave] += consulta[chave]
+
+
+def read_parquet_months(pasta, inicio=None, fim=None):
+    """
+    Linhas das partições pasta/mes=AAAA-MM/parte.parquet (HistoryStore.write_parquet
+    ou streaming.ParquetHistoryWriter) dos meses que intersectam [inicio, fim),
+    sem particionar em memória. Sem janela, as linhas sem data também entram.
+    Retorna (dados, partições lidas, partições puladas).
+    """
+    meses = sorted(nome.split('=', 1)[1] for nome in os.listdir(pasta) if nome.startswith('mes='))
+    tudo = inicio is None and fim is None
+    selecionados = [m for m in meses if (tudo and m == SEM_DATA) or _mes_na_janela(m, inicio, fim)]
+    if selecionados:
+        partes = [pd.read_parquet(os.path.join(pasta, f'mes={m}', 'parte.parquet')) for m in selecionados]
+        dados = pd.concat(partes, ignore_index=True)
+    else:
+        dados = pd.DataFrame(columns=['user_id', 'timestamp'])
+    return dados, len(selecionados), len(meses) - len(selecionados)
+
+
+def _mes_na_janela(mes, inicio, fim):
+    """O mês 'AAAA-MM' intersecta [inicio, fim)? Linhas sem data nunca entram."""
+    if mes == SEM_DATA:
+        return False
+    mes_inicio, mes_fim = _limites_mes(mes)
+    return (inicio is None or mes_fim > pd.Timestamp(inicio)) and (fim is None or mes_inicio < pd.Timestamp(fim))
+
+
+def _codigos(user_ids):
+    """Códigos inteiros que preservam a ordem de user_id (categórico ou texto)."""
+    if isinstance(user_ids.dtype, pd.CategoricalDtype):
+        return user_ids.cat.codes.to_numpy()
+    return pd.factorize(user_ids.astype(object), sort=True)[0]
+
+
+def _indice_por_cliente(dados):
+    """
+    (ordem, {user_id: (inicio, fim)}): posições das linhas com data de
+    'dados' em ordem (cliente, timestamp) e a faixa de cada cliente em 'ordem'.
+    """
+    if len(dados) == 0:
+        return np.empty(0, dtype=np.int64), {}
+    timestamps = dados['timestamp'].to_numpy()
+    com_data = np.flatnonzero(~pd.isna(timestamps))
+    codigos = _codigos(dados['user_id'])[com_data]
+    ordem_local = np.lexsort((timestamps[com_data], codigos))
+    ordem, codigos = com_data[ordem_local], codigos[ordem_local]
+    if len(ordem) == 0:
+        return ordem, {}
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+    fins = np.r_[inicios[1:], len(codigos)]
+    valores = dados['user_id'].to_numpy()[ordem[inicios]]
+    return ordem, dict(zip(valores.tolist(), zip(inicios.tolist(), fins.tolist())))
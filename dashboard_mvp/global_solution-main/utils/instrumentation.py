@@ -0,0 +1,194 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+# =============================================================================
+# INSTRUMENTAÇÃO (TEMPOS E LINHAS POR EXECUÇÃO)
+# =============================================================================
+#
+# Mede as funções do caminho crítico (decorador 'timed') e as seções
+# do app.py ('section'), guardando, por execução (rerun do Streamlit ou
+# requisição da API), o tempo e o número de linhas de cada etapa. Os totais
+# acumulados podem ser exportados em texto no formato do Prometheus e cada
+# execução pode ser registrada como uma linha JSON no logger
+# 'recomendaiagro.metricas'.
+#
+# Desligada por padrão (RECOMENDAIAGRO_DEBUG=1 liga): nesse caso o decorador
+# só testa uma flag e chama a função original, e 'section' retorna de imediato.
+#
+# A execução em andamento fica em um ContextVar (não em threading.local): na
+# API, start_run/finish_run rodam no loop (middleware) e as rotas no pool de
+# threads, que recebe uma cópia do contexto da requisição. O estado é um
+# dict compartilhado entre essas cópias, então os registros feitos na thread
+# da rota aparecem na execução aberta pelo middleware.
+
+ATIVO = os.environ.get('RECOMENDAIAGRO_DEBUG') == '1'
+
+logger = logging.getLogger('recomendaiagro.metricas')
+if not logger.handlers:
+    # Uma linha JSON por execução no stderr (pode ser trocado pela aplicação)
+    _saida = logging.StreamHandler()
+    _saida.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_saida)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_execucao = contextvars.ContextVar('recomendaiagro_execucao', default=None)
+_trava = threading.Lock()
+_totais = {}  # (tipo, etapa) -> [chamadas, segundos, linhas]
+
+
+def enable(ativo=True):
+    """Liga/desliga a instrumentação em tempo de execução."""
+    global ATIVO
+    ATIVO = ativo
+
+
+def _linhas(resultado):
+    """Linhas do resultado: len de DataFrame/Series/list, soma das tabelas de uma tupla."""
+    if isinstance(resultado, (pd.DataFrame, pd.Series, list)):
+        return len(resultado)
+    if isinstance(resultado, tuple):
+        tabelas = [len(r) for r in resultado if isinstance(r, (pd.DataFrame, pd.Series))]
+        return sum(tabelas) if tabelas else None
+    return None
+
+
+def _registrar(tipo, etapa, segundos, linhas=None, nivel=0):
+    with _trava:
+        total = _totais.setdefault((tipo, etapa), [0, 0.0, 0])
+        total[0] += 1
+        total[1] += segundos
+        total[2] += linhas or 0
+
+    estado = _execucao.get()
+    if estado is not None:
+        estado['registros'].append({'tipo': tipo, 'etapa': etapa, 'ms': segundos * 1000, 'linhas': linhas, 'nivel': nivel})
+
+
+def timed(etapa=None):
+    """
+    Decorador: registra o tempo e as linhas devolvidas a cada chamada
+    (etapa = nome da função, por padrão).
+    """
+    def decorador(funcao):
+        nome = etapa or funcao.__name__
+
+        @functools.wraps(funcao)
+        def embrulho(*args, **kwargs):
+            if not ATIVO:
+                return funcao(*args, **kwargs)
+
+            estado = _execucao.get()
+            nivel = estado['nivel'] if estado is not None else 0
+            if estado is not None:
+                estado['nivel'] = nivel + 1
+            inicio = time.perf_counter()
+            try:
+                resultado = funcao(*args, **kwargs)
+            finally:
+                if estado is not None:
+                    estado['nivel'] = nivel
+            _registrar('funcao', nome, time.perf_counter() - inicio, _linhas(resultado), nivel)
+            return resultado
+
+        return embrulho
+
+    return decorador
+
+# =============================================================================
+# EXECUÇÕES E SEÇÕES
+# =============================================================================
+
+def start_run(nome=None):
+    """
+    Abre uma execução (um rerun/requisição) no contexto atual; 'nome' (ex.:
+    'GET /customers/{user_id}') vai na linha JSON de finish_run.
+    """
+    if not ATIVO:
+        return
+    _execucao.set({'nome': nome, 'registros': [], 'secao': None, 'nivel': 0, 'inicio': time.perf_counter()})
+
+
+def section(nome):
+    """
+    Marca o início de uma seção do app.py, encerrando a anterior. Evita
+    reindentar o código de cada seção dentro de um 'with'.
+    """
+    estado = _execucao.get()
+    if not ATIVO or estado is None:
+        return
+    agora = time.perf_counter()
+    anterior = estado['secao']
+    if anterior is not None:
+        _registrar('secao', anterior[0], agora - anterior[1])
+    estado['secao'] = (nome, agora) if nome is not None else None
+
+
+def finish_run():
+    """
+    Encerra a execução do contexto atual (e a última seção) e devolve seus
+    registros, também emitidos como uma linha JSON no logger.
+    """
+    estado = _execucao.get()
+    if not ATIVO or estado is None:
+        return []
+    section(None)
+    total = time.perf_counter() - estado['inicio']
+    _registrar('execucao', 'total', total)
+    _execucao.set(None)
+    linha = {'total_ms': total * 1000, 'etapas': estado['registros']}
+    if estado['nome'] is not None:
+        linha = {'execucao': estado['nome'], **linha}
+    logger.info(json.dumps(linha, ensure_ascii=False))
+    return estado['registros']
+
+# =============================================================================
+# EXPORTAÇÃO
+# =============================================================================
+
+def totals():
+    """Totais acumulados no processo: tipo, etapa, chamadas, segundos, linhas."""
+    with _trava:
+        itens = sorted((chave, list(valor)) for chave, valor in _totais.items())
+    return pd.DataFrame(
+        [(tipo, etapa, chamadas, segundos, linhas) for (tipo, etapa), (chamadas, segundos, linhas) in itens],
+        columns=['tipo', 'etapa', 'chamadas', 'segundos', 'linhas'],
+    )
+
+
+def prometheus_text():
+    """Totais acumulados no formato texto do Prometheus."""
+    def rotulos(tipo, etapa):
+        etapa = etapa.replace('\\', '\\\\').replace('"', '\\"')
+        return f'{{tipo="{tipo}",etapa="{etapa}"}}'
+
+    with _trava:
+        itens = sorted((chave, list(valor)) for chave, valor in _totais.items())
+
+    linhas = [
+        '# HELP recomendaiagro_etapa_segundos Tempo gasto por etapa (funções, seções do painel, execuções).',
+        '# TYPE recomendaiagro_etapa_segundos summary',
+    ]
+    for (tipo, etapa), (chamadas, segundos, _) in itens:
+        linhas.append(f'recomendaiagro_etapa_segundos_count{rotulos(tipo, etapa)} {chamadas}')
+        linhas.append(f'recomendaiagro_etapa_segundos_sum{rotulos(tipo, etapa)} {segundos:.6f}')
+    linhas += [
+        '# HELP recomendaiagro_etapa_linhas_total Linhas devolvidas por etapa.',
+        '# TYPE recomendaiagro_etapa_linhas_total counter',
+    ]
+    for (tipo, etapa), (_, _, total_linhas) in itens:
+        linhas.append(f'recomendaiagro_etapa_linhas_total{rotulos(tipo, etapa)} {total_linhas}')
+    return '\n'.join(linhas) + '\n'
+
+
+def reset():
+    """Zera os totais acumulados."""
+    with _trava:
+        _totais.clear()
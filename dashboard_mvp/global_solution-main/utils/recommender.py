@@ -0,0 +1,321 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import instrumentation
+from utils.history_store import off_season, safra_months
+
+# =============================================================================
+# RECOMENDAÇÃO EM LOTE (VETORIZADA)
+# =============================================================================
+#
+# Substitui o recommend_for_users do notebook, que percorre usuários x regras
+# em Python (iterrows + set.issubset). Aqui usuários, antecedentes e
+# consequentes viram tabelas de códigos inteiros e o casamento é feito com
+# junções/contagens em numpy, para todos os usuários de uma vez.
+
+COLUNAS_RECOMENDACOES = ['user_id', 'antecedent', 'consequent', 'support', 'confidence', 'lift']
+
+
+def _explodir(conjuntos, vocabulario):
+    """
+    Tabela (regra, posição, código do item) dos itens de cada conjunto,
+    em ordem alfabética dentro do conjunto.
+    """
+    regra, posicao, itens = [], [], []
+    for r, conjunto in enumerate(conjuntos):
+        for k, item in enumerate(sorted(conjunto)):
+            regra.append(r)
+            posicao.append(k)
+            itens.append(item)
+    codigos = vocabulario.get_indexer(pd.Index(itens, dtype=object))
+    return np.asarray(regra, dtype=np.int64), np.asarray(posicao, dtype=np.int64), codigos
+
+
+@instrumentation.timed()
+def recommend_for_users(df_baskets, rules, ano=2025, mes=12):
+    """
+    Para cada usuário com compras no mês (ano/mes), aplica as regras cujo
+    antecedente está contido nos itens comprados e recomenda os itens do
+    consequente que ele ainda não comprou, ficando com a regra de maior
+    lift por item (a primeira regra, na ordem de 'rules', em caso de empate).
+
+    Mesma saída do recommend_for_users do notebook, ordenada por user_id e
+    lift/confidence/support decrescentes. Empates exatos seguem a ordem das
+    regras e, dentro de uma regra, a ordem alfabética dos itens (no notebook
+    dependia da ordem de iteração de set).
+    """
+    timestamps = pd.to_datetime(df_baskets['timestamp'], errors='coerce')
+    df_mes = df_baskets[(timestamps.dt.year == ano) & (timestamps.dt.month == mes)]
+
+    if len(df_mes) == 0 or len(rules) == 0:
+        return pd.DataFrame(columns=COLUNAS_RECOMENDACOES)
+
+    antecedentes = [frozenset(a) for a in rules['antecedents']]
+    consequentes = [frozenset(c) for c in rules['consequents']]
+    lift = rules['lift'].to_numpy(dtype=float)
+    confianca = rules['confidence'].to_numpy(dtype=float)
+    suporte = rules['support'].to_numpy(dtype=float)
+    n_regras = len(rules)
+
+    # 1. Códigos inteiros para usuários e itens (histórico + regras)
+    pares = df_mes[['user_id', 'item_id']].drop_duplicates()
+    cod_usuario, usuarios = pd.factorize(pares['user_id'].astype(object), sort=True)
+    itens_regras = set().union(*antecedentes, *consequentes)
+    vocabulario = pd.Index(sorted(set(pares['item_id'].astype(object)) | itens_regras), dtype=object)
+    n_itens = len(vocabulario)
+    cod_item = vocabulario.get_indexer(pares['item_id'].astype(object))
+
+    # Chave única (usuário, item) das compras, para testar "já comprou"
+    compras = np.unique(cod_usuario.astype(np.int64) * n_itens + cod_item)
+
+    # 2. Usuário casa com a regra se possui todos os itens do antecedente:
+    # junta compras (usuário, item) com antecedentes (regra, item) pelo item
+    # e compara a contagem de itens em comum com o tamanho do antecedente
+    ant_regra, _, ant_item = _explodir(antecedentes, vocabulario)
+    tam_antecedente = np.bincount(ant_regra, minlength=n_regras)
+
+    ordem_ant = np.argsort(ant_item, kind='stable')
+    ant_item_ord, ant_regra_ord = ant_item[ordem_ant], ant_regra[ordem_ant]
+    inicio = np.searchsorted(ant_item_ord, cod_item, side='left')
+    fim = np.searchsorted(ant_item_ord, cod_item, side='right')
+    repeticoes = fim - inicio
+
+    usuario_par = np.repeat(cod_usuario, repeticoes).astype(np.int64)
+    deslocamento = np.arange(repeticoes.sum()) - np.repeat(np.cumsum(repeticoes) - repeticoes, repeticoes)
+    regra_par = ant_regra_ord[np.repeat(inicio, repeticoes) + deslocamento]
+
+    # Só os pares (usuário, regra) que ocorrem são contados (sem matriz
+    # usuários x regras), em ordem de (usuário, regra)
+    pares_ur, contagem = np.unique(usuario_par * n_regras + regra_par, return_counts=True)
+    casou = pares_ur[contagem == tam_antecedente[pares_ur % n_regras]]
+    # Antecedente vazio casa com todos os usuários, como set().issubset
+    vazias = np.flatnonzero(tam_antecedente == 0)
+    if len(vazias) > 0:
+        todos = (np.arange(len(usuarios), dtype=np.int64)[:, np.newaxis] * n_regras + vazias).ravel()
+        casou = np.sort(np.concatenate([casou, todos]))
+    casou_u, casou_r = casou // n_regras, casou % n_regras
+
+    if len(casou_u) == 0:
+        return pd.DataFrame(columns=COLUNAS_RECOMENDACOES)
+
+    # 3. Expande cada (usuário, regra) nos itens do consequente
+    con_regra, con_pos, con_item = _explodir(consequentes, vocabulario)
+    ordem_con = np.argsort(con_regra, kind='stable')
+    con_pos, con_item = con_pos[ordem_con], con_item[ordem_con]
+    inicio_con = np.searchsorted(con_regra[ordem_con], np.arange(n_regras + 1))
+    tam_con = np.diff(inicio_con)
+
+    repeticoes = tam_con[casou_r]
+    cand_usuario = np.repeat(casou_u, repeticoes).astype(np.int64)
+    cand_regra = np.repeat(casou_r, repeticoes)
+    deslocamento = np.arange(repeticoes.sum()) - np.repeat(np.cumsum(repeticoes) - repeticoes, repeticoes)
+    idx_con = inicio_con[cand_regra] + deslocamento
+    cand_item = con_item[idx_con]
+    cand_pos = con_pos[idx_con]
+
+    # Remove itens que o usuário já comprou
+    novo = ~np.isin(cand_usuario * n_itens + cand_item, compras)
+    cand_usuario, cand_regra, cand_item, cand_pos = (
+        cand_usuario[novo], cand_regra[novo], cand_item[novo], cand_pos[novo]
+    )
+
+    if len(cand_usuario) == 0:
+        return pd.DataFrame(columns=COLUNAS_RECOMENDACOES)
+
+    # 4. Melhor regra por (usuário, item): maior lift, primeira regra no empate
+    max_pos = int(tam_con.max())
+    primeira_aparicao = cand_regra * max_pos + cand_pos
+    chave = cand_usuario * n_itens + cand_item
+    ordem = np.lexsort((cand_regra, -lift[cand_regra], chave))
+    chave_ord = chave[ordem]
+    melhor = ordem[np.r_[True, chave_ord[1:] != chave_ord[:-1]]]
+
+    # Ordem em que o item apareceu pela primeira vez para o usuário
+    # (ordem de inserção no dict do notebook, usada como desempate)
+    _, inverso = np.unique(chave, return_inverse=True)
+    aparicao = np.full(inverso.max() + 1, np.iinfo(np.int64).max)
+    np.minimum.at(aparicao, inverso, primeira_aparicao)
+    aparicao_melhor = aparicao[inverso[melhor]]
+
+    u, r, i = cand_usuario[melhor], cand_regra[melhor], cand_item[melhor]
+    insercao = np.lexsort((aparicao_melhor, u))
+    u, r, i = u[insercao], r[insercao], i[insercao]
+
+    df_rec = pd.DataFrame({
+        'user_id': np.asarray(usuarios, dtype=object)[u],
+        'antecedent': [tuple(sorted(antecedentes[k])) for k in r],
+        'consequent': vocabulario.to_numpy()[i],
+        'support': suporte[r],
+        'confidence': confianca[r],
+        'lift': lift[r],
+    })
+
+    df_rec = df_rec.sort_values(
+        by=['user_id', 'lift', 'confidence', 'support'],
+        ascending=[True, False, False, False]
+    )
+
+    return df_rec
+
+
+# =============================================================================
+# RECOMENDAÇÃO EM TEMPO REAL (ÍNDICE POR ANTECEDENTE)
+# =============================================================================
+
+def _itens_regra(valor):
+    """Itens de um antecedente/consequente (frozenset, lista ou string do CSV)."""
+    if isinstance(valor, str):
+        if valor.startswith('frozenset'):
+            return re.findall(r"'([^']+)'", valor)
+        return [valor]
+    if isinstance(valor, float) and np.isnan(valor):
+        return []
+    return list(valor)
+
+
+@instrumentation.timed()
+def build_rule_index(rules, produtos=None):
+    """
+    Índice invertido item do antecedente -> posições das regras, com as regras
+    pré-ordenadas por lift/confidence/support (desc). Assim, a primeira regra
+    que casa com um item recomendado já é a de maior lift.
+
+    'produtos' (opcional) guarda descrição e classe dos itens para exibição.
+    """
+    regras, por_item, sem_antecedente = [], {}, []
+
+    if len(rules) > 0:
+        rules = rules.sort_values(['lift', 'confidence', 'support'], ascending=False, kind='mergesort')
+        for pos, (ant, con, lift, conf, sup) in enumerate(zip(
+                rules['antecedents'], rules['consequents'],
+                rules['lift'], rules['confidence'], rules['support'])):
+            antecedente = frozenset(_itens_regra(ant))
+            regras.append((antecedente, tuple(sorted(_itens_regra(con))), float(lift), float(conf), float(sup)))
+            for item in antecedente:
+                por_item.setdefault(item, []).append(pos)
+            if not antecedente:
+                sem_antecedente.append(pos)
+
+    descricoes = {}
+    if produtos is not None:
+        descricoes = dict(zip(produtos['item_id'], zip(produtos['item_desc'], produtos['item_class'])))
+
+    return {
+        'regras': regras,
+        'por_item': por_item,
+        'sem_antecedente': sem_antecedente,
+        'produtos': descricoes,
+    }
+
+
+@instrumentation.timed()
+def recommend_from_index(indice_regras, itens_cliente, top_n=3):
+    """
+    Recomenda até top_n itens para quem comprou 'itens_cliente', consultando
+    só as regras cujo antecedente contém algum desses itens. Retorna uma
+    lista de dicts (rec_id, antecedent, lift, confidence, support), por lift.
+    """
+    itens = set(itens_cliente)
+    regras = indice_regras['regras']
+
+    # Quantos itens do antecedente de cada regra o cliente possui
+    acertos = {}
+    for item in itens:
+        for pos in indice_regras['por_item'].get(item, ()):
+            acertos[pos] = acertos.get(pos, 0) + 1
+
+    casadas = [pos for pos, n in acertos.items() if n == len(regras[pos][0])]
+    casadas = sorted(casadas + indice_regras['sem_antecedente'])
+
+    recomendacoes = {}
+    for pos in casadas:
+        antecedente, consequente, lift, confianca, suporte = regras[pos]
+        for item in consequente:
+            if item in itens or item in recomendacoes:
+                continue
+            recomendacoes[item] = {
+                'rec_id': item,
+                'antecedent': tuple(sorted(antecedente)),
+                'lift': lift,
+                'confidence': confianca,
+                'support': suporte,
+            }
+        if len(recomendacoes) >= top_n:
+            break
+
+    return list(recomendacoes.values())[:top_n]
+
+
+# =============================================================================
+# ÍNDICES POR SAFRA
+# =============================================================================
+#
+# Um índice de regras (build_rule_index) por janela do regras_sazonais.csv
+# (rule_mining.compute_season_rules). Na safra do cliente vale o conjunto da
+# safra; fora dela, o da entressafra. A escolha (safra, mês) -> índice fica
+# pré-calculada, então a consulta é um acesso a dict.
+
+def season_window(safra, mes, janelas):
+    """
+    Janela de regras para quem tem 'safra' como safra principal no mês 'mes'
+    (1-12): a própria safra ou a entressafra, se estiver em 'janelas'.
+    None quando não há conjunto para o caso (usar as regras globais).
+    """
+    if not isinstance(safra, str):
+        return None
+    try:
+        janela = safra if mes in safra_months(safra) else off_season(safra)
+    except (KeyError, ValueError):
+        # Safra fora do formato 'Mmm-Mmm'
+        return None
+    return janela if janela in janelas else None
+
+
+@instrumentation.timed()
+def build_season_index(regras_sazonais, produtos=None, safras=None):
+    """
+    {'indices': {janela: índice de regras}, 'janelas': {(safra, mes): janela}}
+    a partir das regras com a coluna 'janela' (None = sem conjuntos).
+
+    A tabela (safra, mes) cobre as 'safras' informadas (ex.: as safra_principal
+    do cadastro) e, sempre, as janelas com regras e as suas entressafras: uma
+    safra cuja própria janela não gerou regras ainda usa o conjunto da
+    entressafra fora dela.
+    """
+    indices = {}
+    if regras_sazonais is not None and len(regras_sazonais) > 0:
+        for janela, regras in regras_sazonais.groupby('janela', sort=False):
+            indices[janela] = build_rule_index(regras, produtos)
+
+    conhecidas = set(s for s in (safras if safras is not None else ()) if isinstance(s, str))
+    for janela in indices:
+        conhecidas.add(janela)
+        try:
+            entressafra = off_season(janela)
+        except (KeyError, ValueError):
+            # Janela fora do formato 'Mmm-Mmm'
+            continue
+        if entressafra is not None:
+            conhecidas.add(entressafra)
+
+    janelas = {}
+    for safra in conhecidas:
+        for mes in range(1, 13):
+            janela = season_window(safra, mes, indices)
+            if janela is not None:
+                janelas[(safra, mes)] = janela
+
+    return {'indices': indices, 'janelas': janelas}
+
+
+def season_rule_window(indice_sazonal, safra, data):
+    """Janela de regras da safra do cliente na 'data', ou None (sem conjunto para a safra)."""
+    return indice_sazonal['janelas'].get((safra, data.month))
+
+
+def season_rule_index(indice_sazonal, safra, data):
+    """Índice de regras da safra do cliente na 'data', ou None (sem conjunto para a safra)."""
+    janela = season_rule_window(indice_sazonal, safra, data)
+    return None if janela is None else indice_sazonal['indices'][janela]
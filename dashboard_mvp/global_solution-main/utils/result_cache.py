@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# =============================================================================
+# CACHE DE RESULTADOS POR CLIENTE (LRU + TTL)
+# =============================================================================
+#
+# Guarda os resultados das consultas por cliente (histórico, recomendações,
+# métricas) de um processo, compartilhados entre as sessões do painel e as
+# requisições da API. Quem chama monta a chave com tudo o que muda o
+# resultado (user_id, meses, top_n, dia e versão dos dados), então uma
+# recarga dos CSVs/regras não reaproveita resultados antigos.
+#
+# Limites: número de entradas, memória estimada (memory_usage dos
+# DataFrames) e idade (TTL). Ao passar de um limite, as entradas menos usadas
+# recentemente saem primeiro. Os valores guardados são compartilhados e não
+# devem ser alterados por quem os recebe.
+
+MAX_MB_PADRAO = 64
+TTL_PADRAO = 600  # segundos
+MAX_ENTRADAS_PADRAO = 4096
+
+
+def estimate_size(valor):
+    """Bytes aproximados de um resultado (DataFrames/Series, tuplas, listas e dicts deles)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, (tuple, list)):
+        return sys.getsizeof(valor) + sum(estimate_size(v) for v in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(estimate_size(v) for v in valor.values())
+    return sys.getsizeof(valor)
+
+
+class ResultCache:
+    """Cache LRU com TTL e limite de memória, seguro entre threads."""
+
+    def __init__(self, max_mb=MAX_MB_PADRAO, ttl=TTL_PADRAO, max_entradas=MAX_ENTRADAS_PADRAO):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._itens = OrderedDict()  # chave -> (valor, criado_em, bytes), do menos ao mais recente
+        self._bytes = 0
+        self._trava = threading.Lock()
+        self.estatisticas = {'acertos': 0, 'faltas': 0, 'despejos': 0, 'expirados': 0, 'invalidacoes': 0}
+
+    def get_or_compute(self, chave, calcular):
+        """Valor de 'chave', calculando (fora da trava) e guardando em caso de falta."""
+        agora = time.monotonic()
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is not None:
+                if self.ttl is None or agora - item[1] < self.ttl:
+                    self._itens.move_to_end(chave)
+                    self.estatisticas['acertos'] += 1
+                    return item[0]
+                self._remover(chave)
+                self.estatisticas['expirados'] += 1
+            self.estatisticas['faltas'] += 1
+
+        # Duas threads podem calcular a mesma chave ao mesmo tempo; a segunda
+        # só substitui a primeira (mesmo resultado)
+        valor = calcular()
+        tamanho = estimate_size(valor)
+        if tamanho > self.max_bytes:
+            return valor
+
+        with self._trava:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, time.monotonic(), tamanho)
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes or len(self._itens) > self.max_entradas:
+                chave_antiga = next(iter(self._itens))
+                self._remover(chave_antiga)
+                self.estatisticas['despejos'] += 1
+        return valor
+
+    def clear(self):
+        """Descarta tudo (ex.: dados recarregados)."""
+        with self._trava:
+            self._itens.clear()
+            self._bytes = 0
+            self.estatisticas['invalidacoes'] += 1
+
+    def stats(self):
+        """Contadores, entradas e memória ocupada (MB)."""
+        with self._trava:
+            return {
+                **self.estatisticas,
+                'entradas': len(self._itens),
+                'mb': round(self._bytes / (1024 * 1024), 3),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 3),
+            }
+
+    def _remover(self, chave):
+        _, _, tamanho = self._itens.pop(chave)
+        self._bytes -= tamanho
@@ -0,0 +1,935 @@
+import hashlib
+import heapq
+import json
+import os
+import shutil
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from utils.history_store import off_season, safra_months
+
+# =============================================================================
+# MINERAÇÃO DE REGRAS DE ASSOCIAÇÃO (ECLAT COM BITSETS)
+# =============================================================================
+#
+# Substitui o caminho do notebook (TransactionEncoder + mlxtend.apriori), que
+# monta uma matriz booleana densa cestas x itens. Aqui cada item frequente
+# guarda apenas o bitset das cestas em que aparece (representação vertical),
+# e os itemsets são expandidos em profundidade por interseção de bitsets.
+# A saída segue o mesmo esquema do regras_apriori.csv.
+
+COLUNAS_REGRAS = [
+    'antecedents', 'consequents', 'antecedent support', 'consequent support',
+    'support', 'confidence', 'lift', 'leverage', 'conviction', 'zhangs_metric'
+]
+
+# Critérios de ordenação das regras (o primeiro é o usado na poda do top-k)
+ORDENS = {
+    'lift': ['lift', 'confidence', 'support'],
+    'confidence': ['confidence', 'lift', 'support'],
+}
+
+# Quantidade de bits 1 em cada byte (contagem de cestas de um bitset)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _contar(bits):
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def _contagem_minima(min_support, n_cestas):
+    """Menor contagem c com c / n_cestas >= min_support (mesma comparação do mlxtend)."""
+    if n_cestas == 0:
+        return 1
+    c = int(np.ceil(min_support * n_cestas))
+    while c > 1 and (c - 1) / n_cestas >= min_support:
+        c -= 1
+    while c / n_cestas < min_support:
+        c += 1
+    return max(c, 1)
+
+
+def prepare_transactions(cestas):
+    """
+    Monta a representação vertical das cestas: para cada item, o bitset
+    (np.packbits) das cestas que o contêm. Itens repetidos na mesma cesta
+    contam uma vez, como no TransactionEncoder.
+
+    Retorna (itens, bitsets, n_cestas), com 'itens' ordenado.
+    """
+    pares = cestas[['basket_id', 'item_id']].drop_duplicates()
+    cod_cesta, _ = pd.factorize(pares['basket_id'])
+    cod_item, itens = pd.factorize(pares['item_id'], sort=True)
+    n_cestas = int(cod_cesta.max()) + 1 if len(cod_cesta) > 0 else 0
+
+    bitsets = []
+    ordem = np.argsort(cod_item, kind='stable')
+    limites = np.searchsorted(cod_item[ordem], np.arange(len(itens) + 1))
+    for i in range(len(itens)):
+        presenca = np.zeros(n_cestas, dtype=bool)
+        presenca[cod_cesta[ordem[limites[i]:limites[i + 1]]]] = True
+        bitsets.append(np.packbits(presenca))
+
+    return np.asarray(itens, dtype=object), bitsets, n_cestas
+
+
+def mine_frequent_itemsets(itens, bitsets, n_cestas, min_support=0.01, max_len=None, max_extensoes=None,
+                           estatisticas=None):
+    """
+    Eclat: busca em profundidade dos itemsets com suporte >= min_support.
+
+    Com max_extensoes, cada itemset só é expandido com as 'max_extensoes'
+    extensões de maior contagem (busca em feixe, aproximada); as cortadas
+    são somadas em estatisticas['extensoes_cortadas'].
+
+    Retorna um dict {tuple(itens ordenados): contagem de cestas}.
+    """
+    min_count = _contagem_minima(min_support, n_cestas)
+    frequentes = {}
+    estatisticas = {} if estatisticas is None else estatisticas
+    estatisticas.setdefault('extensoes_cortadas', 0)
+
+    candidatos = []
+    for item, bits in zip(itens, bitsets):
+        contagem = _contar(bits)
+        if contagem >= min_count:
+            candidatos.append((item, bits, contagem))
+
+    _expandir((), candidatos, min_count, max_len, frequentes, max_extensoes, estatisticas)
+    return frequentes
+
+
+def _expandir(prefixo, candidatos, min_count, max_len, frequentes, max_extensoes=None, estatisticas=None):
+    for i, (item, bits, contagem) in enumerate(candidatos):
+        itemset = prefixo + (item,)
+        frequentes[itemset] = contagem
+
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+
+        extensoes = []
+        for outro, bits_outro, _ in candidatos[i + 1:]:
+            intersecao = bits & bits_outro
+            contagem_inter = _contar(intersecao)
+            if contagem_inter >= min_count:
+                extensoes.append((outro, intersecao, contagem_inter))
+
+        if max_extensoes is not None and len(extensoes) > max_extensoes:
+            # Feixe: as de maior contagem, mantendo a ordem dos itens
+            estatisticas['extensoes_cortadas'] += len(extensoes) - max_extensoes
+            maiores = sorted(range(len(extensoes)), key=lambda k: -extensoes[k][2])[:max_extensoes]
+            extensoes = [extensoes[k] for k in sorted(maiores)]
+
+        if extensoes:
+            _expandir(itemset, extensoes, min_count, max_len, frequentes, max_extensoes, estatisticas)
+
+
+def generate_rules(frequentes, n_cestas, min_lift=1.0):
+    """
+    Gera as regras A -> C de cada itemset frequente (todas as divisões em
+    antecedente/consequente), com as mesmas métricas do
+    mlxtend.association_rules, mantendo as de lift >= min_lift.
+    """
+    antecedentes, consequentes, s_a, s_c, s_ac = [], [], [], [], []
+
+    for itemset, contagem in frequentes.items():
+        if len(itemset) < 2:
+            continue
+        for mascara in range(1, (1 << len(itemset)) - 1):
+            ant = tuple(x for k, x in enumerate(itemset) if mascara >> k & 1)
+            con = tuple(x for k, x in enumerate(itemset) if not mascara >> k & 1)
+            antecedentes.append(frozenset(ant))
+            consequentes.append(frozenset(con))
+            s_a.append(frequentes[ant])
+            s_c.append(frequentes[con])
+            s_ac.append(contagem)
+
+    if not s_ac:
+        return pd.DataFrame(columns=COLUNAS_REGRAS)
+
+    regras = _tabela_regras(antecedentes, consequentes, s_a, s_c, s_ac, n_cestas)
+    return regras[regras['lift'] >= min_lift].reset_index(drop=True)
+
+
+def _tabela_regras(antecedentes, consequentes, s_a, s_c, s_ac, n_cestas):
+    """Regras com as métricas do mlxtend a partir das contagens de A, C e A∪C."""
+    s_a = np.asarray(s_a, dtype=float) / n_cestas
+    s_c = np.asarray(s_c, dtype=float) / n_cestas
+    s_ac = np.asarray(s_ac, dtype=float) / n_cestas
+
+    confianca = s_ac / s_a
+    lift = confianca / s_c
+    leverage = s_ac - s_a * s_c
+
+    conviccao = np.full(len(confianca), np.inf)
+    parcial = confianca < 1.0
+    conviccao[parcial] = (1.0 - s_c[parcial]) / (1.0 - confianca[parcial])
+
+    denominador = np.maximum(s_ac * (1 - s_a), s_a * (s_c - s_ac))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zhang = np.where(denominador == 0, 0, leverage / denominador)
+
+    return pd.DataFrame({
+        'antecedents': antecedentes,
+        'consequents': consequentes,
+        'antecedent support': s_a,
+        'consequent support': s_c,
+        'support': s_ac,
+        'confidence': confianca,
+        'lift': lift,
+        'leverage': leverage,
+        'conviction': conviccao,
+        'zhangs_metric': zhang,
+    })
+
+
+def compute_association_rules(cestas, min_support=0.01, top=20, max_len=None,
+                              caminho_saida='regras_apriori.csv'):
+    """
+    Pipeline completo equivalente ao do notebook (prepare_data_apriori +
+    compute_association_rules): minera, ordena por lift/confidence/support,
+    mantém as 'top' regras e grava o CSV (caminho_saida=None não grava).
+    """
+    itens, bitsets, n_cestas = prepare_transactions(cestas)
+    frequentes = mine_frequent_itemsets(itens, bitsets, n_cestas, min_support, max_len)
+    return _finalizar_regras(generate_rules(frequentes, n_cestas, min_lift=1.0), top, caminho_saida)
+
+
+def _finalizar_regras(rules, top, caminho_saida, ordem='lift'):
+    """Ordena por lift/confidence/support (ou ORDENS[ordem]), mantém as 'top' e grava o CSV."""
+    if len(rules) == 0:
+        return pd.DataFrame()
+
+    rules = rules.drop_duplicates(subset=['antecedents', 'consequents'])
+
+    rules = rules.sort_values(
+        by=ORDENS[ordem],
+        ascending=False
+    ).head(top)
+
+    if caminho_saida is not None:
+        write_csv_atomic(rules, caminho_saida)
+        print(f"Arquivo {caminho_saida} gerado com sucesso.")
+    return rules
+
+
+def write_csv_atomic(df, caminho):
+    """
+    Grava o CSV em um arquivo temporário e troca com os.replace: quem lê (a
+    recarga do painel) nunca vê um arquivo pela metade. Destinos que não são
+    arquivos comuns (ex.: os.devnull) são gravados direto.
+    """
+    if os.path.exists(caminho) and not os.path.isfile(caminho):
+        df.to_csv(caminho, index=False)
+        return
+    df.to_csv(caminho + '.tmp', index=False)
+    os.replace(caminho + '.tmp', caminho)
+
+
+# =============================================================================
+# TOP-K COM PODA (CATÁLOGOS GRANDES)
+# =============================================================================
+#
+# compute_association_rules gera todas as regras de todos os itemsets e só
+# depois ordena e corta nas 'top'. Aqui as regras são avaliadas direto das
+# contagens e só as que entram no top-k (um heap por categoria quando há
+# cotas) viram linhas da tabela. Um itemset J de contagem c só tem suas
+# divisões A -> C enumeradas se o limite superior das suas regras ainda puder
+# entrar no heap: como todo subconjunto próprio de J tem contagem >= m1 (a
+# menor contagem dos subconjuntos com um item a menos),
+#
+#     lift <= n * c / m1²      e      confidence <= c / m1
+#
+# (para pares, o lift exato). Os itemsets são visitados do maior para o menor
+# limite, então o limite de entrada do heap sobe rápido.
+#
+# Com max_len=2 e ordem por lift, nem a mineração por bitsets é necessária:
+# os pares que coocorrem são contados direto das linhas das cestas
+# (count_pairs), então os pares que nunca aparecem juntos, a maioria em um
+# catálogo grande, não são candidatos.
+#
+# Sem max_extensoes o resultado é o mesmo de compute_association_rules com o
+# mesmo max_len.
+
+CATEGORIA_MISTA = 'Misto'
+
+# Folga relativa dos limites (arredondamento de ponto flutuante)
+_FOLGA = 1e-12
+
+
+class _SelecaoTopK:
+    """Heaps do top-k: um só, ou um por categoria do consequente quando há cotas."""
+
+    def __init__(self, top, ordem='lift', cotas=None, categorias=None):
+        self.top = top
+        self.ordem = ordem
+        self.cotas = cotas
+        self.categorias = categorias or {}
+        self.heaps = {}
+
+    def categoria(self, itens):
+        """item_class dos itens (CATEGORIA_MISTA se forem de classes diferentes); None sem cotas."""
+        if not self.cotas:
+            return None
+        classes = {self.categorias.get(item) for item in itens}
+        return classes.pop() if len(classes) == 1 else CATEGORIA_MISTA
+
+    def possiveis(self, itemset):
+        """Categorias em que as regras de 'itemset' podem cair."""
+        if not self.cotas:
+            return {None}
+        classes = {self.categorias.get(item) for item in itemset}
+        if len(itemset) >= 3 and len(classes) > 1:
+            classes.add(CATEGORIA_MISTA)
+        return classes
+
+    def _capacidade(self, cat):
+        return min(self.cotas.get(cat, self.top), self.top) if self.cotas else self.top
+
+    def limite(self, cats):
+        """Menor critério principal que ainda entra em alguma das categorias 'cats'."""
+        menor = np.inf
+        for cat in cats:
+            capacidade = self._capacidade(cat)
+            if capacidade == 0:
+                continue
+            heap = self.heaps.get(cat, ())
+            menor = min(menor, heap[0][0][0] if len(heap) >= capacidade else -np.inf)
+        return menor
+
+    def oferecer(self, ant, con, c_a, c_c, c_ac, n_cestas, geracao):
+        """
+        Avalia a regra ant -> con; True se entrou no top-k. 'geracao' é a
+        posição da regra na ordem de generate_rules (posição do itemset em
+        'frequentes', máscara): nos empates do critério fica a gerada antes,
+        como na ordenação estável de compute_association_rules.
+        """
+        s_ac = c_ac / n_cestas
+        # Mesmas operações de _tabela_regras (mesma ordenação nos empates)
+        confianca = s_ac / (c_a / n_cestas)
+        lift = confianca / (c_c / n_cestas)
+        if lift < 1.0:
+            return False
+
+        chave = (lift, confianca, s_ac) if self.ordem == 'lift' else (confianca, lift, s_ac)
+        cat = self.categoria(con)
+        heap = self.heaps.setdefault(cat, [])
+        # Heap de mínimo: no empate, a gerada depois é a "menor" (sai primeiro)
+        entrada = (chave, tuple(-x for x in geracao), (ant, con, c_a, c_c, c_ac))
+        if len(heap) < self._capacidade(cat):
+            heapq.heappush(heap, entrada)
+            return True
+        if heap and entrada[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entrada)
+        # Na troca, a que saiu do heap é a descartada
+        return False
+
+    def tabela(self, n_cestas):
+        """Regras escolhidas no esquema de COLUNAS_REGRAS (+ 'categoria' com cotas)."""
+        # Em ordem de geração: a ordenação estável de _finalizar_regras desempata como a mineração completa
+        entradas = sorted((entrada for heap in self.heaps.values() for entrada in heap),
+                          key=lambda entrada: entrada[1], reverse=True)
+        escolhidas = [regra for _, _, regra in entradas]
+        if not escolhidas:
+            return pd.DataFrame(columns=COLUNAS_REGRAS)
+        ant, con, c_a, c_c, c_ac = zip(*escolhidas)
+        regras = _tabela_regras([frozenset(a) for a in ant], [frozenset(b) for b in con], c_a, c_c, c_ac, n_cestas)
+        if self.cotas:
+            regras['categoria'] = [self.categoria(b) for b in con]
+        return regras
+
+
+def top_rules(frequentes, n_cestas, top=30, ordem='lift', cotas=None, categorias=None, contar=None,
+              estatisticas=None):
+    """
+    As 'top' regras (A -> C) dos itemsets frequentes pela ordem ORDENS[ordem],
+    com lift >= 1.
+
+    cotas: {categoria: máximo de regras}, com a categoria da regra sendo a
+    item_class (categorias: {item_id: classe}) dos itens do consequente
+    (CATEGORIA_MISTA se forem de classes diferentes). Categorias fora de
+    'cotas' não têm limite próprio.
+
+    contar(itemset) é usado para subconjuntos ausentes de 'frequentes' (busca
+    em feixe). Preenche 'estatisticas' com itemsets, itemsets_podados
+    (itemsets frequentes de 2+ itens descartados pelo limite superior, sem
+    gerar regras) e regras_avaliadas.
+
+    Sem cotas, o resultado é o mesmo de compute_association_rules, inclusive
+    nos empates: a ordem de geração de generate_rules desempata o heap.
+    """
+    estatisticas = {} if estatisticas is None else estatisticas
+    selecao = _SelecaoTopK(top, ordem, cotas, categorias)
+    memo = dict(frequentes)
+
+    def contagem(itemset):
+        if itemset not in memo:
+            memo[itemset] = contar(itemset)
+        return memo[itemset]
+
+    # Limite superior do critério principal (e do lift) de cada itemset com 2+ itens
+    candidatos = []
+    for ordem_itemset, (itemset, c) in enumerate(frequentes.items()):
+        if len(itemset) < 2:
+            continue
+        subconjuntos = [contagem(itemset[:k] + itemset[k + 1:]) for k in range(len(itemset))]
+        m1 = min(subconjuntos)
+        # Pares: o limite do lift é o próprio lift (as duas divisões têm o mesmo)
+        teto_lift = n_cestas * c / (m1 * m1 if len(itemset) > 2 else subconjuntos[0] * subconjuntos[1])
+        teto = teto_lift if ordem == 'lift' else c / m1
+        candidatos.append((teto * (1 + _FOLGA), teto_lift * (1 + _FOLGA), itemset, c, ordem_itemset))
+    candidatos.sort(key=lambda x: -x[0])
+
+    avaliadas = podados = 0
+    for posicao, (teto, teto_lift, itemset, c, ordem_itemset) in enumerate(candidatos):
+        if teto_lift < 1.0 or teto < selecao.limite(selecao.possiveis(itemset)):
+            if not cotas and teto_lift >= 1.0:
+                # Um heap só e itemsets em ordem decrescente de limite: nenhum outro entra
+                podados += len(candidatos) - posicao
+                break
+            podados += 1
+            continue
+
+        for mascara in range(1, (1 << len(itemset)) - 1):
+            ant = tuple(x for k, x in enumerate(itemset) if mascara >> k & 1)
+            con = tuple(x for k, x in enumerate(itemset) if not mascara >> k & 1)
+            selecao.oferecer(ant, con, contagem(ant), contagem(con), c, n_cestas, (ordem_itemset, mascara))
+            avaliadas += 1
+
+    estatisticas.update({'itemsets': len(frequentes), 'itemsets_podados': podados, 'regras_avaliadas': avaliadas})
+    return selecao.tabela(n_cestas)
+
+
+def count_pairs(cestas):
+    """
+    Contagem exata dos pares de itens que aparecem juntos em alguma cesta,
+    direto das linhas (sem bitsets nem candidatos que nunca coocorrem).
+
+    Retorna (itens, contagem_item, par_a, par_b, contagem_par, n_cestas),
+    com par_a < par_b códigos em 'itens' (ordenado).
+    """
+    pares = cestas[['basket_id', 'item_id']].drop_duplicates()
+    cod_cesta, _ = pd.factorize(pares['basket_id'])
+    cod_item, itens = pd.factorize(pares['item_id'], sort=True)
+    n_cestas = int(cod_cesta.max()) + 1 if len(cod_cesta) > 0 else 0
+    contagem_item = np.bincount(cod_item, minlength=len(itens))
+
+    # Em ordem de (cesta, item), o par (i, i + d) é da mesma cesta se as cestas coincidem
+    ordem = np.lexsort((cod_item, cod_cesta))
+    cesta, item = cod_cesta[ordem], cod_item[ordem].astype(np.int64)
+    primeiros, segundos = [], []
+    deslocamento = 1
+    while deslocamento < len(cesta):
+        mesma = cesta[deslocamento:] == cesta[:-deslocamento]
+        if not mesma.any():
+            break
+        primeiros.append(item[:-deslocamento][mesma])
+        segundos.append(item[deslocamento:][mesma])
+        deslocamento += 1
+
+    codigos = (np.concatenate(primeiros) * len(itens) + np.concatenate(segundos)) if primeiros \
+        else np.empty(0, dtype=np.int64)
+    unicos, contagem_par = np.unique(codigos, return_counts=True)
+    return (np.asarray(itens, dtype=object), contagem_item, unicos // len(itens), unicos % len(itens),
+            contagem_par, n_cestas)
+
+
+def _top_pares(cestas, min_support, top, cotas, categorias, estatisticas):
+    """
+    Top-k por lift só de pares (max_len=2): os pares vêm de count_pairs e as
+    métricas de todas as regras a -> b são calculadas em vetor; só as
+    escolhidas viram linhas. As regras ficam na ordem de generate_rules
+    (pares em ordem de item, a -> b antes de b -> a), então a ordenação
+    estável desempata como compute_association_rules.
+
+    Em 'estatisticas', pares_podados são os pares possíveis descartados sem
+    gerar regras (sem coocorrência ou abaixo do suporte mínimo); não há
+    poda por limite superior como a de top_rules (itemsets_podados).
+    """
+    itens, contagem_item, par_a, par_b, contagem_par, n_cestas = count_pairs(cestas)
+    min_count = _contagem_minima(min_support, n_cestas)
+    n_frequentes = int((contagem_item >= min_count).sum())
+    coocorrentes = len(contagem_par)
+
+    manter = contagem_par >= min_count
+    par_a, par_b, contagem_par = par_a[manter], par_b[manter], contagem_par[manter]
+
+    # As duas direções de cada par, intercaladas (ordem de generate_rules); mesmas operações de _tabela_regras
+    ant = np.column_stack([par_a, par_b]).ravel()
+    con = np.column_stack([par_b, par_a]).ravel()
+    c_ac = np.repeat(contagem_par, 2)
+    s_ac = c_ac / n_cestas
+    confianca = s_ac / (contagem_item[ant] / n_cestas)
+    lift = confianca / (contagem_item[con] / n_cestas)
+
+    candidatas = pd.DataFrame({'ant': ant, 'con': con, 'c_ac': c_ac, 'lift': lift, 'confidence': confianca,
+                               'support': s_ac})
+    candidatas = candidatas[candidatas['lift'] >= 1.0]
+    candidatas = candidatas.sort_values(ORDENS['lift'], ascending=False, kind='mergesort')
+    if cotas:
+        categoria = pd.Series(itens[candidatas['con'].to_numpy()], index=candidatas.index).map(categorias)
+        limite = categoria.map(lambda cat: cotas.get(cat, top)).fillna(top)
+        candidatas = candidatas[candidatas.groupby(categoria, dropna=False).cumcount() < limite]
+    escolhidas = candidatas.head(top)
+
+    estatisticas.update({
+        'itens_frequentes': n_frequentes,
+        'pares_possiveis': len(itens) * (len(itens) - 1) // 2,
+        'pares_coocorrentes': coocorrentes,
+        'pares_frequentes': len(contagem_par),
+        'pares_podados': len(itens) * (len(itens) - 1) // 2 - len(contagem_par),
+        'regras_avaliadas': len(ant),
+    })
+    if len(escolhidas) == 0:
+        return pd.DataFrame(columns=COLUNAS_REGRAS)
+
+    a = escolhidas['ant'].to_numpy()
+    c = escolhidas['con'].to_numpy()
+    regras = _tabela_regras([frozenset([itens[k]]) for k in a], [frozenset([itens[k]]) for k in c],
+                            contagem_item[a], contagem_item[c], escolhidas['c_ac'].to_numpy(), n_cestas)
+    if cotas:
+        regras['categoria'] = [categorias.get(itens[k]) for k in c]
+    return regras
+
+
+def _contador_bitsets(itens, bitsets):
+    """contar(itemset) de top_rules: nº de cestas com todos os itens, pelos bitsets."""
+    bits_por_item = dict(zip(itens.tolist(), bitsets))
+
+    def contar(itemset):
+        bits = bits_por_item[itemset[0]]
+        for item in itemset[1:]:
+            bits = bits & bits_por_item[item]
+        return _contar(bits)
+
+    return contar
+
+
+def compute_top_rules(cestas, min_support=0.01, top=30, max_len=None, ordem='lift', cotas=None, categorias=None,
+                      max_extensoes=None, caminho_saida='regras_apriori.csv'):
+    """
+    Variante de compute_association_rules para catálogos grandes: gera só as
+    regras do top-k (top_rules), com cotas por categoria, minerando até
+    max_len itens e, com max_extensoes, em feixe (aproximado). Com max_len=2
+    e ordem='lift', os pares são contados direto das cestas (_top_pares).
+
+    Retorna (regras, estatisticas), com as contagens de poda de cada caminho:
+    pares_podados nos pares (_top_pares) e itemsets_podados nos demais
+    (top_rules).
+    """
+    estatisticas = {}
+
+    if max_len == 2 and ordem == 'lift' and max_extensoes is None:
+        regras = _top_pares(cestas, min_support, top, cotas, categorias or {}, estatisticas)
+    else:
+        itens, bitsets, n_cestas = prepare_transactions(cestas)
+        frequentes = mine_frequent_itemsets(itens, bitsets, n_cestas, min_support, max_len, max_extensoes,
+                                            estatisticas)
+        # Subconjuntos que o feixe não visitou: contagem direto dos bitsets
+        contar = _contador_bitsets(itens, bitsets) if max_extensoes is not None else None
+        regras = top_rules(frequentes, n_cestas, top, ordem, cotas, categorias, contar, estatisticas)
+
+    regras = _finalizar_regras(regras, top, caminho_saida, ordem)
+    estatisticas['regras'] = len(regras)
+    return regras, estatisticas
+
+
+# =============================================================================
+# MINERAÇÃO INCREMENTAL (CONTAGENS POR PARTIÇÃO MENSAL)
+# =============================================================================
+#
+# As cestas chegam em lotes diários append-only. Em vez de reminerar todo o
+# histórico, guardamos, por mês, a contagem exata das combinações de até
+# max_len itens de cada cesta. Somar as partições dá a contagem global de
+# qualquer itemset com até max_len itens, então as regras derivadas das
+# contagens somadas são as mesmas de uma mineração completa com o mesmo
+# max_len. max_len é obrigatório: sem limite, uma cesta de n itens geraria
+# 2^n combinações (uma de 30 itens, ~1e9).
+#
+# Cada lote deve trazer cestas completas (uma cesta não pode ser dividida
+# entre lotes), senão suas combinações seriam contadas separadamente.
+#
+# Gravação: cada atualização grava um diretório de versão novo (v<N>) com
+# todas as partições, e só a troca do manifesto.json a torna visível. Uma
+# falha no meio deixa a versão anterior intacta. O manifesto guarda os
+# identificadores dos lotes já aplicados (batch_id), então reaplicar o mesmo
+# lote não soma as contagens de novo.
+
+PASTA_CONTAGENS = '.cache_regras'
+MAX_LEN_CONTAGENS = 3
+
+
+def _validar_max_len(max_len):
+    if max_len is None or int(max_len) < 1:
+        raise ValueError(f'max_len deve ser um inteiro >= 1 nas contagens de itemsets, não {max_len!r}')
+    return int(max_len)
+
+
+def count_itemsets(cestas, max_len=MAX_LEN_CONTAGENS):
+    """
+    Conta as combinações de até max_len itens de cada cesta, por partição
+    mensal 'AAAA-MM' do timestamp da cesta ('sem_data' se inválido).
+
+    Retorna {particao: (n_cestas, Counter{tuple(itens ordenados): contagem})}.
+    """
+    max_len = _validar_max_len(max_len)
+    if len(cestas) == 0:
+        return {}
+
+    cod_cesta, _ = pd.factorize(cestas['basket_id'])
+    # sort=True: a ordem dos códigos é a ordem dos itens (itemsets ordenados)
+    cod_item, itens = pd.factorize(cestas['item_id'].astype(object), sort=True)
+    datas = pd.to_datetime(cestas['timestamp'], errors='coerce')
+    mes = (datas.dt.year * 100 + datas.dt.month).fillna(-1).astype(np.int64).to_numpy()
+
+    # Ordena por (cesta, item) e remove itens repetidos na mesma cesta
+    ordem = np.lexsort((cod_item, cod_cesta))
+    cesta_ord, item_ord, mes_ord = cod_cesta[ordem], cod_item[ordem], mes[ordem]
+    manter = np.r_[True, (cesta_ord[1:] != cesta_ord[:-1]) | (item_ord[1:] != item_ord[:-1])]
+    cesta_ord, item_ord, mes_ord = cesta_ord[manter], item_ord[manter], mes_ord[manter]
+
+    inicios = np.flatnonzero(np.r_[True, cesta_ord[1:] != cesta_ord[:-1]])
+    fins = np.r_[inicios[1:], len(cesta_ord)]
+    rotulos = np.asarray(itens, dtype=object)[item_ord].tolist()
+
+    resultado = {}
+    for particao in np.unique(mes_ord[inicios]):
+        nome = 'sem_data' if particao < 0 else f'{particao // 100:04d}-{particao % 100:02d}'
+        da_particao = mes_ord[inicios] == particao
+        contagem = Counter()
+        for inicio, fim in zip(inicios[da_particao].tolist(), fins[da_particao].tolist()):
+            cesta = rotulos[inicio:fim]
+            for tamanho in range(1, min(len(cesta), max_len) + 1):
+                contagem.update(combinations(cesta, tamanho))
+        resultado[nome] = (int(da_particao.sum()), contagem)
+
+    return resultado
+
+
+def batch_id(cestas):
+    """Identificador de um lote: hash dos basket_id distintos (independe da ordem das linhas)."""
+    ids = sorted(pd.unique(cestas['basket_id'].astype(str)))
+    return hashlib.sha1('\n'.join(ids).encode('utf-8')).hexdigest()
+
+
+def _ler_manifesto(pasta):
+    try:
+        with open(os.path.join(pasta, 'manifesto.json'), encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except FileNotFoundError:
+        return {'max_len': None, 'versao': 0, 'particoes': {}, 'lotes': []}
+    if 'versao' not in manifesto:
+        raise ValueError(f'Contagens em {pasta} estão no formato antigo (sem versões). Apague a pasta para recontar.')
+    return manifesto
+
+
+def _pasta_versao(pasta, versao):
+    return os.path.join(pasta, f'v{versao}')
+
+
+def _arquivo_particao(pasta, manifesto, particao):
+    return os.path.join(_pasta_versao(pasta, manifesto['versao']), f'contagens_{particao}.pkl')
+
+
+def _somar(arquivo_anterior, contagem):
+    """Contagens de 'arquivo_anterior' (se existir) somadas às do lote."""
+    if arquivo_anterior is None or not os.path.exists(arquivo_anterior):
+        return dict(contagem)
+    existente = pd.read_pickle(arquivo_anterior)
+    for itemset, n in contagem.items():
+        existente[itemset] = existente.get(itemset, 0) + n
+    return existente
+
+
+def _reaproveitar(origem, destino):
+    """Partição sem mudança na versão nova: link físico (sem cópia) quando possível."""
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+
+def save_itemset_counts(por_particao, pasta=PASTA_CONTAGENS, max_len=MAX_LEN_CONTAGENS, lote=None):
+    """
+    Soma as contagens já calculadas de um lote (saída de count_itemsets com o
+    mesmo max_len) às persistidas em 'pasta', em uma versão nova que só vale
+    depois da troca do manifesto. Só as partições do lote são lidas e
+    regravadas; as demais são reaproveitadas da versão anterior.
+
+    'lote' identifica o lote (batch_id); um lote já aplicado é ignorado.
+    Retorna a lista de partições atualizadas (vazia se o lote já constava).
+    """
+    max_len = _validar_max_len(max_len)
+    manifesto = _ler_manifesto(pasta)
+    if manifesto['particoes'] and manifesto['max_len'] != max_len:
+        raise ValueError(
+            f"Contagens em {pasta} foram geradas com max_len={manifesto['max_len']}, "
+            f"não {max_len}. Apague a pasta para recontar."
+        )
+    if lote is not None and lote in manifesto['lotes']:
+        return []
+
+    anterior = manifesto['versao']
+    nova = dict(manifesto, versao=anterior + 1, max_len=max_len, particoes=dict(manifesto['particoes']),
+                lotes=manifesto['lotes'] + ([lote] if lote is not None else []))
+
+    # Sobras de uma atualização interrompida (versão nunca publicada)
+    destino = _pasta_versao(pasta, nova['versao'])
+    shutil.rmtree(destino, ignore_errors=True)
+    os.makedirs(destino)
+
+    lote_total = Counter()
+    for particao, (n_cestas, contagem) in por_particao.items():
+        lote_total.update(contagem)
+        arquivo_anterior = _arquivo_particao(pasta, manifesto, particao) if anterior else None
+        pd.to_pickle(_somar(arquivo_anterior, contagem), _arquivo_particao(pasta, nova, particao))
+        nova['particoes'][particao] = nova['particoes'].get(particao, 0) + n_cestas
+
+    for particao in manifesto['particoes']:
+        if particao not in por_particao:
+            _reaproveitar(_arquivo_particao(pasta, manifesto, particao), _arquivo_particao(pasta, nova, particao))
+
+    # Soma de todas as partições mantida à parte: a leitura do total não
+    # precisa abrir um arquivo por mês
+    arquivo_anterior = _arquivo_particao(pasta, manifesto, 'total') if anterior else None
+    pd.to_pickle(_somar(arquivo_anterior, lote_total), _arquivo_particao(pasta, nova, 'total'))
+
+    # Publicação: a troca do manifesto é o único passo que muda o que é lido
+    with open(os.path.join(pasta, 'manifesto.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(nova, f)
+    os.replace(os.path.join(pasta, 'manifesto.json.tmp'), os.path.join(pasta, 'manifesto.json'))
+
+    # Mantém a versão anterior (leituras em andamento) e descarta as mais antigas
+    for nome in os.listdir(pasta):
+        if nome.startswith('v') and nome[1:].isdigit() and int(nome[1:]) < anterior:
+            shutil.rmtree(os.path.join(pasta, nome), ignore_errors=True)
+
+    return list(por_particao)
+
+
+def update_itemset_counts(novas_cestas, pasta=PASTA_CONTAGENS, max_len=MAX_LEN_CONTAGENS, lote=None):
+    """
+    Conta o lote de cestas novas (count_itemsets) e soma às partições
+    persistidas em 'pasta' (save_itemset_counts). Sem 'lote', o
+    identificador é batch_id(novas_cestas). Retorna a lista de partições
+    atualizadas (vazia se o lote já tinha sido aplicado).
+    """
+    lote = batch_id(novas_cestas) if lote is None else lote
+    if lote in _ler_manifesto(pasta)['lotes']:
+        return []
+    return save_itemset_counts(count_itemsets(novas_cestas, max_len), pasta, max_len, lote)
+
+
+def load_itemset_counts(pasta=PASTA_CONTAGENS, particoes=None):
+    """
+    Soma as contagens das partições (todas, ou só as de 'particoes') da
+    versão publicada no manifesto. Retorna (Counter{itemset: contagem}, n_cestas).
+    """
+    manifesto = _ler_manifesto(pasta)
+    if particoes is None:
+        if not manifesto['particoes']:
+            return Counter(), 0
+        total = Counter(pd.read_pickle(_arquivo_particao(pasta, manifesto, 'total')))
+        return total, sum(manifesto['particoes'].values())
+
+    total = Counter()
+    n_cestas = 0
+    for particao in particoes:
+        if particao not in manifesto['particoes']:
+            continue
+        total.update(pd.read_pickle(_arquivo_particao(pasta, manifesto, particao)))
+        n_cestas += manifesto['particoes'][particao]
+
+    return total, n_cestas
+
+
+def rules_from_counts(contagens, n_cestas, min_support=0.01, top=20, caminho_saida='regras_apriori.csv'):
+    """
+    Deriva as regras (mesmo esquema e seleção de compute_association_rules)
+    a partir de contagens exatas de itemsets.
+    """
+    if n_cestas == 0:
+        return pd.DataFrame()
+
+    min_count = _contagem_minima(min_support, n_cestas)
+    frequentes = {itemset: n for itemset, n in contagens.items() if n >= min_count}
+    return _finalizar_regras(generate_rules(frequentes, n_cestas, min_lift=1.0), top, caminho_saida)
+
+
+def compute_association_rules_incremental(novas_cestas, min_support=0.01, top=20, max_len=MAX_LEN_CONTAGENS,
+                                          pasta=PASTA_CONTAGENS, caminho_saida='regras_apriori.csv', lote=None):
+    """
+    Atualiza as contagens persistidas com o lote 'novas_cestas' e regrava o
+    regras_apriori.csv a partir das contagens somadas de todas as partições
+    (iguais às de compute_association_rules com o mesmo max_len). Na primeira
+    execução, passar o histórico completo como lote inicial.
+    """
+    update_itemset_counts(novas_cestas, pasta, max_len, lote)
+    contagens, n_cestas = load_itemset_counts(pasta)
+    return rules_from_counts(contagens, n_cestas, min_support, top, caminho_saida)
+
+
+# =============================================================================
+# REGRAS POR SAFRA (JANELAS DE MESES)
+# =============================================================================
+#
+# A procura por fungicidas/inseticidas muda ao longo do ano, então além do
+# conjunto global há um conjunto de regras por janela de meses: a safra de
+# cada 'safra_principal' ('Set-Fev', ...) e a sua entressafra ('Mar-Ago'),
+# somando todos os anos. As regras de todas as janelas vão para um único
+# CSV, com a coluna 'janela'.
+#
+# Todas as janelas saem de uma única leitura das cestas (algoritmo de
+# partição): os bitsets são montados uma vez, com as cestas agrupadas por
+# mês do calendário, cada mês é minerado só na sua fatia dos bitsets e a união dos itemsets frequentes em algum mês
+# forma os candidatos. Um itemset frequente numa janela é frequente em pelo
+# menos um dos seus meses (se ficasse abaixo do suporte em todos, ficaria na
+# soma), então contar os candidatos mês a mês e somar os meses de cada
+# janela dá exatamente os itemsets frequentes da janela.
+
+COLUNA_JANELA = 'janela'
+
+
+# Meses com contagem mínima abaixo disso não geram candidatos próprios (compute_season_rules)
+MIN_CONTAGEM_MES = 10
+# Limite da pilha de bitsets dos candidatos contados de uma vez
+MB_PILHA_SAFRA = 64
+
+
+def season_windows(safras):
+    """Janelas de safra e entressafra das 'safras', sem repetição, na ordem de entrada."""
+    janelas = []
+    for safra in safras:
+        for janela in (safra, off_season(safra)):
+            if janela is not None and janela not in janelas:
+                janelas.append(janela)
+    return janelas
+
+
+def _transacoes_por_mes(cestas):
+    """
+    Como prepare_transactions, mas com as cestas agrupadas por mês do
+    calendário: cada mês ocupa uma faixa de bytes própria dos bitsets
+    (completada com zeros), então o bitset de um mês é só uma fatia, sem
+    cópia. Cestas sem data ficam de fora.
+
+    Retorna (itens, bitsets, faixas), com faixas = {mês: (byte inicial,
+    byte final, nº de cestas)}.
+    """
+    pares = cestas[['basket_id', 'item_id']].drop_duplicates()
+    cod_cesta, cestas_ids = pd.factorize(pares['basket_id'])
+    cod_item, itens = pd.factorize(pares['item_id'], sort=True)
+
+    datas = cestas.drop_duplicates('basket_id').set_index('basket_id')['timestamp']
+    mes_cesta = pd.to_datetime(datas.reindex(cestas_ids), errors='coerce').dt.month.to_numpy()
+
+    # Posição (bit) de cada cesta: meses em sequência, cada um alinhado em byte
+    posicao = np.full(len(cestas_ids), -1, dtype=np.int64)
+    faixas, inicio = {}, 0
+    for mes in range(1, 13):
+        do_mes = np.flatnonzero(mes_cesta == mes)
+        if len(do_mes) == 0:
+            continue
+        posicao[do_mes] = inicio * 8 + np.arange(len(do_mes))
+        fim = inicio + -(-len(do_mes) // 8)
+        faixas[mes] = (inicio, fim, len(do_mes))
+        inicio = fim
+
+    bitsets = []
+    com_data = posicao[cod_cesta] >= 0
+    bit_par, item_par = posicao[cod_cesta][com_data], cod_item[com_data]
+    ordem = np.argsort(item_par, kind='stable')
+    limites = np.searchsorted(item_par[ordem], np.arange(len(itens) + 1))
+    for i in range(len(itens)):
+        presenca = np.zeros(inicio * 8, dtype=bool)
+        presenca[bit_par[ordem[limites[i]:limites[i + 1]]]] = True
+        bitsets.append(np.packbits(presenca))
+
+    return np.asarray(itens, dtype=object), bitsets, faixas
+
+
+def _candidatos_por_mes(itens, bitsets, faixas, meses, min_support, max_len):
+    """
+    Itemsets frequentes (suporte relativo ao mês) em algum dos 'meses', com
+    a contagem exata em cada mês: {itemset: {mês: contagem}}. Se um itemset
+    atinge min_support em uma janela, atinge em pelo menos um dos seus meses.
+    """
+    candidatos = set()
+    for mes in meses:
+        inicio, fim, n_mes = faixas[mes]
+        candidatos.update(mine_frequent_itemsets(itens, [bits[inicio:fim] for bits in bitsets], n_mes,
+                                                 min_support, max_len))
+    candidatos = sorted(candidatos, key=lambda itemset: (len(itemset), itemset))
+
+    # Contagem em blocos de candidatos: a pilha de bitsets fica limitada a MB_PILHA_SAFRA
+    contagens = np.zeros((len(candidatos), len(meses)), dtype=np.int64)
+    posicao = {item: k for k, item in enumerate(itens)}
+    bytes_por_candidato = max(1, len(bitsets[0])) if bitsets else 1
+    por_bloco = max(1, MB_PILHA_SAFRA * 1024 ** 2 // bytes_por_candidato)
+    for a in range(0, len(candidatos), por_bloco):
+        pilha = np.stack([
+            np.bitwise_and.reduce([bitsets[posicao[item]] for item in itemset])
+            for itemset in candidatos[a:a + por_bloco]
+        ])
+        for j, mes in enumerate(meses):
+            inicio, fim, _ = faixas[mes]
+            contagens[a:a + por_bloco, j] = _POPCOUNT[pilha[:, inicio:fim]].sum(axis=1, dtype=np.int64)
+    return candidatos, contagens
+
+
+def compute_season_rules(cestas, safras, min_support=0.01, top=20, max_len=MAX_LEN_CONTAGENS,
+                         caminho_saida='regras_sazonais.csv'):
+    """
+    Regras de cada janela de season_windows(safras), iguais às de
+    compute_association_rules sobre as cestas da janela (min_support
+    relativo às cestas da janela, 'top' regras por janela).
+
+    Os candidatos vêm da mineração de cada mês (uma vez para todas as
+    janelas), contados depois em cada mês. Um mês com poucas cestas teria
+    contagem mínima próxima de 1 e geraria candidatos demais: janelas com
+    algum mês abaixo de MIN_CONTAGEM_MES são mineradas direto, com a
+    contagem mínima da janela inteira. max_len é obrigatório (padrão
+    MAX_LEN_CONTAGENS).
+
+    Retorna as regras com a coluna 'janela' e grava o CSV (None não grava).
+    """
+    max_len = _validar_max_len(max_len)
+    itens, bitsets, faixas = _transacoes_por_mes(cestas)
+
+    janelas = season_windows(safras)
+    meses_janela = {janela: [mes for mes in safra_months(janela) if mes in faixas] for janela in janelas}
+    denso = {mes: _contagem_minima(min_support, n_mes) >= MIN_CONTAGEM_MES for mes, (_, _, n_mes) in faixas.items()}
+    por_mes = [janela for janela in janelas if all(denso[mes] for mes in meses_janela[janela])]
+
+    # 1. Janelas só com meses densos: candidatos dos meses, contados uma vez
+    meses = sorted({mes for janela in por_mes for mes in meses_janela[janela]})
+    candidatos, contagens = _candidatos_por_mes(itens, bitsets, faixas, meses, min_support, max_len) \
+        if meses else ([], None)
+
+    partes = []
+    for janela in janelas:
+        n_janela = sum(faixas[mes][2] for mes in meses_janela[janela])
+        if n_janela == 0:
+            continue
+        if janela in por_mes:
+            colunas = [meses.index(mes) for mes in meses_janela[janela]]
+            frequentes = dict(zip(candidatos, contagens[:, colunas].sum(axis=1).tolist()))
+        else:
+            # 2. Janela com mês esparso: mineração direta nas faixas dos seus meses
+            bits_janela = [np.concatenate([bits[faixas[mes][0]:faixas[mes][1]] for mes in meses_janela[janela]])
+                           for bits in bitsets]
+            frequentes = mine_frequent_itemsets(itens, bits_janela, n_janela, min_support, max_len)
+        regras = rules_from_counts(frequentes, n_janela, min_support, top, caminho_saida=None)
+        if len(regras) > 0:
+            regras.insert(0, COLUNA_JANELA, janela)
+            partes.append(regras)
+
+    regras = (pd.concat(partes, ignore_index=True) if partes
+              else pd.DataFrame(columns=[COLUNA_JANELA] + COLUNAS_REGRAS))
+    if caminho_saida is not None:
+        write_csv_atomic(regras, caminho_saida)
+        print(f"Arquivo {caminho_saida} gerado com sucesso.")
+    return regras
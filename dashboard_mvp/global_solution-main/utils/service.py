@@ -0,0 +1,444 @@
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from utils import data_loader as dl
+from utils import recommender
+from utils import similarity
+from utils.history_store import HistoryStore
+from utils.result_cache import MAX_MB_PADRAO, TTL_PADRAO, ResultCache
+
+# =============================================================================
+# MODELO COMPARTILHADO DO PAINEL
+# =============================================================================
+#
+# Carrega uma única vez os DataFrames, o histórico particionado por mês, o
+# índice de regras, o diretório de clientes e a tabela de métricas, e responde às
+# consultas por cliente. É usado tanto pelo app.py (modo local) quanto pela
+# API REST (api.py), para que cada nó mantenha uma só cópia dos dados. Com
+# RECOMENDAIAGRO_HISTORICO_PARQUET, o histórico é lido das partições mensais
+# gravadas pela ingestão em blocos (utils/streaming), e não do cestas.csv.
+#
+# Os resultados por cliente ficam em um cache LRU/TTL (utils/result_cache)
+# compartilhado pelas sessões, com chave (consulta, user_id, parâmetros, dia,
+# versão dos dados). Limites: RECOMENDAIAGRO_CACHE_MB (memória, padrão 64) e
+# RECOMENDAIAGRO_CACHE_TTL (segundos, padrão 600).
+#
+# Recarga a quente: quando regras_apriori.csv, regras_sazonais.csv ou
+# recomendacoes.csv mudam, só esse conjunto é relido e o modelo (regras,
+# índices e recomendações) é trocado de uma vez; as consultas em andamento
+# terminam com o modelo anterior. As consultas que usam o modelo
+# (recomendações e carteira) conferem antes tamanho/mtime desses três CSVs
+# (um os.stat cada) e, se mudaram, recarregam na hora: a consulta seguinte à
+# gravação já usa as regras novas (RECOMENDAIAGRO_RECARGA_NA_CONSULTA=0
+# desliga). A thread de fundo (start_watcher) confere todos os CSVs a cada
+# RECOMENDAIAGRO_RECARGA_S segundos (padrão 30; 0 desliga) e só recarrega
+# com a mesma assinatura em duas verificações seguidas; sem a conferência na
+# consulta, o atraso chega a 2x o intervalo. O atraso máximo vigente sai em
+# recargas['atraso_maximo_s'] (e no /health da API). Os arquivos devem ser
+# trocados de uma vez (rule_mining.write_csv_atomic); uma leitura em que a
+# assinatura muda no meio é descartada. Mudanças nas demais fontes exigem
+# reiniciar o processo.
+#
+# Regras por safra: com o regras_sazonais.csv, as recomendações na hora (do
+# cliente e da carteira) usam o conjunto da janela da safra_principal do
+# cliente no dia (safra ou entressafra, recommender.build_season_index); sem
+# conjunto para a safra, valem as regras globais.
+#
+# Clientes similares: o índice de vizinhos (utils/similarity) é montado na
+# primeira consulta, a partir do histórico completo e do cadastro, e não muda
+# na recarga (só depende das fontes que exigem reiniciar o processo).
+#
+# utils/api_client.RecommendationClient tem os mesmos métodos, via HTTP.
+
+MESES_PADRAO = 6
+CACHE_MB = float(os.environ.get('RECOMENDAIAGRO_CACHE_MB', MAX_MB_PADRAO))
+CACHE_TTL = float(os.environ.get('RECOMENDAIAGRO_CACHE_TTL', TTL_PADRAO))
+INTERVALO_RECARGA = float(os.environ.get('RECOMENDAIAGRO_RECARGA_S', 30))
+RECARGA_NA_CONSULTA = os.environ.get('RECOMENDAIAGRO_RECARGA_NA_CONSULTA', '1') != '0'
+# Partições mensais em Parquet da ingestão em blocos (utils/streaming); sem ela, o histórico vem do cestas.csv
+PASTA_HISTORICO = os.environ.get('RECOMENDAIAGRO_HISTORICO_PARQUET') or None
+FONTES_RECARREGAVEIS = ('rules', 'recomendacoes', 'regras_sazonais')
+
+logger = logging.getLogger('recomendaiagro.recarga')
+
+
+class RecommendationService:
+    """
+    Consultas do painel sobre os dados carregados em memória. Os objetos
+    internos são apenas lidos após o carregamento (o 'modelo' é substituído
+    por inteiro na recarga, nunca alterado), então uma instância pode ser
+    compartilhada entre sessões/threads.
+    """
+
+    def __init__(self, clientes, historico, recomendacoes, produtos, rules, rule_items,
+                 meses_metricas=MESES_PADRAO, regras_sazonais=None, recarga_na_consulta=RECARGA_NA_CONSULTA):
+        self.clientes = dl.enrich_customer_data(clientes)
+        self.produtos = produtos
+
+        # Histórico particionado por mês: as janelas de data só tocam os meses
+        # envolvidos, e as de um cliente são uma busca binária no índice por
+        # cliente do store. self.historico é a mesma tabela, reordenada por
+        # (mês, cliente, data)
+        self.store = HistoryStore.from_frame(historico)
+        self.historico = self.store.dados
+
+        # Regras (globais e por safra) + recomendações em lote, trocados juntos na recarga
+        self.modelo = {
+            **self._montar_regras(rules, rule_items),
+            **self._montar_regras_sazonais(regras_sazonais),
+            'recomendacoes': self._montar_recomendacoes(recomendacoes),
+        }
+        self.diretorio = dl.build_customer_directory(self.clientes)
+
+        # Tabela de métricas, refeita quando o dia muda (janela de 'meses')
+        self.meses_metricas = meses_metricas
+        self._tabela_metricas = None
+        self._dia_metricas = None
+        self._trava = threading.Lock()
+
+        # Índice de clientes similares, montado na primeira consulta
+        self.similaridade = None
+        self._trava_similaridade = threading.Lock()
+
+        # Resultados por cliente; 'versao' entra nas chaves e muda a cada invalidate()
+        self.versao = 1
+        self.cache = ResultCache(max_mb=CACHE_MB, ttl=CACHE_TTL)
+
+        # Recarga a quente (na consulta e/ou start_watcher)
+        self.assinatura = dl.source_signature()
+        self.recarga_na_consulta = recarga_na_consulta
+        self.recargas = {'verificacoes': 0, 'recargas': 0, 'falhas': 0, 'ultima': None,
+                         'na_consulta': recarga_na_consulta, 'atraso_maximo_s': None}
+        self._candidata = None
+        self._falhou = None
+        self._trava_recarga = threading.Lock()
+        self._parar = threading.Event()
+        self._observador = None
+        self._intervalo = None
+        self._atualizar_atraso_maximo()
+
+    @classmethod
+    def load(cls, compacto=False, meses_metricas=MESES_PADRAO, pasta_historico=PASTA_HISTORICO,
+             recarga_na_consulta=RECARGA_NA_CONSULTA):
+        """
+        Carrega as fontes com data_loader.load_real_data (e as regras por
+        safra). Com 'pasta_historico', o histórico vem das partições em
+        Parquet gravadas por streaming.ParquetHistoryWriter.
+        """
+        return cls(*dl.load_real_data(compacto=compacto, pasta_historico=pasta_historico),
+                   meses_metricas=meses_metricas, regras_sazonais=dl.load_season_rules(),
+                   recarga_na_consulta=recarga_na_consulta)
+
+    # -------------------------------------------------------------------------
+    # Clientes
+    # -------------------------------------------------------------------------
+
+    def search_customers(self, busca='', pagina=0, por_pagina=50):
+        """Página de clientes ([{'user_id', 'nome'}]) e total encontrado."""
+        ids, total = dl.search_customers(self.diretorio, busca, pagina, por_pagina)
+        nomes = self.diretorio['nomes']
+        return [{'user_id': user_id, 'nome': nomes[user_id]} for user_id in ids], total
+
+    def customer(self, user_id):
+        """Registro (dict) do cliente, ou None."""
+        return dl.get_customer(self.diretorio, user_id)
+
+    # -------------------------------------------------------------------------
+    # Consultas por cliente
+    # -------------------------------------------------------------------------
+
+    def history(self, user_id, meses=MESES_PADRAO):
+        """Histórico dos últimos 'meses', já com 'data' e 'item_desc'."""
+        return self.cache.get_or_compute(
+            ('historico', user_id, meses, date.today(), self.versao),
+            lambda: dl.attach_item_desc(self.store.customer_history(user_id, meses=meses), self.produtos)
+        )
+
+    def recommendations(self, user_id, top_n=3, historico_cliente=None):
+        """Recomendações do cliente (na hora + lote), sem descrições repetidas, por lift."""
+        self._conferir_fontes()
+        if historico_cliente is not None:
+            return self._recomendar(user_id, top_n, historico_cliente)
+        return self.cache.get_or_compute(
+            ('recomendacoes', user_id, top_n, date.today(), self.versao),
+            lambda: self._recomendar(user_id, top_n, self.store.customer_history(user_id, meses=MESES_PADRAO))
+        )
+
+    def _recomendar(self, user_id, top_n, historico_cliente):
+        modelo = self.modelo  # Uma leitura: a consulta inteira usa o mesmo modelo
+        recs_cliente = dl.prepare_recommendations(
+            modelo['recomendacoes'],
+            modelo['rules'],
+            user_id,
+            top_n=top_n,
+            indice_regras=self._indice_do_cliente(modelo, user_id),
+            historico_cliente=historico_cliente,
+            rule_items=modelo['rule_items']
+        )
+        recs_cliente = recs_cliente.drop_duplicates(subset=['item_desc'])
+        return recs_cliente.sort_values(by='lift', ascending=False)
+
+    def _indice_do_cliente(self, modelo, user_id):
+        """Índice de regras da safra do cliente hoje, ou o global."""
+        cliente = self.customer(user_id)
+        safra = cliente.get('safra_principal') if cliente is not None else None
+        indice = recommender.season_rule_index(modelo['indice_sazonal'], safra, date.today())
+        return modelo['indice_regras'] if indice is None else indice
+
+    def metrics(self, user_id):
+        """(metrics, abc, evolucao) de data_loader.lookup_metrics."""
+        tabela = self.metrics_table()
+        return self.cache.get_or_compute(
+            ('metricas', user_id, tabela['agora'].date(), self.versao),
+            lambda: dl.lookup_metrics(tabela, user_id)
+        )
+
+    def metrics_table(self):
+        """Tabela de build_metrics_table do dia corrente."""
+        hoje = date.today()
+        with self._trava:
+            if self._dia_metricas != hoje:
+                # Só os meses da janela entram no cálculo
+                agora = datetime.now()
+                janela = self.store.window(inicio=agora - timedelta(days=self.meses_metricas*30))
+                self._tabela_metricas = dl.build_metrics_table(janela, meses=self.meses_metricas, agora=agora)
+                self._dia_metricas = hoje
+            return self._tabela_metricas
+
+    # -------------------------------------------------------------------------
+    # Clientes similares
+    # -------------------------------------------------------------------------
+
+    def similar_customers(self, user_id, k=similarity.VIZINHOS_PADRAO):
+        """
+        similarity.similar_customers do cliente ('itens' já com item_desc), ou
+        None para cliente sem cadastro.
+        """
+        return self.cache.get_or_compute(
+            ('similares', user_id, k, self.versao),
+            lambda: self._similares(user_id, k)
+        )
+
+    def _similares(self, user_id, k):
+        resultado = similarity.similar_customers(self.similarity_index(), user_id, k=k)
+        if resultado is not None:
+            resultado['itens'] = dl.attach_item_desc(resultado['itens'], self.produtos)
+        return resultado
+
+    def similarity_index(self):
+        """Índice de similaridade (similarity.build_similarity_index), montado uma vez."""
+        with self._trava_similaridade:
+            if self.similaridade is None:
+                self.similaridade = similarity.build_similarity_index(self.historico, self.clientes)
+            return self.similaridade
+
+    # -------------------------------------------------------------------------
+    # Carteira (próxima melhor ação)
+    # -------------------------------------------------------------------------
+
+    def portfolio(self, filtros=None, pagina=0, por_pagina=50):
+        """Página da carteira ranqueada (data_loader.build_portfolio) e total filtrado."""
+        return dl.filter_portfolio(self.portfolio_table(), filtros, pagina, por_pagina)
+
+    def portfolio_filters(self):
+        """Valores disponíveis para os filtros da carteira."""
+        return dl.portfolio_filter_options(self.portfolio_table())
+
+    def portfolio_table(self):
+        """Carteira completa do dia, calculada uma vez para todos os clientes."""
+        self._conferir_fontes()
+        tabela = self.metrics_table()
+        return self.cache.get_or_compute(
+            ('carteira', tabela['agora'].date(), self.versao),
+            lambda: self._montar_carteira(tabela)
+        )
+
+    def _montar_carteira(self, tabela):
+        modelo = self.modelo
+        # Mesma janela das métricas e das recomendações na hora
+        janela = self.store.window(inicio=tabela['agora'] - timedelta(days=tabela['meses']*30))
+        forca = dl.best_recommendation_per_customer(
+            janela, modelo['recomendacoes'], modelo['rules'], modelo['rule_items'],
+            regras_sazonais=modelo['regras_sazonais'],
+            janela_cliente=self._janelas_dos_clientes(modelo, tabela['agora'])
+        )
+        return dl.build_portfolio(
+            self.clientes, tabela['resumo'], forca, dl.last_purchase(self.historico),
+            agora=tabela['agora'], produtos=self.produtos
+        )
+
+    def _janelas_dos_clientes(self, modelo, data):
+        """user_id -> janela de regras da safra do cliente na 'data' (a mesma de _indice_do_cliente)."""
+        cadastro = self.clientes.drop_duplicates('user_id')
+        safras = cadastro['safra_principal'].to_numpy(dtype=object)
+        # Poucas safras distintas: uma consulta por safra, não por cliente
+        janela_da_safra = {safra: recommender.season_rule_window(modelo['indice_sazonal'], safra, data)
+                           for safra in set(safras)}
+        return dict(zip(cadastro['user_id'].astype(object), (janela_da_safra[safra] for safra in safras)))
+
+    # -------------------------------------------------------------------------
+    # Invalidação
+    # -------------------------------------------------------------------------
+
+    def invalidate(self, metricas=True):
+        """
+        Descarta os resultados por cliente e, com metricas=True, a tabela de
+        métricas (que só depende do histórico).
+        """
+        with self._trava:
+            self.versao += 1
+            if metricas:
+                self._tabela_metricas = None
+                self._dia_metricas = None
+        self.cache.clear()
+
+    # -------------------------------------------------------------------------
+    # Recarga a quente
+    # -------------------------------------------------------------------------
+
+    def _montar_regras(self, rules, rule_items):
+        """Parte do modelo que vem do regras_apriori.csv."""
+        return {
+            'rules': rules,
+            'rule_items': rule_items,
+            # Índice de regras por antecedente (recomendações na hora, por cliente)
+            'indice_regras': recommender.build_rule_index(rules, self.produtos),
+        }
+
+    def _montar_regras_sazonais(self, regras_sazonais):
+        """Parte do modelo que vem do regras_sazonais.csv."""
+        grupos = () if regras_sazonais is None else regras_sazonais.groupby('janela', sort=False)
+        return {
+            # Índice por janela (recomendações na hora, por cliente)
+            'indice_sazonal': recommender.build_season_index(regras_sazonais, self.produtos,
+                                                             safras=self.clientes['safra_principal'].unique()),
+            # (rules, rule_items) por janela (carteira, todos os clientes de uma vez)
+            'regras_sazonais': {janela: dl.parse_rules(regras, self.produtos) for janela, regras in grupos},
+        }
+
+    def _montar_recomendacoes(self, recomendacoes):
+        """Merge recomendações com produtos para ter descrição."""
+        return recomendacoes.merge(
+            self.produtos[['item_id', 'item_desc', 'item_class']],
+            left_on='rec_id',
+            right_on='item_id',
+            how='left'
+        )
+
+    def _conferir_fontes(self):
+        """
+        Antes de consultar o modelo: se algum CSV recarregável mudou desde a
+        última carga, recarrega agora (reload_changed(imediato=True)). Sem
+        mudança, custa um os.stat por fonte.
+        """
+        if not self.recarga_na_consulta:
+            return
+        atual = dl.source_signature(FONTES_RECARREGAVEIS)
+        if any(atual[nome] != self.assinatura.get(nome) for nome in atual):
+            self.reload_changed(imediato=True)
+
+    def reload_changed(self, imediato=False):
+        """
+        Relê regras (globais/por safra)/recomendações se os CSVs mudaram.
+        Retorna as fontes recarregadas.
+
+        Na thread de fundo, só recarrega com a mesma assinatura em duas
+        verificações seguidas, para não ler um arquivo ainda em gravação: a
+        troca chega a atrasar 2x o intervalo. Com imediato=True (conferência
+        na consulta), recarrega já e descarta a leitura se a assinatura mudar
+        enquanto os arquivos são lidos; a próxima consulta tenta de novo.
+        """
+        with self._trava_recarga:
+            self.recargas['verificacoes'] += 1
+            atual = dl.source_signature()
+            mudaram = [nome for nome in atual if atual[nome] != self.assinatura.get(nome)]
+            if not mudaram:
+                # Também quando outra thread acabou de recarregar
+                self._candidata = None
+                return []
+            if not imediato and atual != self._candidata:
+                self._candidata = atual
+                return []
+            if atual == self._falhou:
+                # Mesmos arquivos da última falha: espera uma nova gravação
+                return []
+
+            recarregar = [nome for nome in mudaram if nome in FONTES_RECARREGAVEIS]
+            outras = [nome for nome in mudaram if nome not in FONTES_RECARREGAVEIS]
+            if outras:
+                logger.warning('Fontes alteradas sem recarga a quente (reinicie o processo): %s', ', '.join(outras))
+
+            if recarregar:
+                # O novo modelo é montado ao lado do atual, que segue atendendo
+                novo = dict(self.modelo)
+                try:
+                    if 'rules' in recarregar:
+                        novo.update(self._montar_regras(*dl.load_rules(self.produtos)))
+                    if 'regras_sazonais' in recarregar:
+                        novo.update(self._montar_regras_sazonais(dl.load_season_rules()))
+                    if 'recomendacoes' in recarregar:
+                        novo['recomendacoes'] = self._montar_recomendacoes(dl.load_recommendations())
+                except Exception:
+                    # Mantém o modelo atual; tenta de novo quando os arquivos mudarem
+                    self._falhou = atual
+                    self.recargas['falhas'] += 1
+                    logger.exception('Falha ao recarregar %s', ', '.join(recarregar))
+                    return []
+                if imediato and dl.source_signature() != atual:
+                    # Arquivo regravado durante a leitura: fica o modelo atual
+                    return []
+
+                self.modelo = novo
+                self.invalidate(metricas=False)
+                self.recargas['recargas'] += 1
+                self.recargas['ultima'] = datetime.now().isoformat(timespec='seconds')
+                logger.info('Recarregado: %s', ', '.join(recarregar))
+
+            self.assinatura = atual
+            self._candidata = None
+            return recarregar
+
+    def start_watcher(self, intervalo=INTERVALO_RECARGA):
+        """
+        Inicia a thread de fundo que chama reload_changed a cada 'intervalo'
+        segundos (atraso de até 2x o intervalo sem a conferência na consulta).
+        """
+        if intervalo <= 0 or self._observador is not None:
+            return
+        
+        def observar():
+            while not self._parar.wait(intervalo):
+                try:
+                    self.reload_changed()
+                except Exception:
+                    logger.exception('Falha na verificação das fontes')
+        
+        self._observador = threading.Thread(target=observar, name='recomendaiagro-recarga', daemon=True)
+        self._observador.start()
+        self._intervalo = intervalo
+        self._atualizar_atraso_maximo()
+
+    def stop_watcher(self):
+        """Encerra a thread de recarga."""
+        self._parar.set()
+        if self._observador is not None:
+            self._observador.join()
+            self._observador = None
+        self._parar.clear()
+        self._intervalo = None
+        self._atualizar_atraso_maximo()
+
+    def _atualizar_atraso_maximo(self):
+        """
+        recargas['atraso_maximo_s']: quanto uma gravação pode levar para chegar
+        às consultas (0 = na consulta seguinte; None = só reiniciando).
+        """
+        if self.recarga_na_consulta:
+            atraso = 0.0
+        elif self._intervalo is not None:
+            atraso = 2 * self._intervalo
+        else:
+            atraso = None
+        self.recargas['atraso_maximo_s'] = atraso
@@ -0,0 +1,200 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import instrumentation
+
+# =============================================================================
+# CLIENTES SIMILARES (ÍNDICE DE VIZINHOS EXATO)
+# =============================================================================
+#
+# Cada cliente vira um vetor com blocos normalizados (norma 1) e pesados por
+# raiz(PESOS_SIMILARIDADE[bloco]), de modo que o produto interno entre dois
+# clientes é a média ponderada das similaridades de cosseno de cada bloco
+# (entre 0 e 1):
+#
+# - 'itens': itens comprados (presença x IDF), esparso;
+# - 'categorias': participação de cada categoria no valor comprado;
+# - 'culturas', 'solo' e 'area' (faixas de área_total): cadastro do
+#   clientes_df.csv, em one-hot.
+#
+# O bloco de itens fica em formato CSR (cliente -> itens) e na lista
+# invertida item -> clientes; os demais blocos formam uma matriz densa
+# pequena (clientes x dezenas de colunas). Uma consulta percorre só as listas
+# dos itens do cliente e faz um produto matriz-vetor, então a busca é exata,
+# sem aproximação, e leva poucos milissegundos mesmo com 100 mil clientes.
+
+PESOS_SIMILARIDADE = {'itens': 0.5, 'categorias': 0.2, 'culturas': 0.15, 'solo': 0.05, 'area': 0.1}
+LIMIAR_SIMILARES = 0.5  # Similaridade mínima para contar como "cliente similar"
+FAIXAS_AREA = 5
+VIZINHOS_PADRAO = 20
+
+
+def _posicoes(coluna, ids):
+    """Posição de cada valor de 'coluna' em 'ids' (-1 se ausente), sem converter categóricas linha a linha."""
+    if isinstance(coluna.dtype, pd.CategoricalDtype):
+        por_categoria = ids.get_indexer(coluna.cat.categories.astype(object))
+        return np.where(coluna.cat.codes.to_numpy() >= 0, por_categoria[coluna.cat.codes.to_numpy()], -1)
+    return ids.get_indexer(coluna.astype(object))
+
+
+def _concatenar_faixas(inicios, fins):
+    """Concatenação de np.arange(inicio, fim) de cada faixa, sem laço em Python."""
+    tamanhos = fins - inicios
+    deslocamento = np.arange(tamanhos.sum()) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+    return np.repeat(inicios, tamanhos) + deslocamento
+
+
+def _normalizar_linhas(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    return np.divide(matriz, normas, out=np.zeros_like(matriz), where=normas > 0)
+
+
+def _one_hot(valores):
+    """One-hot de uma coluna de texto (vazios ficam com a linha zerada)."""
+    codigos, _ = pd.factorize(valores)
+    matriz = np.zeros((len(valores), codigos.max() + 1 if len(codigos) else 0), dtype=np.float32)
+    validos = codigos >= 0
+    matriz[np.flatnonzero(validos), codigos[validos]] = 1
+    return matriz
+
+
+@instrumentation.timed()
+def build_similarity_index(historico, clientes, pesos=PESOS_SIMILARIDADE, faixas_area=FAIXAS_AREA):
+    """
+    Monta o índice de similaridade dos clientes de 'clientes' (user_id,
+    culturas, tipo_solo, area_total) a partir do 'historico' (user_id,
+    item_id, categoria, valor; histórico do painel, tipado ou compacto).
+
+    O tempo de montagem e a memória ocupada ficam em 'estatisticas'.
+    """
+    inicio = time.perf_counter()
+    clientes = clientes.drop_duplicates('user_id')
+    ids = pd.Index(clientes['user_id'].astype(object))
+    n = len(ids)
+
+    usuario = _posicoes(historico['user_id'], ids)
+    conhecidos = usuario >= 0
+    usuario = usuario[conhecidos]
+    cod_item, itens = pd.factorize(historico['item_id'].astype(object).to_numpy()[conhecidos], sort=True)
+
+    # 1. Itens: presença x IDF, linhas com norma 1 (CSR e lista invertida)
+    pares = np.sort(pd.unique(usuario.astype(np.int64) * len(itens) + cod_item))
+    par_usuario, par_item = pares // len(itens), pares % len(itens)
+    clientes_item = np.bincount(par_item, minlength=len(itens))
+    idf = np.log((1 + n) / (1 + clientes_item)) + 1
+    pesos_par = idf[par_item]
+    normas = np.sqrt(np.bincount(par_usuario, weights=pesos_par ** 2, minlength=n))
+    pesos_par = (pesos_par / normas[par_usuario] * np.sqrt(pesos['itens'])).astype(np.float32)
+
+    indptr = np.r_[0, np.cumsum(np.bincount(par_usuario, minlength=n))]
+    ordem_item = np.argsort(par_item, kind='stable')
+    item_indptr = np.r_[0, np.cumsum(clientes_item)]
+
+    # 2. Blocos densos: categorias (participação no valor) e cadastro
+    categoria = pd.Series(historico['categoria'].astype(object).to_numpy()[conhecidos])
+    cod_categoria, _ = pd.factorize(categoria)
+    com_categoria = cod_categoria >= 0
+    valor = historico['valor'].to_numpy(dtype=np.float64)[conhecidos]
+    categorias = np.zeros((n, cod_categoria.max() + 1 if com_categoria.any() else 0), dtype=np.float64)
+    np.add.at(categorias, (usuario[com_categoria], cod_categoria[com_categoria]), valor[com_categoria])
+
+    # Poucas combinações de culturas se repetem: o one-hot é feito só nas distintas
+    cod_culturas, combinacoes = pd.factorize(clientes['culturas'].fillna('').astype(str))
+    culturas = pd.Series(combinacoes).str.get_dummies(sep=' / ').to_numpy(dtype=np.float32)[cod_culturas]
+    area = pd.qcut(clientes['area_total'].rank(method='first'), q=min(faixas_area, max(n, 1)), labels=False)
+    blocos = {
+        'categorias': categorias.astype(np.float32),
+        'culturas': culturas,
+        'solo': _one_hot(clientes['tipo_solo'].astype(object)),
+        'area': _one_hot(area),
+    }
+    densa = np.hstack([_normalizar_linhas(blocos[nome]) * np.float32(np.sqrt(pesos[nome])) for nome in blocos])
+
+    indice = {
+        'ids': ids,
+        'posicao': {user_id: pos for pos, user_id in enumerate(ids)},
+        'itens': np.asarray(itens, dtype=object),
+        # Cliente -> itens (CSR)
+        'indptr': indptr,
+        'indices': par_item.astype(np.int32),
+        'dados': pesos_par,
+        # Item -> clientes (lista invertida)
+        'item_indptr': item_indptr,
+        'item_clientes': par_usuario[ordem_item].astype(np.int32),
+        'item_dados': pesos_par[ordem_item],
+        'densa': np.ascontiguousarray(densa, dtype=np.float32),
+    }
+    indice['estatisticas'] = {
+        'clientes': n,
+        'itens': len(itens),
+        'pares_cliente_item': len(pares),
+        'colunas_densas': densa.shape[1],
+        'segundos_montagem': round(time.perf_counter() - inicio, 3),
+        'mb': round(index_memory(indice) / 1024 ** 2, 2),
+    }
+    return indice
+
+
+def index_memory(indice):
+    """Bytes ocupados pelos arrays do índice (sem o dict de posições)."""
+    return sum(valor.nbytes for valor in indice.values() if isinstance(valor, np.ndarray))
+
+
+@instrumentation.timed()
+def similar_customers(indice, user_id, k=VIZINHOS_PADRAO, limiar=LIMIAR_SIMILARES):
+    """
+    Clientes similares a 'user_id' (busca exata). Retorna None para cliente
+    fora do índice, ou um dict com:
+
+    - 'total': quantos clientes têm similaridade >= limiar;
+    - 'vizinhos': os k mais similares (user_id, similaridade);
+    - 'itens': itens comprados pelos 'total' similares (item_id, clientes,
+      participacao, comprado = o próprio cliente já comprou), do mais
+      comprado para o menos.
+    """
+    pos = indice['posicao'].get(user_id)
+    if pos is None:
+        return None
+
+    # Blocos densos + itens em comum (só as listas dos itens do cliente)
+    similaridade = indice['densa'] @ indice['densa'][pos]
+    proprios = indice['indices'][indice['indptr'][pos]:indice['indptr'][pos + 1]]
+    pesos_proprios = indice['dados'][indice['indptr'][pos]:indice['indptr'][pos + 1]]
+    listas = _concatenar_faixas(indice['item_indptr'][proprios], indice['item_indptr'][proprios + 1])
+    repeticoes = np.diff(indice['item_indptr'])[proprios]
+    similaridade += np.bincount(
+        indice['item_clientes'][listas],
+        weights=indice['item_dados'][listas] * np.repeat(pesos_proprios, repeticoes),
+        minlength=len(similaridade),
+    ).astype(np.float32)
+    similaridade[pos] = -np.inf
+
+    similares = np.flatnonzero(similaridade >= limiar)
+    k = min(k, len(similaridade) - 1)
+    if k > 0:
+        melhores = np.argpartition(-similaridade, k - 1)[:k]
+        melhores = melhores[np.lexsort((melhores, -similaridade[melhores]))]
+    else:
+        melhores = np.array([], dtype=np.int64)
+
+    # Itens dos similares: quantos deles compraram cada item
+    faixas = _concatenar_faixas(indice['indptr'][similares], indice['indptr'][similares + 1])
+    contagem = np.bincount(indice['indices'][faixas], minlength=len(indice['itens']))
+    comprados = np.flatnonzero(contagem)
+    comprados = comprados[np.lexsort((comprados, -contagem[comprados]))]
+
+    return {
+        'total': len(similares),
+        'vizinhos': pd.DataFrame({
+            'user_id': indice['ids'].to_numpy()[melhores],
+            'similaridade': similaridade[melhores].astype(float),
+        }),
+        'itens': pd.DataFrame({
+            'item_id': indice['itens'][comprados],
+            'clientes': contagem[comprados],
+            'participacao': contagem[comprados] / max(len(similares), 1),
+            'comprado': np.isin(comprados, proprios),
+        }),
+    }
@@ -0,0 +1,232 @@
+import os
+import shutil
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from utils import rule_mining
+from utils.history_store import month_key
+
+# =============================================================================
+# INGESTÃO EM BLOCOS (STREAMING) DO CESTAS.CSV
+# =============================================================================
+#
+# Para exportações de cestas maiores que a memória: o arquivo é lido em
+# blocos de linhas e cada bloco é entregue a "consumidores" que acumulam
+# apenas o que precisam (contagens de itemsets para o minerador, agregados
+# por cliente, gravação do histórico em Parquet). Nenhum passo materializa
+# o arquivo inteiro. O histórico gravado em Parquet fica particionado por mês
+# no formato do HistoryStore e é o que o painel carrega com
+# RECOMENDAIAGRO_HISTORICO_PARQUET (data_loader.load_real_data).
+#
+# As linhas de uma mesma cesta devem ser contíguas no arquivo (como nas
+# exportações do ERP). A última cesta de cada bloco é segurada e enviada
+# junto com o bloco seguinte, para que nenhum consumidor veja meia cesta.
+
+TIPOS_CESTAS = {'basket_id': object, 'user_id': object, 'item_id': object, 'price': 'float32'}
+
+
+def iter_basket_chunks(caminho='bases/cestas.csv', chunksize=500_000):
+    """
+    Lê o CSV de cestas em blocos tipados (timestamp em datetime64, price em
+    float32), cada bloco contendo apenas cestas completas.
+    """
+    resto = None
+    for bloco in pd.read_csv(caminho, chunksize=chunksize, dtype=TIPOS_CESTAS):
+        bloco['timestamp'] = pd.to_datetime(bloco['timestamp'], errors='coerce')
+        if resto is not None:
+            bloco = pd.concat([resto, bloco], ignore_index=True)
+
+        # Segura a última cesta (pode continuar no próximo bloco)
+        cestas = bloco['basket_id'].to_numpy()
+        diferentes = np.flatnonzero(cestas != cestas[-1])
+        corte = diferentes[-1] + 1 if len(diferentes) > 0 else 0
+        resto = bloco.iloc[corte:]
+
+        if corte > 0:
+            yield bloco.iloc[:corte]
+
+    if resto is not None and len(resto) > 0:
+        yield resto
+
+
+def stream_baskets(caminho='bases/cestas.csv', consumidores=(), chunksize=500_000):
+    """
+    Percorre o CSV de cestas em blocos, entregando cada bloco a todos os
+    consumidores (objetos com consumir(bloco) e finalizar()).
+
+    Retorna as estatísticas da leitura: linhas, cestas, segundos e
+    linhas_por_segundo.
+    """
+    inicio = time.perf_counter()
+    linhas = cestas = 0
+
+    for bloco in iter_basket_chunks(caminho, chunksize):
+        linhas += len(bloco)
+        cestas += bloco['basket_id'].nunique()
+        for consumidor in consumidores:
+            consumidor.consumir(bloco)
+
+    for consumidor in consumidores:
+        consumidor.finalizar()
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'linhas': linhas,
+        'cestas': cestas,
+        'segundos': segundos,
+        'linhas_por_segundo': linhas / segundos if segundos > 0 else 0.0,
+    }
+
+
+# =============================================================================
+# CONSUMIDORES
+# =============================================================================
+
+class ItemsetCounter:
+    """
+    Alimenta o minerador: soma as contagens de itemsets de cada bloco
+    (rule_mining.count_itemsets, até max_len itens). A memória depende do
+    número de itemsets distintos, não do número de linhas.
+
+    Com 'pasta', as contagens por partição mensal também são somadas em
+    memória e persistidas uma única vez em finalizar(), como um só lote
+    (uma versão nova na pasta). O identificador do lote é 'lote' ou, sem
+    ele, um hash dos basket_id do arquivo inteiro que não depende do
+    tamanho dos blocos: reprocessar o mesmo arquivo não soma de novo.
+    """
+
+    def __init__(self, max_len=rule_mining.MAX_LEN_CONTAGENS, pasta=None, lote=None):
+        self.max_len = max_len
+        self.pasta = pasta
+        self.lote = lote
+        self.contagens = Counter()
+        self.n_cestas = 0
+        self.particoes = {}  # particao -> [n_cestas, Counter], só com 'pasta'
+        self._hash_cestas = 0
+
+    def consumir(self, bloco):
+        # Uma contagem por bloco, usada tanto no total quanto nas partições
+        por_particao = rule_mining.count_itemsets(bloco, self.max_len)
+        for particao, (n_cestas, contagem) in por_particao.items():
+            self.contagens.update(contagem)
+            self.n_cestas += n_cestas
+            if self.pasta is not None:
+                acumulada = self.particoes.setdefault(particao, [0, Counter()])
+                acumulada[0] += n_cestas
+                acumulada[1].update(contagem)
+        if self.pasta is not None and self.lote is None:
+            # Soma (mod 2^64) dos hashes das cestas: cada cesta está inteira em um bloco só
+            hashes = pd.util.hash_pandas_object(pd.Series(bloco['basket_id'].unique()), index=False)
+            self._hash_cestas = (self._hash_cestas + int(hashes.to_numpy().sum(dtype=np.uint64))) % 2 ** 64
+
+    def finalizar(self):
+        if self.pasta is None or not self.particoes:
+            return
+        lote = self.lote if self.lote is not None else f'arquivo-{self.n_cestas}-{self._hash_cestas:016x}'
+        por_particao = {particao: tuple(valor) for particao, valor in self.particoes.items()}
+        rule_mining.save_itemset_counts(por_particao, self.pasta, self.max_len, lote=lote)
+        self.particoes = {}
+
+    def rules(self, min_support=0.01, top=20, caminho_saida='regras_apriori.csv'):
+        """Regras derivadas das contagens acumuladas (mesmo esquema do regras_apriori.csv)."""
+        return rule_mining.rules_from_counts(self.contagens, self.n_cestas, min_support, top, caminho_saida)
+
+
+class CustomerAggregator:
+    """
+    Agregados por cliente acumulados bloco a bloco: linhas, cestas, valor
+    total e datas da primeira e da última compra. O resultado fica em
+    self.agregados (um registro por user_id) após finalizar().
+    """
+
+    def __init__(self):
+        self._parciais = []
+        self.agregados = None
+
+    def consumir(self, bloco):
+        parcial = bloco.assign(valor=bloco['price'].astype('float64')).groupby('user_id').agg(
+            linhas=('item_id', 'size'),
+            cestas=('basket_id', 'nunique'),
+            valor_total=('valor', 'sum'),
+            primeira_compra=('timestamp', 'min'),
+            ultima_compra=('timestamp', 'max'),
+        )
+        self._parciais.append(parcial)
+        # Reduz de tempos em tempos para manter a memória limitada ao nº de clientes
+        if len(self._parciais) >= 16:
+            self._parciais = [self._reduzir()]
+
+    def _reduzir(self):
+        return pd.concat(self._parciais).groupby(level=0).agg({
+            'linhas': 'sum',
+            'cestas': 'sum',
+            'valor_total': 'sum',
+            'primeira_compra': 'min',
+            'ultima_compra': 'max',
+        })
+
+    def finalizar(self):
+        if self._parciais:
+            self.agregados = self._reduzir()
+        else:
+            self.agregados = pd.DataFrame(
+                columns=['linhas', 'cestas', 'valor_total', 'primeira_compra', 'ultima_compra'])
+        self.agregados['ticket_medio'] = self.agregados['valor_total'] / self.agregados['linhas']
+        self._parciais = []
+
+
+class ParquetHistoryWriter:
+    """
+    Grava o histórico do painel em Parquet, bloco a bloco, já com 'valor',
+    'categoria' e 'item_desc' vindos de 'produtos', no mesmo formato do
+    histórico de data_loader.load_real_data e no layout de partições do
+    HistoryStore (pasta/mes=AAAA-MM/parte.parquet, um row group por bloco).
+
+    A gravação é feita em 'pasta.tmp' e só substitui 'pasta' em finalizar(),
+    então o painel nunca lê uma ingestão pela metade.
+    """
+
+    def __init__(self, pasta, produtos):
+        self.pasta = pasta
+        self.produtos = produtos[['item_id', 'item_class', 'item_desc']].astype(object)
+        self._temporaria = pasta.rstrip(os.sep) + '.tmp'
+        self._writers = {}
+        self._schema = None
+
+    def consumir(self, bloco):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        historico = bloco.rename(columns={'price': 'valor'}).merge(self.produtos, on='item_id', how='left')
+        historico = historico.rename(columns={'item_class': 'categoria'})
+
+        if self._schema is None:
+            # Esquema fixo: um bloco sem descrições não pode mudar o tipo da coluna
+            self._schema = pa.schema([
+                ('basket_id', pa.string()), ('user_id', pa.string()), ('timestamp', pa.timestamp('ns')),
+                ('item_id', pa.string()), ('valor', pa.float32()), ('categoria', pa.string()),
+                ('item_desc', pa.string()),
+            ])
+            shutil.rmtree(self._temporaria, ignore_errors=True)
+
+        # Um arquivo (ParquetWriter aberto) por mês; cada bloco acrescenta um row group
+        chaves = month_key(historico['timestamp'])
+        for mes, posicoes in pd.Series(chaves).groupby(chaves).indices.items():
+            if mes not in self._writers:
+                destino = os.path.join(self._temporaria, f'mes={mes}')
+                os.makedirs(destino, exist_ok=True)
+                self._writers[mes] = pq.ParquetWriter(os.path.join(destino, 'parte.parquet'), self._schema)
+            parte = historico.iloc[posicoes][self._schema.names]
+            self._writers[mes].write_table(pa.Table.from_pandas(parte, schema=self._schema, preserve_index=False))
+
+    def finalizar(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        if self._schema is None:
+            return
+        shutil.rmtree(self.pasta, ignore_errors=True)
+        os.replace(self._temporaria, self.pasta)
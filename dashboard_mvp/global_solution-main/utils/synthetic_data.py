@@ -0,0 +1,214 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# GERADOR DE DADOS SINTÉTICOS (AGRO)
+# =============================================================================
+#
+# Gera cestas, clientes e produtos no mesmo formato das bases do projeto, em
+# qualquer escala (de milhares a milhões de cestas), para benchmarks. Usa as
+# mesmas listas do notebook (gerar_nome_empresa / gerar_dados_agronomicos),
+# mas com numpy e semente fixa: mesma semente e mesmos parâmetros geram os
+# mesmos arquivos.
+#
+# - popularidade dos itens e atividade dos clientes com cauda longa (Zipf);
+# - itens "parceiros" comprados juntos, para que existam regras de associação;
+# - datas com sazonalidade de safra (picos no plantio de verão e na safrinha);
+# - as linhas de cada cesta ficam contíguas e as cestas em ordem de data,
+#   como nas exportações do ERP.
+
+PREFIXOS_FAZENDA = ['Fazenda', 'Sítio', 'Chácara', 'Agropecuária', 'Granja', 'Cooperativa']
+NOMES_COMPOSTOS = ['Esperança', 'São João', 'Boa Vista', 'Horizonte', 'Verde', 'Ouro', 'Progresso', 'Lider']
+SUFIXOS = ['& Filhos', 'LTDA', 'EIRELI', 'Agro', 'Rural', 'Comércio']
+PRENOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+            'Larissa', 'Leonardo', 'Mariana', 'Nicolas', 'Olivia', 'Pedro', 'Rafaela', 'Samuel', 'Tatiane', 'Vitor']
+SOBRENOMES = ['Almeida', 'Barbosa', 'Cardoso', 'Costa', 'Ferreira', 'Gomes', 'Lima', 'Melo', 'Oliveira',
+              'Pereira', 'Ribeiro', 'Rocha', 'Santos', 'Silva', 'Souza']
+REGIOES = {
+    'AC': 'Norte', 'AM': 'Norte', 'AP': 'Norte', 'PA': 'Norte', 'RO': 'Norte', 'RR': 'Norte', 'TO': 'Norte',
+    'AL': 'Nordeste', 'BA': 'Nordeste', 'CE': 'Nordeste', 'MA': 'Nordeste', 'PB': 'Nordeste', 'PE': 'Nordeste',
+    'PI': 'Nordeste', 'RN': 'Nordeste', 'SE': 'Nordeste',
+    'DF': 'Centro-Oeste', 'GO': 'Centro-Oeste', 'MS': 'Centro-Oeste', 'MT': 'Centro-Oeste',
+    'ES': 'Sudeste', 'MG': 'Sudeste', 'RJ': 'Sudeste', 'SP': 'Sudeste',
+    'PR': 'Sul', 'RS': 'Sul', 'SC': 'Sul',
+}
+CIDADES_CENTRO_OESTE = ['Sorriso', 'Lucas do Rio Verde', 'Campo Grande', 'Rondonópolis', 'Goiânia']
+CULTURAS = ['Soja', 'Milho', 'Algodão', 'Cana-de-Açúcar', 'Café', 'Trigo']
+TIPOS_SOLO = ['Latossolo Vermelho', 'Argissolo', 'Latossolo Amarelo', 'Neossolo', 'Terra Roxa']
+PRAGAS = ['Lagarta', 'Ferrugem', 'Percevejos', 'Nematoides', 'Cigarrinha']
+SAFRAS = ['Out-Mar', 'Set-Fev', 'Nov-Abr', 'Abr-Ago']
+CLUSTERS = ['DIAMOND', 'PLATINUM', 'GOLD', 'SILVER']
+MULTIPLICADOR_AREA = {'DIAMOND': 1.5, 'PLATINUM': 1.3, 'GOLD': 1.2, 'SILVER': 1.0}
+CLASSES = ['Herbicida', 'Fungicida', 'Inseticida']
+PRINCIPIOS_ATIVOS = [
+    '2,4-D', 'Glifosato', 'Atrazina', 'Paraquate', 'Diquate', 'Glufosinato', 'Clorimurom', 'Imazetapir',
+    'Mesotriona', 'Tiodicarbe', 'Dimetoato', 'Clorpirifós', 'Imidacloprido', 'Tiametoxam', 'Lambda-cialotrina',
+    'Bifentrina', 'Acefato', 'Spiromesifen', 'Clorantraniliprole', 'Fipronil', 'Difenoconazol', 'Azoxistrobina',
+    'Tebuconazol', 'Mancozebe', 'Piraclostrobina', 'Epoxiconazol', 'Trifloxistrobina', 'Carbendazim',
+    'Protioconazol', 'Fluxapiroxade',
+]
+# Peso de cada mês (jan..dez): plantio de verão (set-nov) e safrinha (jan-mar)
+PESO_MES = np.array([1.3, 1.4, 1.2, 0.8, 0.6, 0.5, 0.5, 0.7, 1.3, 1.6, 1.5, 1.0])
+
+
+def _zipf(n, expoente, rng):
+    """Pesos de cauda longa (1/posição^expoente) em ordem aleatória."""
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    return rng.permutation(pesos / pesos.sum())
+
+
+def generate_products(n_produtos=150, seed=42):
+    """produtos (item_id, item_desc, item_class) e o preço unitário de cada item."""
+    rng = np.random.default_rng([seed, 1])
+    base = np.array(PRINCIPIOS_ATIVOS, dtype=object)[np.arange(n_produtos) % len(PRINCIPIOS_ATIVOS)]
+    variante = np.arange(n_produtos) // len(PRINCIPIOS_ATIVOS)
+    produtos = pd.DataFrame({
+        'item_id': [f'item_{i}' for i in range(1, n_produtos + 1)],
+        'item_desc': [d if v == 0 else f'{d} {v + 1}' for d, v in zip(base, variante)],
+        'item_class': rng.choice(CLASSES, n_produtos),
+    })
+    preco_unitario = np.round(rng.lognormal(np.log(300), 0.9, n_produtos), 2)
+    return produtos, preco_unitario
+
+
+def generate_customers(n_clientes=500, seed=42):
+    """
+    clientes (bases/clientes.csv: user_id, nome, documento, telefone, uf,
+    cluster) e a versão enriquecida do painel (clientes_df.csv).
+    """
+    rng = np.random.default_rng([seed, 2])
+    n = n_clientes
+    ufs = np.array(list(REGIOES), dtype=object)
+
+    prenome = rng.choice(PRENOMES, n)
+    sobrenome = rng.choice(SOBRENOMES, n)
+    responsavel = pd.Series(prenome, dtype=object) + ' ' + sobrenome
+    digitos = rng.integers(0, 10, size=(n, 11))
+    documento = [f'{d[0]}{d[1]}{d[2]}.{d[3]}{d[4]}{d[5]}.{d[6]}{d[7]}{d[8]}-{d[9]}{d[10]}' for d in digitos]
+    telefone = [f'({ddd}) {a}-{b:04d}' for ddd, a, b in
+                zip(rng.integers(11, 100, n), rng.integers(10000, 100000, n), rng.integers(0, 10000, n))]
+    uf = rng.choice(ufs, n)
+    cluster = rng.choice(CLUSTERS, n)
+
+    clientes = pd.DataFrame({
+        'user_id': [f'user_{i}' for i in range(1, n + 1)],
+        'nome': responsavel,
+        'documento': documento,
+        'telefone': telefone,
+        'uf': uf,
+        'cluster': cluster,
+    })
+
+    # Campos do painel (gerar_nome_empresa / gerar_dados_agronomicos do notebook)
+    empresa = (pd.Series(rng.choice(PREFIXOS_FAZENDA, n), dtype=object) + ' ' + rng.choice(NOMES_COMPOSTOS, n)
+               + ' ' + rng.choice(['do', 'da'], n) + ' ' + sobrenome)
+    com_sufixo = rng.random(n) < 0.2
+    empresa[com_sufixo] = empresa[com_sufixo] + ' ' + rng.choice(SUFIXOS, com_sufixo.sum())
+    email = (empresa.str.lower().str.replace(r'[\s&]|ltda|eireli', '', regex=True) + '@'
+             + rng.choice(['agrocorp', 'fazenda', 'ruraltec'], n) + '.com.br')
+    regiao = pd.Series(uf, dtype=object).map(REGIOES)
+    cidade = np.where(regiao == 'Centro-Oeste', rng.choice(CIDADES_CENTRO_OESTE, n),
+                      np.char.add('Cidade ', uf.astype(str)))
+    culturas = [' / '.join(rng.choice(CULTURAS, k, replace=False)) for k in rng.integers(1, 3, n)]
+    pragas = [' / '.join(rng.choice(PRAGAS, 2 if duas else 1, replace=False)) for duas in rng.random(n) < 0.7]
+    multiplicador = pd.Series(cluster).map(MULTIPLICADOR_AREA).to_numpy()
+    area_total = (np.round(rng.uniform(500, 2500, n) * multiplicador, -2)).astype(int)
+
+    clientes_painel = pd.DataFrame({
+        'user_id': clientes['user_id'],
+        'nome': empresa,
+        'responsavel': responsavel,
+        'documento': documento,
+        'telefone': telefone,
+        'email': email,
+        'cidade': cidade,
+        'uf': uf,
+        'regiao': regiao,
+        'culturas': culturas,
+        'cluster': cluster,
+        'area_total': area_total,
+        'tipo_solo': rng.choice(TIPOS_SOLO, n),
+        'praga_comum': pragas,
+        'safra_principal': rng.choice(SAFRAS, n),
+    })
+    return clientes, clientes_painel
+
+
+def _datas_cestas(n_cestas, inicio, fim, rng):
+    """Datas das cestas (ordenadas), com peso por mês de safra."""
+    dias = pd.date_range(inicio, fim, freq='D')
+    pesos = PESO_MES[dias.month - 1]
+    dia = rng.choice(len(dias), size=n_cestas, p=pesos / pesos.sum())
+    segundos = rng.integers(0, 24 * 3600, size=n_cestas)
+    datas = dias.to_numpy()[dia] + segundos.astype('timedelta64[s]')
+    return np.sort(datas).astype('datetime64[s]')
+
+
+def iter_baskets(n_cestas, n_clientes, preco_unitario, seed=42, inicio='2023-01-01', fim='2025-12-31',
+                 bloco=500_000, prob_parceiro=0.4):
+    """
+    Gera as linhas de cestas (basket_id, user_id, timestamp, item_id, price)
+    em blocos de até 'bloco' cestas, em ordem de data.
+    """
+    rng = np.random.default_rng([seed, 3])
+    n_produtos = len(preco_unitario)
+    popularidade = _zipf(n_produtos, 1.1, rng)
+    atividade = _zipf(n_clientes, 0.8, rng)
+    parceiro = rng.permutation(n_produtos)
+
+    datas = _datas_cestas(n_cestas, inicio, fim, rng)
+    cliente = rng.choice(n_clientes, size=n_cestas, p=atividade)
+    numero = rng.permutation(n_cestas) + 1
+    tamanho = 1 + np.minimum(rng.poisson(2.2, n_cestas), 11)
+
+    for k, inicio_bloco in enumerate(range(0, n_cestas, bloco)):
+        fatia = slice(inicio_bloco, min(inicio_bloco + bloco, n_cestas))
+        rng_bloco = np.random.default_rng([seed, 4, k])
+        tam = tamanho[fatia]
+        cesta = np.repeat(np.arange(fatia.start, fatia.stop), tam)
+        posicao = np.arange(len(cesta)) - np.repeat(np.cumsum(tam) - tam, tam)
+
+        item = rng_bloco.choice(n_produtos, size=len(cesta), p=popularidade)
+        # Segundo item da cesta: com 'prob_parceiro', o parceiro do primeiro
+        primeiro = np.repeat(item[np.cumsum(tam) - tam], tam)
+        troca = (posicao == 1) & (rng_bloco.random(len(cesta)) < prob_parceiro)
+        item[troca] = parceiro[primeiro[troca]]
+
+        quantidade = np.minimum(rng_bloco.geometric(0.3, len(cesta)), 50)
+        linhas = pd.DataFrame({
+            'basket_id': 'basket_' + pd.Series(numero[cesta]).astype(str),
+            'user_id': 'user_' + pd.Series(cliente[cesta] + 1).astype(str),
+            'timestamp': datas[cesta],
+            'item_id': 'item_' + pd.Series(item + 1).astype(str),
+            'price': np.round(preco_unitario[item] * quantidade, 2),
+        })
+        # Um item aparece uma vez por cesta
+        linhas = linhas[~pd.Series(cesta * n_produtos + item).duplicated().to_numpy()]
+        yield linhas
+
+
+def generate_dataset(destino, n_cestas=10_000, n_clientes=None, n_produtos=150, seed=42,
+                     inicio='2023-01-01', fim='2025-12-31', bloco=500_000):
+    """
+    Grava em 'destino' as bases no layout do app (bases/cestas.csv,
+    bases/clientes.csv, bases/produtos.csv e clientes_df.csv). Por padrão,
+    um cliente para cada 10 cestas. Retorna as contagens geradas.
+    """
+    n_clientes = n_clientes or max(1, n_cestas // 10)
+    os.makedirs(os.path.join(destino, 'bases'), exist_ok=True)
+
+    produtos, preco_unitario = generate_products(n_produtos, seed)
+    clientes, clientes_painel = generate_customers(n_clientes, seed)
+    produtos.to_csv(os.path.join(destino, 'bases', 'produtos.csv'), index=False)
+    clientes.to_csv(os.path.join(destino, 'bases', 'clientes.csv'), index=False)
+    clientes_painel.to_csv(os.path.join(destino, 'clientes_df.csv'), index=False)
+
+    caminho_cestas = os.path.join(destino, 'bases', 'cestas.csv')
+    linhas = 0
+    for k, bloco_linhas in enumerate(iter_baskets(n_cestas, n_clientes, preco_unitario, seed, inicio, fim, bloco)):
+        bloco_linhas.to_csv(caminho_cestas, mode='w' if k == 0 else 'a', header=(k == 0), index=False)
+        linhas += len(bloco_linhas)
+
+    return {'cestas': n_cestas, 'linhas': linhas, 'clientes': n_clientes, 'produtos': n_produtos}